@@ -0,0 +1,80 @@
+# 解码后端基准测试
+# 用法（在项目根目录运行）: python -m benchmarks.decoder_benchmark [--videos a.mp4 b.mp4] [--engine opencv] [--fps 10] [--max-pixels 300000]
+# 不指定视频时用ffmpeg生成1080p和4K的H.264测试视频（需要ffmpeg）
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from video_tool.decoders import DECODERS, ENV_FFMPEG
+from video_tool.engines import create_processor
+
+# 生成的测试视频：名称 -> (宽, 高)
+GENERATED_SIZES: dict = {"1080p": (1920, 1080), "4K": (3840, 2160)}
+
+def generate_video(path: str, width: int, height: int, seconds: float, fps: int):
+    """用ffmpeg的testsrc2生成带B帧的H.264测试视频"""
+    ffmpeg = os.environ.get(ENV_FFMPEG) or shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise SystemExit(f"生成测试视频需要ffmpeg，请安装ffmpeg、设置 {ENV_FFMPEG}，或用 --videos 指定视频")
+    subprocess.run([
+        ffmpeg, "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={seconds}",
+        "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(fps * 2), "-bf", "2", path
+    ], check=True)
+
+def measure(video_path: str, engine: str, decoder: str, target_fps: float, max_pixels: int) -> dict:
+    """处理整个视频，返回帧数、耗时和每秒处理的帧数"""
+    processor = create_processor(engine, decoder)
+    start = time.perf_counter()
+    frames = 0
+    size = None
+    for frame in processor.process_video_generator(video_path, target_fps, max_pixels):
+        frames += 1
+        size = frame.size
+    seconds = time.perf_counter() - start
+    return {"decoder": decoder, "frames": frames, "size": size, "seconds": seconds, "fps": frames / seconds if seconds else 0.0}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="比较各解码后端处理整个视频的速度")
+    parser.add_argument("--videos", nargs="*", default=None, help="测试视频，默认生成1080p和4K视频")
+    parser.add_argument("--engine", default="opencv", help="处理引擎")
+    parser.add_argument("--decoders", nargs="*", choices=DECODERS, default=list(DECODERS), help="参与比较的解码后端")
+    parser.add_argument("--fps", type=float, default=10.0, help="目标帧率")
+    parser.add_argument("--max-pixels", type=int, default=300000, help="每帧最大像素数")
+    parser.add_argument("--seconds", type=float, default=10.0, help="生成的测试视频时长(秒)")
+    parser.add_argument("--source-fps", type=int, default=30, help="生成的测试视频帧率")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        videos = args.videos
+        if not videos:
+            videos = []
+            for name, (width, height) in GENERATED_SIZES.items():
+                path = os.path.join(temp_dir, f"{name}.mp4")
+                print(f"生成测试视频: {name} {width}x{height}，{args.seconds:g} 秒，{args.source_fps} fps")
+                generate_video(path, width, height, args.seconds, args.source_fps)
+                videos.append(path)
+
+        print(f"引擎: {args.engine}，目标帧率: {args.fps:g}，最大像素数: {args.max_pixels}")
+        for video_path in videos:
+            print(f"\n{os.path.basename(video_path)}")
+            print(f"{'解码后端':>8} {'帧数':>6} {'输出尺寸':>10} {'耗时(s)':>8} {'帧/秒':>8} {'相对opencv':>10}")
+            baseline = None
+            for decoder in args.decoders:
+                try:
+                    result = measure(video_path, args.engine, decoder, args.fps, args.max_pixels)
+                except Exception as e:
+                    print(f"{decoder:>12} 不可用: {e}")
+                    continue
+                if decoder == "opencv":
+                    baseline = result["seconds"]
+                size = f"{result['size'][0]}x{result['size'][1]}" if result["size"] else "-"
+                relative = f"{baseline / result['seconds']:.2f}x" if baseline and result["seconds"] else "-"
+                print(f"{decoder:>12} {result['frames']:>8} {size:>14} {result['seconds']:>10.2f} {result['fps']:>9.1f} {relative:>12}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
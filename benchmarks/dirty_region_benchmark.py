@@ -0,0 +1,90 @@
+# 帧间变化检测基准测试
+# 用法（在项目根目录运行）: python -m benchmarks.dirty_region_benchmark [--width 640] [--height 468]
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from video_tool.dirty_regions import changed_tiles, squared_distance_cutoff
+from video_tool.packed_frame import PackedFrame
+
+# 画面中运动区域所占的比例
+MOTION_FRACTIONS: tuple = (0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+def make_frames(width: int, height: int, motion_fraction: float, noise: int, seed: int = 0) -> tuple[PackedFrame, PackedFrame]:
+    """生成相邻两帧：背景只有小于阈值的噪声，居中的矩形区域换成随机颜色"""
+    rng = np.random.default_rng(seed)
+    prev_pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    pixels = np.clip(prev_pixels.astype(np.int16) + rng.integers(-noise, noise + 1, prev_pixels.shape), 0, 255).astype(np.uint8)
+    if motion_fraction > 0:
+        scale = motion_fraction ** 0.5
+        region_height, region_width = max(1, round(height * scale)), max(1, round(width * scale))
+        top, left = (height - region_height) // 2, (width - region_width) // 2
+        pixels[top:top + region_height, left:left + region_width] = rng.integers(0, 256, (region_height, region_width, 3), dtype=np.uint8)
+    return PackedFrame(pixels), PackedFrame(prev_pixels)
+
+def full_frame_diff(frame: PackedFrame, prev_frame: PackedFrame, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """原来的实现：逐砖块计算整帧的欧氏距离"""
+    delta = frame.pixels.astype(np.int32) - prev_frame.pixels.astype(np.int32)
+    color_diff = np.sqrt((delta * delta).sum(axis=2, dtype=np.int64).ravel())
+    changed = np.flatnonzero(color_diff >= threshold)
+    return changed, frame.packed().ravel()[changed]
+
+def tile_diff(frame: PackedFrame, prev_frame: PackedFrame, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """现在的实现：逐通道计算整帧的平方距离，与阈值换算出的平方距离下限比较"""
+    changed = changed_tiles(frame, prev_frame, squared_distance_cutoff(threshold))
+    return changed, frame.packed_at(changed)
+
+def best_seconds(function, repeat: int) -> float:
+    """重复执行取最短耗时"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def measure(width: int, height: int, threshold: float, noise: int, repeat: int) -> list[dict]:
+    """测量每种运动比例下各实现的单帧耗时，并确认结果一致"""
+    results = []
+    for motion_fraction in MOTION_FRACTIONS:
+        frame, prev_frame = make_frames(width, height, motion_fraction, noise)
+        expected_tiles, expected_colors = full_frame_diff(frame, prev_frame, threshold)
+        tiles, colors = tile_diff(frame, prev_frame, threshold)
+        results.append({
+            "motion_fraction": motion_fraction,
+            "changed_tiles": len(tiles),
+            "full_ms": best_seconds(lambda: full_frame_diff(frame, prev_frame, threshold), repeat) * 1000,
+            "tile_ms": best_seconds(lambda: tile_diff(frame, prev_frame, threshold), repeat) * 1000,
+            "identical": np.array_equal(tiles, expected_tiles) and np.array_equal(colors, expected_colors)
+        })
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量相邻帧比较的单帧耗时与运动区域比例的关系")
+    parser.add_argument("--width", type=int, default=640, help="画面宽度(砖块数)")
+    parser.add_argument("--height", type=int, default=468, help="画面高度(砖块数)")
+    parser.add_argument("--threshold", type=float, default=10.0, help="颜色差异阈值")
+    parser.add_argument("--noise", type=int, default=3, help="背景每个通道的噪声幅度")
+    parser.add_argument("--repeat", type=int, default=20, help="重复次数，取最小值")
+    args = parser.parse_args()
+
+    results = measure(args.width, args.height, args.threshold, args.noise, args.repeat)
+    print(f"画面: {args.width}x{args.height}，阈值: {args.threshold:g}，背景噪声: ±{args.noise}")
+    print("原实现: 整帧计算欧氏距离；平方距离: 整帧逐通道计算平方距离")
+    print(f"{'运动比例':>8} {'变化砖块':>9} {'原实现(ms)':>10} {'平方距离(ms)':>10} {'加速':>6}")
+    for result in results:
+        print(
+            f"{result['motion_fraction']:>11.0%} {result['changed_tiles']:>13} "
+            f"{result['full_ms']:>13.2f} {result['tile_ms']:>14.2f} {result['full_ms'] / result['tile_ms']:>7.1f}x"
+        )
+
+    if not all(result["identical"] for result in results):
+        print("\n失败: 平方距离比较的结果与原实现不一致")
+        return 1
+    print("\n结果一致")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+# 启动耗时基准测试
+# 用法（在项目根目录运行）: python -m benchmarks.startup_benchmark [--module video_main] [--target 1.0]
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# 启动时不应被导入的重量级模块
+HEAVY_MODULES: tuple = ("torch", "cv2")
+# 导入入口模块的目标耗时(秒)，CPU机器上不含torch时应远低于该值
+STARTUP_TARGET_SECONDS: float = 1.0
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_startup(module: str, python: str = sys.executable) -> dict:
+    """在子进程中以 -X importtime 导入模块，返回耗时明细"""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print('seconds=' + repr(time.perf_counter() - start))\n"
+        f"print('heavy=' + ','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=PROJECT_ROOT
+    )
+    process_seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+
+    # importtime输出格式: "import time: self [us] | cumulative | imported package"
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.rstrip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            # 缩进层级为0的是被直接导入的顶层模块
+            "depth": (len(name) - len(name.lstrip())) // 2
+        })
+
+    values = dict(line.split("=", 1) for line in result.stdout.splitlines() if "=" in line)
+    return {
+        "module": module,
+        "import_seconds": float(values["seconds"]),
+        "process_seconds": process_seconds,
+        "heavy_modules": [name for name in values["heavy"].split(",") if name],
+        "modules": modules
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量入口模块的导入耗时")
+    parser.add_argument("--module", default="video_main", help="要导入的入口模块")
+    parser.add_argument("--target", type=float, default=STARTUP_TARGET_SECONDS, help="导入耗时目标(秒)")
+    parser.add_argument("--top", type=int, default=15, help="列出累计耗时最高的模块数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最小值")
+    args = parser.parse_args()
+
+    runs = [measure_startup(args.module) for _ in range(args.repeat)]
+    best = min(runs, key=lambda run: run["import_seconds"])
+
+    print(f"入口模块: {args.module}")
+    print(f"导入耗时: {best['import_seconds']:.3f} 秒 (目标 < {args.target:.3f} 秒)")
+    print(f"进程总耗时(含解释器启动): {best['process_seconds']:.3f} 秒")
+    print("\n入口模块及其直接依赖中累计耗时最高的:")
+    top_level = sorted((m for m in best["modules"] if m["depth"] <= 1), key=lambda m: m["cumulative_us"], reverse=True)
+    for entry in top_level[:args.top]:
+        print(f"  {entry['cumulative_us'] / 1000:9.1f} ms  {entry['module'].strip()}")
+
+    failed = False
+    if best["heavy_modules"]:
+        print(f"\n失败: 启动时导入了重量级模块 {', '.join(best['heavy_modules'])}")
+        failed = True
+    if best["import_seconds"] > args.target:
+        print(f"\n失败: 导入耗时超过目标 {args.target:.3f} 秒")
+        failed = True
+    if not failed:
+        print("\n通过")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+# 命令行入口模块
+from common.Logger import get_logger
+logger = get_logger("命令行")
+
+from typing import Optional
+import argparse
+import json
+import os
+import sys
+import threading
+
+from video_tool.engines import ENGINE_LABELS
+from common.LevelBuilder import TILE_FORMATS
+from common.Progress import ProgressTracker
+from common.Profiler import profiler
+
+# 退出码，沿用sysexits.h的约定，便于批处理调度器区分可重试与不可重试的失败
+EXIT_OK = 0
+EXIT_USAGE = 64          # 参数错误
+EXIT_DATAERR = 65        # 输入数据无法满足要求（如预算过小、视频无法解码、关卡文件格式错误）
+EXIT_NOINPUT = 66        # 输入文件不存在或不可读
+EXIT_SOFTWARE = 70       # 内部错误
+EXIT_CANTCREAT = 73      # 无法创建输出文件
+EXIT_INTERRUPTED = 130   # 被Ctrl+C中断
+
+# 命令行进度输出间隔(秒)
+PROGRESS_INTERVAL = 1.0
+
+class UsageError(Exception):
+    """命令行参数错误"""
+
+class ArgumentParser(argparse.ArgumentParser):
+    def error(self, message):
+        """参数错误时抛出异常，由main统一返回EXIT_USAGE"""
+        raise UsageError(message)
+
+def build_parser() -> ArgumentParser:
+    """构建命令行参数解析器"""
+    parser = ArgumentParser(prog="cli_main", description="PicToAdofai命令行工具（无界面）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # 所有子命令共用的输出和性能分析参数
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument("--json", action="store_true", help="以JSON格式向标准输出打印结果")
+    output_parser.add_argument("--quiet", action="store_true", help="不在标准错误输出进度")
+    output_parser.add_argument("--profile", action="store_true", help="导出分阶段耗时报告")
+    output_parser.add_argument("--profile-memory", action="store_true", help="报告中包含内存峰值")
+    output_parser.add_argument("--speedscope", action="store_true", help="额外导出speedscope采样文件")
+    output_parser.add_argument("--profile-dir", default=None, help="性能报告输出目录")
+
+    # 视频处理参数
+    video_parser = argparse.ArgumentParser(add_help=False)
+    video_parser.add_argument("--engine", choices=list(ENGINE_LABELS), default="traditional", help="处理引擎，auto在输入视频开头几帧上测速后选择最快的引擎（按本机缓存）")
+    video_parser.add_argument("--decoder", choices=["opencv", "ffmpeg", "pyav"], default="opencv", help="解码后端：ffmpeg和pyav在解码时抽帧并缩放到目标尺寸")
+    video_parser.add_argument("--fps", type=float, default=10.0, help="目标帧率")
+    video_parser.add_argument("--max-frames", type=int, default=100, help="最大帧数，0表示不限制")
+    video_parser.add_argument("--max-pixels", type=int, default=300000, help="每帧最大像素数")
+    video_parser.add_argument("--start", type=float, default=0.0, help="转换的开始时间(秒)，关卡时间轴从这里开始")
+    video_parser.add_argument("--end", type=float, default=None, help="转换的结束时间(秒)，默认直到视频结束")
+
+    # 关卡生成参数
+    level_parser = argparse.ArgumentParser(add_help=False)
+    level_parser.add_argument("--threshold", type=float, default=10.0, help="颜色差异阈值")
+    level_parser.add_argument("--max-events", type=int, default=None, help="事件数上限，按预算自动选择阈值")
+    level_parser.add_argument("--max-size-mb", type=float, default=None, help="文件大小上限(MB)，按预算自动选择阈值")
+    level_parser.add_argument("--tile-format", choices=TILE_FORMATS, default="angleData", help="砖块数据格式，pathData文件更小、加载更快")
+    level_parser.add_argument("--palette", choices=["adaptive", "fixed"], default=None, help="帧按调色板下标保存：adaptive无损，fixed量化为256色")
+    level_parser.add_argument("--palette-frames", type=int, default=10, help="fixed调色板使用的帧数")
+
+    convert_parser = subparsers.add_parser("convert", parents=[output_parser, video_parser, level_parser], help="转换视频并生成关卡")
+    convert_parser.add_argument("video", help="输入视频文件")
+    convert_parser.add_argument("-o", "--output", default=None, help="输出关卡路径，默认与视频同名")
+    convert_parser.add_argument("--encode-workers", type=int, default=1, help="保存关卡时并行序列化事件的进程数，0表示使用全部核心")
+
+    analyze_parser = subparsers.add_parser("analyze", parents=[output_parser, video_parser], help="预测不同阈值下的事件数和文件大小，不生成关卡")
+    analyze_parser.add_argument("video", help="输入视频文件")
+    analyze_parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 5.0, 10.0, 20.0, 40.0, 80.0], help="要估算的阈值列表")
+    analyze_parser.add_argument("--tile-format", choices=TILE_FORMATS, default="angleData", help="按此砖块数据格式估算文件大小")
+
+    watch_parser = subparsers.add_parser("watch", parents=[output_parser, video_parser, level_parser], help="监视目录并批量转换新视频")
+    watch_parser.add_argument("input_dir", help="监视的输入目录")
+    watch_parser.add_argument("-o", "--output-dir", required=True, help="输出目录")
+    watch_parser.add_argument("--workers", type=int, default=2, help="并发的工作进程数")
+    watch_parser.add_argument("--timeout", type=float, default=None, help="单个任务的超时时间(秒)")
+    watch_parser.add_argument("--memory-limit-mb", type=float, default=None, help="单个工作进程的内存上限(MB)")
+    watch_parser.add_argument("--poll-interval", type=float, default=2.0, help="扫描目录的间隔(秒)")
+    watch_parser.add_argument("--stats", default=None, help="统计日志路径，默认为输出目录下的stats.jsonl")
+    watch_parser.add_argument("--once", action="store_true", help="处理完目录中已有的视频后退出")
+
+    append_parser = subparsers.add_parser("append", parents=[output_parser, video_parser], help="把视频的新帧追加到已有关卡，参数须与生成关卡时相同")
+    append_parser.add_argument("video", help="输入视频文件")
+    append_parser.add_argument("level", help="由convert生成的关卡文件，原地追加")
+    append_parser.add_argument("--threshold", type=float, default=10.0, help="颜色差异阈值")
+
+    stats_parser = subparsers.add_parser("stats", parents=[output_parser], help="流式统计已有的关卡文件")
+    stats_parser.add_argument("level", help="关卡文件(.adofai)")
+
+    optimize_parser = subparsers.add_parser("optimize", parents=[output_parser], help="删除已有关卡中的冗余事件")
+    optimize_parser.add_argument("level", help="关卡文件(.adofai)")
+    optimize_parser.add_argument("-o", "--output", default=None, help="输出路径，默认在原文件名后加 _optimized")
+
+    serve_parser = subparsers.add_parser("serve", parents=[output_parser], help="启动本地HTTP转换服务")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="监听地址，默认只监听本机")
+    serve_parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    serve_parser.add_argument("--workers", type=int, default=2, help="进程池大小")
+    serve_parser.add_argument("--work-dir", default=None, help="上传文件和生成关卡的存放目录，默认使用临时目录")
+    serve_parser.add_argument("--max-upload-mb", type=float, default=1024, help="单个上传文件的大小上限(MB)")
+    return parser
+
+def start_progress_reporter(progress: ProgressTracker) -> threading.Event:
+    """在后台线程中定期把进度写到标准错误，返回用于停止的事件"""
+    stopped = threading.Event()
+
+    def report():
+        while not stopped.wait(PROGRESS_INTERVAL):
+            snapshot = progress.snapshot()
+            if snapshot["phase"]:
+                print(f"[{snapshot['percent']:5.1f}%] {progress.describe(snapshot)}", file=sys.stderr, flush=True)
+
+    threading.Thread(target=report, daemon=True).start()
+    return stopped
+
+def run_convert(args, progress: ProgressTracker) -> dict:
+    """执行convert子命令"""
+    from video_tool.converter import convert_video
+    output_path = args.output or os.path.splitext(args.video)[0] + ".adofai"
+    max_bytes = int(args.max_size_mb * 1024 * 1024) if args.max_size_mb is not None else None
+    return convert_video(
+        args.video,
+        output_path,
+        engine=args.engine,
+        target_fps=args.fps,
+        max_frames=args.max_frames or None,
+        max_pixels=args.max_pixels,
+        diff_threshold=args.threshold,
+        max_events=args.max_events,
+        max_bytes=max_bytes,
+        progress=progress,
+        tile_format=args.tile_format,
+        encode_workers=args.encode_workers,
+        palette=args.palette,
+        palette_frames=args.palette_frames,
+        decoder=args.decoder,
+        start_time=args.start,
+        end_time=args.end
+    )
+
+def run_append(args, progress: ProgressTracker) -> dict:
+    """执行append子命令"""
+    from video_tool.appender import append_video
+    return append_video(
+        args.video,
+        args.level,
+        engine=args.engine,
+        target_fps=args.fps,
+        max_frames=args.max_frames or None,
+        max_pixels=args.max_pixels,
+        diff_threshold=args.threshold,
+        progress=progress,
+        decoder=args.decoder,
+        start_time=args.start,
+        end_time=args.end
+    )
+
+def run_analyze(args, progress: ProgressTracker) -> dict:
+    """执行analyze子命令"""
+    from video_tool.converter import analyze_video_file
+    histogram = analyze_video_file(
+        args.video,
+        engine=args.engine,
+        target_fps=args.fps,
+        max_frames=args.max_frames or None,
+        max_pixels=args.max_pixels,
+        progress=progress,
+        tile_format=args.tile_format,
+        decoder=args.decoder,
+        start_time=args.start,
+        end_time=args.end
+    )
+    return {
+        "video_path": args.video,
+        "width": histogram.width,
+        "height": histogram.height,
+        "frames": histogram.frame_count,
+        "skipped_frames": histogram.skipped_frames,
+        "estimates": histogram.summary(sorted(set(args.thresholds)))
+    }
+
+def propagate_profile_settings():
+    """工作进程通过环境变量继承性能分析设置，每个任务各自导出报告"""
+    from common.Profiler import ENV_PROFILE, ENV_PROFILE_DIR, ENV_PROFILE_MEMORY, ENV_SPEEDSCOPE
+    if not profiler.enabled:
+        return
+    os.environ[ENV_PROFILE] = "1"
+    os.environ[ENV_PROFILE_DIR] = profiler.output_dir
+    if profiler.memory:
+        os.environ[ENV_PROFILE_MEMORY] = "1"
+    if profiler.sampling:
+        os.environ[ENV_SPEEDSCOPE] = "1"
+
+def run_watch(args) -> dict:
+    """执行watch子命令，直到收到停止信号（或单次模式处理完毕）"""
+    from video_tool.batch_daemon import BatchDaemon
+    propagate_profile_settings()
+    daemon = BatchDaemon(
+        args.input_dir,
+        args.output_dir,
+        workers=args.workers,
+        engine=args.engine,
+        job_timeout=args.timeout,
+        memory_limit_mb=args.memory_limit_mb,
+        poll_interval=args.poll_interval,
+        stats_path=args.stats,
+        target_fps=args.fps,
+        max_frames=args.max_frames or None,
+        max_pixels=args.max_pixels,
+        diff_threshold=args.threshold,
+        max_events=args.max_events,
+        max_bytes=int(args.max_size_mb * 1024 * 1024) if args.max_size_mb is not None else None,
+        tile_format=args.tile_format,
+        palette=args.palette,
+        palette_frames=args.palette_frames,
+        decoder=args.decoder,
+        start_time=args.start,
+        end_time=args.end
+    )
+    daemon.run(once=args.once)
+    return {
+        "input_dir": args.input_dir,
+        "output_dir": args.output_dir,
+        "stats_path": daemon.stats_path,
+        "completed": daemon.completed,
+        "failed": daemon.failed
+    }
+
+def run_stats(args) -> dict:
+    """执行stats子命令"""
+    from common.LevelStats import level_stats
+    if not os.path.isfile(args.level):
+        raise FileNotFoundError(f"关卡文件不存在: {args.level}")
+    return level_stats(args.level)
+
+def run_optimize(args) -> dict:
+    """执行optimize子命令"""
+    from common.Optimizer import optimize_level_file
+    if not os.path.isfile(args.level):
+        raise FileNotFoundError(f"关卡文件不存在: {args.level}")
+    base, extension = os.path.splitext(args.level)
+    output_path = args.output or f"{base}_optimized{extension}"
+    result = optimize_level_file(args.level, output_path)
+    result["output_path"] = output_path
+    return result
+
+def run_serve(args) -> dict:
+    """执行serve子命令，阻塞直到被中断"""
+    from common.Service import run_service
+    propagate_profile_settings()
+    run_service(args.host, args.port, args.workers, args.work_dir, args.max_upload_mb)
+    return {"host": args.host, "port": args.port}
+
+def print_result(command: str, result: dict, as_json: bool):
+    """向标准输出打印结果"""
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    if command == "convert":
+        print(f"输出文件: {result['output_path']}")
+        print(f"尺寸: {result['width']}x{result['height']}，帧数: {result['frames']}")
+        print(f"颜色差异阈值: {result['diff_threshold']:g}")
+        print(f"事件数: {result['total_events']}（Recolortrack {result['recolortrack_events']}）")
+        print(f"文件大小: {result['bytes'] / 1024 / 1024:.2f} MB，耗时: {result['seconds']:.2f} 秒")
+    elif command == "append":
+        print(f"输出文件: {result['output_path']}")
+        print(f"尺寸: {result['width']}x{result['height']}，帧数: {result['frames']}（新增 {result['new_frames']}）")
+        print(f"事件数: {result['total_events']}（新增Recolortrack {result['new_events']}）")
+        print(f"文件大小: {result['bytes'] / 1024 / 1024:.2f} MB，耗时: {result['seconds']:.2f} 秒")
+    elif command == "stats":
+        print(f"文件大小: {result['bytes'] / 1024 / 1024:.2f} MB，砖块数: {result['tiles']}")
+        print(f"事件总数: {result['total_events']}，装饰数: {result['decorations']}")
+        for event_type, count in result["events_by_type"].items():
+            print(f"  {event_type}: {count}")
+        print(f"事件所在砖块: {result['floor_range'][0]} ~ {result['floor_range'][1]}，作用砖块: {result['target_tile_range'][0]} ~ {result['target_tile_range'][1]}")
+        print(f"不同颜色数: {result['distinct_colors']}")
+        print(f"angleOffset: {result['angle_offset_range'][0]} ~ {result['angle_offset_range'][1]}（跨度 {result['angle_offset_span']}）")
+        estimated = result["estimated_load"]
+        print(f"整体加载预计: 解析约 {estimated['parse_seconds']} 秒，内存约 {estimated['memory_bytes'] / 1024 / 1024:.0f} MB")
+    elif command == "optimize":
+        print(f"输出文件: {result['output_path']}")
+        print(f"事件数: {result['events_before']} -> {result['events_after']}")
+        print(f"  删除无效Recolortrack: {result['noop_recolortrack']}，合并Recolortrack: {result['merged_recolortrack']}")
+        print(f"  删除被覆盖的ColorTrack: {result['overridden_colortrack']}，删除不改变颜色的ColorTrack: {result['noop_colortrack']}")
+        print(f"文件大小: {result['bytes_before'] / 1024 / 1024:.2f} MB -> {result['bytes_after'] / 1024 / 1024:.2f} MB")
+    elif command == "serve":
+        print("转换服务已停止")
+    elif command == "watch":
+        print(f"成功: {result['completed']}，失败: {result['failed']}，统计日志: {result['stats_path']}")
+    else:
+        print(f"尺寸: {result['width']}x{result['height']}，分析帧数: {result['frames']}")
+        for estimate in result["estimates"]:
+            print(
+                f"阈值 {estimate['threshold']:g}: "
+                f"{estimate['recolortrack_events']} 个事件, "
+                f"约 {estimate['estimated_bytes'] / 1024 / 1024:.1f} MB"
+            )
+
+def exit_code_for(error: Exception) -> int:
+    """把异常映射为退出码：只有参数校验失败(ParameterError)是参数错误，其余ValueError（如JSON格式错误）是输入数据错误"""
+    from video_tool.converter import BudgetError, ParameterError
+    from video_tool.decoders import DecodeError
+    if isinstance(error, FileNotFoundError):
+        return EXIT_NOINPUT
+    if isinstance(error, ParameterError):
+        return EXIT_USAGE
+    if isinstance(error, (BudgetError, DecodeError, ValueError)):
+        return EXIT_DATAERR
+    if isinstance(error, OSError):
+        return EXIT_CANTCREAT
+    return EXIT_SOFTWARE
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """命令行主函数，返回退出码"""
+    try:
+        args = build_parser().parse_args(argv)
+    except UsageError as e:
+        print(f"参数错误: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.profile or args.profile_memory or args.speedscope:
+        profiler.enable(sampling=args.speedscope, output_dir=args.profile_dir, memory=args.profile_memory)
+
+    progress = ProgressTracker()
+    # 批量模式和服务模式的进度在各工作进程中，不输出逐帧进度
+    stopped = None if args.quiet or args.command in ("watch", "serve", "stats", "optimize") else start_progress_reporter(progress)
+    try:
+        if args.command == "convert":
+            result = run_convert(args, progress)
+        elif args.command == "append":
+            result = run_append(args, progress)
+        elif args.command == "watch":
+            result = run_watch(args)
+        elif args.command == "serve":
+            result = run_serve(args)
+        elif args.command == "stats":
+            result = run_stats(args)
+        elif args.command == "optimize":
+            result = run_optimize(args)
+        else:
+            result = run_analyze(args, progress)
+    except KeyboardInterrupt:
+        logger.warning("已被用户中断")
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        logger.error(f"执行失败: {e}")
+        print(f"错误: {e}", file=sys.stderr)
+        return exit_code_for(e)
+    finally:
+        if stopped is not None:
+            stopped.set()
+
+    print_result(args.command, result, args.json)
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+# 列式事件存储模块
+from common.Logger import get_logger
+logger = get_logger("事件存储")
+
+from typing import Iterator
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import multiprocessing
+import os
+import numpy as np
+
+from common.LevelBuilder import encode_value, placeholder, split_template
+
+# 每块的事件数，数组按块增长，不需要整体复制
+DEFAULT_CHUNK_SIZE = 1 << 16
+# 序列化时每批处理的事件数
+TEXT_BATCH_SIZE = 1 << 14
+# 各列的取值格式：整数、浮点数（与json相同的repr）、打包为uint32的6位十六进制颜色
+COLUMN_FORMATS = {
+    "int": ("%d", np.int32),
+    "float": ("%r", np.float64),
+    "color": ('"%06x"', np.uint32)}
+# 不属于任何已定义类型、按原样保存的事件
+_OBJECT_KIND = 255
+# 事件数少于此值时并行序列化的进程启动开销大于收益，直接串行
+PARALLEL_MIN_EVENTS = 1 << 17
+# 每个工作进程最多排队的批数，限制尚未写出的文本占用的内存
+PARALLEL_QUEUE_PER_WORKER = 2
+
+class _Column:
+    def __init__(self, dtype, chunk_size: int):
+        """按块增长的定长类型数组"""
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.chunks: list[np.ndarray] = []
+        self.size = 0
+
+    def append(self, value):
+        """追加一个值"""
+        offset = self.size % self.chunk_size
+        if offset == 0:
+            self.chunks.append(np.empty(self.chunk_size, dtype=self.dtype))
+        self.chunks[-1][offset] = value
+        self.size += 1
+
+    def extend(self, values: np.ndarray):
+        """追加多个值"""
+        start = 0
+        while start < len(values):
+            offset = self.size % self.chunk_size
+            if offset == 0:
+                self.chunks.append(np.empty(self.chunk_size, dtype=self.dtype))
+            count = min(self.chunk_size - offset, len(values) - start)
+            self.chunks[-1][offset:offset + count] = values[start:start + count]
+            self.size += count
+            start += count
+
+    def slice(self, start: int, stop: int) -> np.ndarray:
+        """取出 [start, stop) 范围的值"""
+        parts = []
+        while start < stop:
+            chunk, offset = divmod(start, self.chunk_size)
+            count = min(self.chunk_size - offset, stop - start)
+            parts.append(self.chunks[chunk][offset:offset + count])
+            start += count
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        """已分配的字节数"""
+        return sum(chunk.nbytes for chunk in self.chunks)
+
+class _EventKind:
+    def __init__(self, name: str, template: dict, columns: dict, chunk_size: int):
+        """一种事件：固定字段来自模板，变化的字段各存一列"""
+        self.name = name
+        self.template = template
+        # 列名 -> (格式, 在事件中的位置列表)，位置为键和下标组成的路径
+        self.columns = columns
+        self.data = {column: _Column(COLUMN_FORMATS[fmt][1], chunk_size) for column, (fmt, _) in columns.items()}
+        self.size = 0
+        self._text_format: dict = {}
+        self._text_columns: dict = {}
+
+    def _prepare_text(self, level: int):
+        """把模板序列化一次，变化的字段替换为%格式"""
+        if level in self._text_format:
+            return
+        marked = _copy(self.template)
+        for column, (_, paths) in self.columns.items():
+            for path in paths:
+                _set_path(marked, path, placeholder(column))
+        parts = split_template(marked, level)
+        text_format = []
+        text_columns = []
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                text_format.append(part.replace('%', '%%'))
+            else:
+                text_format.append(COLUMN_FORMATS[self.columns[part][0]][0])
+                text_columns.append(part)
+        self._text_format[level] = ''.join(text_format)
+        self._text_columns[level] = text_columns
+
+    def text_args(self, start: int, stop: int, level: int) -> tuple[str, list[np.ndarray]]:
+        """返回 [start, stop) 的事件序列化所需的%格式和按格式顺序排列的列数组"""
+        self._prepare_text(level)
+        return self._text_format[level], [self.data[column].slice(start, stop) for column in self._text_columns[level]]
+
+    def render(self, start: int, stop: int, level: int) -> list[str]:
+        """把 [start, stop) 的事件序列化为文本"""
+        return _render_rows(*self.text_args(start, stop, level))
+
+    def build(self, start: int, stop: int) -> Iterator[dict]:
+        """把 [start, stop) 的事件还原为字典"""
+        values = {column: self.data[column].slice(start, stop).tolist() for column in self.columns}
+        for i in range(stop - start):
+            event = _copy(self.template)
+            for column, (fmt, paths) in self.columns.items():
+                value = values[column][i]
+                if fmt == "color":
+                    value = f"{value:06x}"
+                for path in paths:
+                    _set_path(event, path, value)
+            yield event
+
+class EventStore:
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """按事件类型分列保存事件，内存只随变化的字段增长，写入时直接生成JSON文本"""
+        self.chunk_size = chunk_size
+        self.kinds: list[_EventKind] = []
+        self._kind_codes: dict = {}
+        # 每个事件的类型编号，决定事件在关卡中的顺序
+        self.order = _Column(np.uint8, chunk_size)
+        self.objects: list[dict] = []
+
+    def define(self, name: str, template: dict, columns: dict):
+        """定义一种事件；columns为 列名 -> (格式, [字段路径, ...])，格式见COLUMN_FORMATS"""
+        if len(self.kinds) >= _OBJECT_KIND:
+            raise Exception("事件类型过多")
+        self._kind_codes[name] = len(self.kinds)
+        self.kinds.append(_EventKind(name, template, columns, self.chunk_size))
+
+    def add(self, name: str, **values):
+        """追加一个已定义类型的事件"""
+        code = self._kind_codes[name]
+        kind = self.kinds[code]
+        for column, value in values.items():
+            kind.data[column].append(value)
+        kind.size += 1
+        self.order.append(code)
+
+    def extend(self, name: str, **values):
+        """追加多个同类型的事件，标量会广播到每个事件"""
+        code = self._kind_codes[name]
+        kind = self.kinds[code]
+        count = max((np.size(value) for value in values.values() if np.ndim(value) > 0), default=1)
+        for column, value in values.items():
+            kind.data[column].extend(np.broadcast_to(np.asarray(value, dtype=kind.data[column].dtype), (count,)))
+        kind.size += count
+        self.order.extend(np.full(count, code, dtype=np.uint8))
+
+    def add_event(self, event: dict):
+        """追加任意事件，按原样保存"""
+        self.objects.append(event)
+        self.order.append(_OBJECT_KIND)
+
+    def count(self, name: str) -> int:
+        """某种事件的数量"""
+        return self.kinds[self._kind_codes[name]].size
+
+    def __len__(self) -> int:
+        return self.order.size
+
+    @property
+    def nbytes(self) -> int:
+        """列数组已分配的字节数（不含按原样保存的事件）"""
+        return self.order.nbytes + sum(column.nbytes for kind in self.kinds for column in kind.data.values())
+
+    def _iter_runs(self) -> Iterator[tuple[int, int, int]]:
+        """按顺序产出连续同类型事件的 (类型编号, 该类型中的起始位置, 结束位置)"""
+        cursors = [0] * (len(self.kinds) + 1)
+        for start in range(0, self.order.size, self.chunk_size):
+            block = self.order.slice(start, min(start + self.chunk_size, self.order.size))
+            boundaries = np.flatnonzero(np.diff(block)) + 1
+            run_starts = np.concatenate(([0], boundaries)).tolist()
+            run_stops = np.concatenate((boundaries, [len(block)])).tolist()
+            for run_start, run_stop in zip(run_starts, run_stops):
+                code = int(block[run_start])
+                index = len(self.kinds) if code == _OBJECT_KIND else code
+                first = cursors[index]
+                cursors[index] += run_stop - run_start
+                # 过长的连续事件分批产出，限制一次生成的文本量
+                for batch_start in range(first, cursors[index], TEXT_BATCH_SIZE):
+                    yield code, batch_start, min(batch_start + TEXT_BATCH_SIZE, cursors[index])
+
+    def iter_text(self, level: int = 2, workers: int = 1) -> Iterator[list[str]]:
+        """按顺序分批产出每个事件在第level层缩进的JSON文本；workers大于1时用多个进程并行序列化"""
+        if workers > 1 and len(self) >= PARALLEL_MIN_EVENTS:
+            if multiprocessing.current_process().daemon:
+                # 守护进程（如批量转换的工作进程）不能再创建子进程
+                logger.warning("当前进程不能创建子进程，改为串行序列化")
+            else:
+                yield from self._iter_text_parallel(level, workers)
+                return
+        for code, start, stop in self._iter_runs():
+            if code == _OBJECT_KIND:
+                yield [encode_value(event, level) for event in self.objects[start:stop]]
+            else:
+                yield self.kinds[code].render(start, stop, level)
+
+    def _iter_text_parallel(self, level: int, workers: int) -> Iterator[list[str]]:
+        """把每批事件的列数组交给进程池序列化，按提交顺序取回拼接好的文本片段"""
+        logger.info(f"使用 {workers} 个进程并行序列化 {len(self)} 个事件")
+        separator = ',\n' + '  ' * level
+        pending: deque = deque()
+        # 调用方可能已有线程在运行（服务、进度线程），fork会复制它们持有的锁，所以用spawn启动子进程
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            for code, start, stop in self._iter_runs():
+                if code == _OBJECT_KIND:
+                    # 按原样保存的事件很少，直接在本进程序列化
+                    pending.append([encode_value(event, level) for event in self.objects[start:stop]])
+                else:
+                    text_format, columns = self.kinds[code].text_args(start, stop, level)
+                    pending.append(executor.submit(_render_joined, text_format, columns, separator))
+                while len(pending) > workers * PARALLEL_QUEUE_PER_WORKER:
+                    yield _resolve(pending.popleft())
+            while pending:
+                yield _resolve(pending.popleft())
+
+    def __iter__(self) -> Iterator[dict]:
+        """按顺序产出事件字典（兼容按列表使用事件的代码）"""
+        for code, start, stop in self._iter_runs():
+            if code == _OBJECT_KIND:
+                yield from self.objects[start:stop]
+            else:
+                yield from self.kinds[code].build(start, stop)
+
+    def estimate_text_bytes(self, level: int = 2, samples: int = 100) -> int:
+        """按每种事件的抽样文本长度估算序列化后的总字节数（含元素之间的分隔）"""
+        total = 0
+        for kind in self.kinds:
+            if kind.size == 0:
+                continue
+            step = max(1, kind.size // samples)
+            texts = [kind.render(i, i + 1, level)[0] for i in range(0, kind.size, step)]
+            total += int(sum(len(text.encode('utf-8')) for text in texts) / len(texts) * kind.size)
+        total += sum(len(encode_value(event, level).encode('utf-8')) for event in self.objects)
+        separator = len(',\n') + 2 * level
+        return total + separator * max(len(self) - 1, 0)
+
+def resolve_workers(workers: int) -> int:
+    """序列化进程数，0表示使用全部CPU核心"""
+    if workers < 0:
+        raise ValueError("序列化进程数不能为负数")
+    return workers or os.cpu_count() or 1
+
+def _render_rows(text_format: str, columns: list[np.ndarray]) -> list[str]:
+    """按%格式把各列的每一行序列化为文本"""
+    return [text_format % row for row in zip(*(column.tolist() for column in columns))]
+
+def _render_joined(text_format: str, columns: list[np.ndarray], separator: str) -> str:
+    """在工作进程中序列化一批事件并用分隔符拼接，只传回一个字符串"""
+    return separator.join(_render_rows(text_format, columns))
+
+def _resolve(fragment) -> list[str]:
+    """取出并行序列化的结果"""
+    if isinstance(fragment, Future):
+        return [fragment.result()]
+    return fragment
+
+def _copy(value):
+    """复制模板中的字典和列表"""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+def _set_path(event: dict, path: tuple, value):
+    """按键和下标组成的路径设置字段"""
+    target = event
+    for key in path[:-1]:
+        target = target[key]
+    target[path[-1]] = value
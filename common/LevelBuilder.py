@@ -0,0 +1,353 @@
+# 关卡构建模块
+from common.Logger import get_logger
+logger = get_logger("关卡构建")
+
+from typing import Iterable, Iterator, Optional
+import json
+from json.encoder import encode_basestring
+
+from common.Profiler import stage
+from common.Progress import ProgressTracker
+
+# 写入文件时的缓冲区大小(字符数)
+WRITE_BUFFER_SIZE = 1 << 20
+# 相机缩放：5000对应300x300的画面，按较长边等比例计算
+BASE_ZOOM = 5000
+BASE_SIZE = 300
+# 逐个写入元素的顶层数组
+STREAMED_KEYS = ("actions", "decorations")
+# 顶层数组中相邻元素之间的分隔，元素位于第二层缩进
+ITEM_SEPARATOR = ',\n    '
+# 序列化普通事件时每批的个数
+TEXT_BATCH_SIZE = 4096
+# 砖块数据的两种写法：angleData为角度数组（每个砖块占一行），pathData为字符串（每个砖块一个字符）
+TILE_FORMATS = ("angleData", "pathData")
+# pathData中表示0度（向右）的字符
+STRAIGHT_PATH_CHAR = 'R'
+
+# 图片和视频工具共用的关卡设置；bpm、相机位置和缩放由LevelBuilder按画面填入
+DEFAULT_SETTINGS: dict = {
+    "version": 15,
+    "artist": "",
+    "specialArtistType": "None",
+    "artistPermission": "",
+    "song": "",
+    "author": "",
+    "separateCountdownTime": True,
+    "previewImage": "",
+    "previewIcon": "",
+    "previewIconColor": "003f52",
+    "previewSongStart": 0,
+    "previewSongDuration": 10,
+    "seizureWarning": False,
+    "levelDesc": "",
+    "levelTags": "",
+    "artistLinks": "",
+    "speedTrialAim": 0,
+    "difficulty": 1,
+    "requiredMods": [],
+    "songFilename": "",
+    "bpm": 60,
+    "volume": 100,
+    "offset": 0,
+    "pitch": 100,
+    "hitsound": "Kick",
+    "hitsoundVolume": 100,
+    "countdownTicks": 4,
+    "songURL": "",
+    "tileShape": "Long",
+    "trackColorType": "Single",
+    "trackColor": "debb7b",
+    "secondaryTrackColor": "ffffff",
+    "trackColorAnimDuration": 2,
+    "trackColorPulse": "None",
+    "trackPulseLength": 10,
+    "trackStyle": "Standard",
+    "trackTexture": "",
+    "trackTextureScale": 1,
+    "trackGlowIntensity": 100,
+    "trackAnimation": "None",
+    "beatsAhead": 3,
+    "trackDisappearAnimation": "None",
+    "beatsBehind": 4,
+    "backgroundColor": "000000",
+    "showDefaultBGIfNoImage": True,
+    "showDefaultBGTile": True,
+    "defaultBGTileColor": "101121",
+    "defaultBGShapeType": "Default",
+    "defaultBGShapeColor": "ffffff",
+    "bgImage": "",
+    "bgImageColor": "ffffff",
+    "parallax": [100, 100],
+    "bgDisplayMode": "FitToScreen",
+    "imageSmoothing": True,
+    "lockRot": False,
+    "loopBG": False,
+    "scalingRatio": 100,
+    "relativeTo": "Tile",
+    "position": [0, 0],
+    "rotation": 0,
+    "zoom": 100,
+    "pulseOnFloor": True,
+    "startCamLowVFX": False,
+    "bgVideo": "",
+    "loopVideo": False,
+    "vidOffset": 0,
+    "floorIconOutlines": False,
+    "stickToFloors": True,
+    "planetEase": "Linear",
+    "planetEaseParts": 1,
+    "planetEasePartBehavior": "Mirror",
+    "customClass": "",
+    "defaultTextColor": "ffffff",
+    "defaultTextShadowColor": "00000050",
+    "congratsText": "",
+    "perfectText": "",
+    "legacyFlash": False,
+    "legacyCamRelativeTo": False,
+    "legacySpriteTiles": False,
+    "legacyTween": False,
+    "disableV15Features": False
+}
+# 按画面计算的设置项
+DYNAMIC_SETTINGS = ("bpm", "position", "zoom")
+
+# 预先序列化的设置文本（每个进程只生成一次），按可变项切分
+_settings_template: Optional[list[str]] = None
+# 字段名的序列化结果
+_key_cache: dict = {}
+
+def encode_value(value, level: int = 0) -> str:
+    """序列化为与json.dumps(indent=2, ensure_ascii=False)嵌套在第level层时相同的文本"""
+    value_type = type(value)
+    if value_type is str:
+        return encode_basestring(value)
+    if value_type is int:
+        return int.__repr__(value)
+    if value_type is float and value - value == 0:
+        return float.__repr__(value)
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if value is None:
+        return 'null'
+    if value_type is dict and all(type(key) is str for key in value):
+        if not value:
+            return '{}'
+        separator = ',\n' + '  ' * (level + 1)
+        items = []
+        for key, item in value.items():
+            key_text = _key_cache.get(key)
+            if key_text is None:
+                key_text = _key_cache[key] = encode_basestring(key) + ': '
+            items.append(key_text + encode_value(item, level + 1))
+        return '{' + separator[1:] + separator.join(items) + '\n' + '  ' * level + '}'
+    if value_type is list or value_type is tuple:
+        if not value:
+            return '[]'
+        separator = ',\n' + '  ' * (level + 1)
+        if all(type(item) is int for item in value):
+            items = map(int.__repr__, value)
+        else:
+            items = (encode_value(item, level + 1) for item in value)
+        return '[' + separator[1:] + separator.join(items) + '\n' + '  ' * level + ']'
+    # 其他类型（NaN、整数子类、非字符串键等）交给json处理
+    return json.dumps(value, indent=2, ensure_ascii=False).replace('\n', '\n' + '  ' * level)
+
+def camera_settings(width: int, height: int) -> tuple[int, list[int]]:
+    """返回相机缩放和位置：x为横尺寸的0.5倍，y为纵尺寸的-0.5倍"""
+    reference_size = max(width, height)
+    zoom = int(BASE_ZOOM * (reference_size / BASE_SIZE))
+    return zoom, [int(width * 0.5), int(height * -0.5)]
+
+def move_track_event() -> dict:
+    """第一个砖块上的MoveTrack事件，把轨道纵向拉伸为正方形像素"""
+    return {
+        "floor": 0,
+        "eventType": "MoveTrack",
+        "startTile": [0, "Start"],
+        "endTile": [0, "End"],
+        "gapLength": 0,
+        "duration": 0,
+        "scale": [100, 179.6407],
+        "angleOffset": 0,
+        "ease": "Linear",
+        "maxVfxOnly": False,
+        "eventTag": ""
+    }
+
+def position_track_event(floor: int, width: int) -> dict:
+    """构造行尾的PositionTrack事件，把下一块砖移回行首并下移一行"""
+    return {
+        "floor": floor,
+        "eventType": "PositionTrack",
+        "positionOffset": [-width, -1],
+        "relativeTo": [0, "ThisTile"],
+        "justThisTile": False,
+        "editorOnly": False
+    }
+
+def placeholder(name: str) -> str:
+    """模板中代替某个字符串值的占位符"""
+    return f"\0{name}\0"
+
+def split_template(value, level: int) -> list[str]:
+    """序列化含占位符的值并按占位符切分，偶数位置是固定文本，奇数位置是占位符名称"""
+    text = encode_value(value, level)
+    return text.replace('"\\u0000', '\0').replace('\\u0000"', '\0').split('\0')
+
+def _get_settings_template() -> list[str]:
+    """第一次调用时序列化默认设置，之后直接复用"""
+    global _settings_template
+    if _settings_template is None:
+        placeholders = {key: placeholder(key) for key in DYNAMIC_SETTINGS}
+        _settings_template = split_template({**DEFAULT_SETTINGS, **placeholders}, 1)
+    return _settings_template
+
+def _iter_item_texts(items: Iterable, workers: int = 1) -> Iterator[list[str]]:
+    """分批产出数组元素在第二层缩进的文本；EventStore等对象可以提供iter_text直接产出文本（可并行）"""
+    if hasattr(items, 'iter_text'):
+        yield from items.iter_text(2, workers)
+        return
+    batch = []
+    for item in items:
+        batch.append(encode_value(item, 2))
+        if len(batch) >= TEXT_BATCH_SIZE:
+            yield batch
+            batch = []
+    yield batch
+
+def write_level(file_path: str, level_data: dict, progress: Optional[ProgressTracker] = None, settings_text: Optional[str] = None,
+                workers: int = 1) -> int:
+    """流式写入关卡，输出与json.dump(indent=2, ensure_ascii=False)逐字节一致，返回写入的字节数
+
+    actions和decorations可以是任意可迭代对象（如生成器），按块缓冲写入并报告写入字节数；
+    settings_text为预先序列化的设置文本；workers大于1时EventStore中的事件由多个进程并行序列化，输出不变
+    """
+    writer = _BufferedWriter(progress)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        writer.file = f
+        with stage("serialization"):
+            if not level_data:
+                writer.write('{}')
+            else:
+                prefix = '{\n  '
+                for key, value in level_data.items():
+                    writer.write(prefix + encode_value(str(key)) + ': ')
+                    prefix = ',\n  '
+                    if key == 'settings' and settings_text is not None:
+                        writer.write(settings_text)
+                    elif key in STREAMED_KEYS and not isinstance(value, (str, dict)):
+                        empty = True
+                        for texts in _iter_item_texts(value, workers):
+                            if texts:
+                                writer.write(('[\n    ' if empty else ITEM_SEPARATOR) + ITEM_SEPARATOR.join(texts))
+                                empty = False
+                        writer.write('[]' if empty else '\n  ]')
+                    else:
+                        writer.write(encode_value(value, 1))
+                writer.write('\n}')
+            writer.flush()
+    return writer.bytes_written
+
+class _BufferedWriter:
+    def __init__(self, progress: Optional[ProgressTracker]):
+        """攒够一块再写盘的文本写入器"""
+        self.file = None
+        self.progress = progress
+        self.buffer: list[str] = []
+        self.buffered = 0
+        self.bytes_written = 0
+
+    def write(self, text: str):
+        """追加文本，缓冲区满时写盘"""
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= WRITE_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """把缓冲区写入文件并清空"""
+        text = ''.join(self.buffer)
+        self.buffer.clear()
+        self.buffered = 0
+        with stage("disk_write"):
+            self.file.write(text)
+        size = len(text.encode('utf-8'))
+        self.bytes_written += size
+        if self.progress is not None:
+            self.progress.add_bytes(size)
+
+def check_tile_format(tile_format: str):
+    """检查砖块数据的写法"""
+    if tile_format not in TILE_FORMATS:
+        raise ValueError(f"不支持的砖块数据格式: {tile_format}，可选: {', '.join(TILE_FORMATS)}")
+
+class LevelBuilder:
+    def __init__(self, width: int, height: int, bpm: float = 60, tile_format: str = "angleData"):
+        """按画面尺寸构造关卡的公共部分：砖块数据、设置、MoveTrack和换行的PositionTrack"""
+        check_tile_format(tile_format)
+        self.width = width
+        self.height = height
+        self.bpm = bpm
+        self.tile_format = tile_format
+        self.zoom, self.position = camera_settings(width, height)
+        logger.info(f"相机设置: zoom={self.zoom}, position=({self.position[0]}, {self.position[1]})")
+
+    def angle_data(self) -> list[int]:
+        """每个像素对应一个角度为0的砖块"""
+        return [0] * (self.width * self.height)
+
+    def path_data(self) -> str:
+        """与angle_data等价的pathData字符串"""
+        return STRAIGHT_PATH_CHAR * (self.width * self.height)
+
+    def tile_data(self) -> tuple[str, object]:
+        """按tile_format返回砖块数据的字段名和值"""
+        if self.tile_format == "pathData":
+            return "pathData", self.path_data()
+        return "angleData", self.angle_data()
+
+    def settings(self) -> dict:
+        """完整的设置字典"""
+        settings = dict(DEFAULT_SETTINGS)
+        settings["bpm"] = self.bpm
+        settings["position"] = list(self.position)
+        settings["zoom"] = self.zoom
+        return settings
+
+    def settings_text(self) -> str:
+        """序列化后的设置，只替换预先生成文本中的可变项"""
+        values = {"bpm": self.bpm, "position": self.position, "zoom": self.zoom}
+        parts = _get_settings_template()
+        return ''.join(part if i % 2 == 0 else encode_value(values[part], 2) for i, part in enumerate(parts))
+
+    def move_track_event(self) -> dict:
+        """第一个砖块上的MoveTrack事件"""
+        return move_track_event()
+
+    def position_events(self) -> list[dict]:
+        """每行末尾（最后一行除外）换行的PositionTrack事件"""
+        return [position_track_event(1 + self.width * (y + 1), self.width) for y in range(self.height - 1)]
+
+    def build(self, actions: list[dict]) -> dict:
+        """构造完整的关卡数据结构"""
+        tile_key, tile_data = self.tile_data()
+        return {
+            tile_key: tile_data,
+            "settings": self.settings(),
+            "actions": actions,
+            "decorations": []
+        }
+
+    def write(self, file_path: str, actions: Iterable[dict], progress: Optional[ProgressTracker] = None, workers: int = 1) -> int:
+        """不构造完整的关卡字典，直接把事件流写入文件，返回写入的字节数"""
+        tile_key, tile_data = self.tile_data()
+        level_data = {
+            tile_key: tile_data,
+            "settings": None,
+            "actions": actions,
+            "decorations": []
+        }
+        return write_level(file_path, level_data, progress, self.settings_text(), workers)
@@ -0,0 +1,180 @@
+# 关卡统计模块
+from common.Logger import get_logger
+logger = get_logger("关卡统计")
+
+from typing import Optional
+from collections import Counter
+import json
+import os
+import random
+import sys
+import time
+
+from common.Parser import PATH_ANGLES, PATH_RELATIVE_ANGLES
+from common.StreamParser import StreamParser
+
+# 用于估算加载开销的事件样本数
+SAMPLE_SIZE = 2000
+# 6位十六进制颜色的位图大小（2^24位）
+COLOR_BITMAP_BYTES = (1 << 24) // 8
+
+def _deep_size(value) -> int:
+    """对象在Python中占用的内存（递归统计容器中的元素）"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(key) + _deep_size(item) for key, item in value.items())
+    elif isinstance(value, list):
+        size += sum(_deep_size(item) for item in value)
+    return size
+
+class LevelStats:
+    def __init__(self):
+        """单次流式遍历关卡时累加的统计信息"""
+        self.tile_count: Optional[int] = None
+        self.settings: dict = {}
+        self.event_counts: Counter = Counter()
+        self.decoration_count = 0
+        self.floor_min: Optional[int] = None
+        self.floor_max: Optional[int] = None
+        self.tile_min: Optional[int] = None
+        self.tile_max: Optional[int] = None
+        self.angle_offset_min: Optional[float] = None
+        self.angle_offset_max: Optional[float] = None
+        self._color_bitmap = bytearray(COLOR_BITMAP_BYTES)
+        # 不是6位（或不透明8位）十六进制的颜色
+        self._other_colors: set = set()
+        self._sample: list = []
+        self._action_count = 0
+        self._random = random.Random(0)
+
+    def add_tile_data(self, key: str, value):
+        """记录angleData或pathData的砖块数"""
+        if key == 'angleData' and isinstance(value, list):
+            self.tile_count = len(value) + 1
+        elif key == 'pathData' and isinstance(value, str):
+            self.tile_count = sum(1 for c in value if c in PATH_ANGLES or c in PATH_RELATIVE_ANGLES) + 1
+
+    def add_color(self, color):
+        """记录一个颜色"""
+        if not isinstance(color, str):
+            return
+        color = color.lower()
+        if len(color) == 8 and color.endswith('ff'):
+            color = color[:6]
+        try:
+            value = int(color, 16) if len(color) == 6 else None
+        except ValueError:
+            value = None
+        if value is None:
+            self._other_colors.add(color)
+        else:
+            self._color_bitmap[value >> 3] |= 1 << (value & 7)
+
+    def _resolve_tile(self, floor: int, reference) -> Optional[int]:
+        """把startTile/endTile换算成砖块编号"""
+        if not isinstance(reference, list) or len(reference) != 2 or not isinstance(reference[0], (int, float)):
+            return None
+        offset, anchor = reference
+        if anchor == 'Start':
+            return int(offset)
+        if anchor == 'ThisTile':
+            return floor + int(offset)
+        if anchor == 'End' and self.tile_count is not None:
+            return self.tile_count - 1 + int(offset)
+        return None
+
+    def add_action(self, action: dict):
+        """记录一个事件"""
+        self._action_count += 1
+        self.event_counts[action.get('eventType', '未知')] += 1
+
+        floor = action.get('floor')
+        if isinstance(floor, int):
+            self.floor_min = floor if self.floor_min is None else min(self.floor_min, floor)
+            self.floor_max = floor if self.floor_max is None else max(self.floor_max, floor)
+
+            # 事件实际作用的砖块范围
+            for key in ('startTile', 'endTile'):
+                tile = self._resolve_tile(floor, action.get(key))
+                if tile is not None:
+                    self.tile_min = tile if self.tile_min is None else min(self.tile_min, tile)
+                    self.tile_max = tile if self.tile_max is None else max(self.tile_max, tile)
+            if 'startTile' not in action:
+                self.tile_min = floor if self.tile_min is None else min(self.tile_min, floor)
+                self.tile_max = floor if self.tile_max is None else max(self.tile_max, floor)
+
+        angle_offset = action.get('angleOffset')
+        if isinstance(angle_offset, (int, float)):
+            self.angle_offset_min = angle_offset if self.angle_offset_min is None else min(self.angle_offset_min, angle_offset)
+            self.angle_offset_max = angle_offset if self.angle_offset_max is None else max(self.angle_offset_max, angle_offset)
+
+        if 'trackColor' in action:
+            self.add_color(action['trackColor'])
+
+        # 蓄水池抽样，用于估算整体加载开销
+        if len(self._sample) < SAMPLE_SIZE:
+            self._sample.append(action)
+        else:
+            index = self._random.randrange(self._action_count)
+            if index < SAMPLE_SIZE:
+                self._sample[index] = action
+
+    def distinct_colors(self) -> int:
+        """不同颜色的数量"""
+        return int.from_bytes(self._color_bitmap, 'little').bit_count() + len(self._other_colors)
+
+    def estimate_load_cost(self, file_bytes: int) -> dict:
+        """用样本估算用Parser整体加载时的解析耗时和内存占用"""
+        if not self._sample:
+            return {"parse_seconds": 0.0, "memory_bytes": 0}
+        sample_text = json.dumps(self._sample, indent=2, ensure_ascii=False)
+        start = time.perf_counter()
+        json.loads(sample_text)
+        seconds_per_byte = (time.perf_counter() - start) / len(sample_text.encode('utf-8'))
+
+        per_action = sum(_deep_size(action) for action in self._sample) / len(self._sample)
+        tile_bytes = 8 * (self.tile_count or 0)
+        return {
+            "parse_seconds": round(seconds_per_byte * file_bytes, 3),
+            "memory_bytes": int(per_action * self._action_count + tile_bytes)
+        }
+
+    def summary(self, file_bytes: int) -> dict:
+        """汇总统计结果"""
+        angle_span = None
+        if self.angle_offset_min is not None:
+            angle_span = self.angle_offset_max - self.angle_offset_min
+        return {
+            "bytes": file_bytes,
+            "tiles": self.tile_count,
+            "bpm": self.settings.get('bpm'),
+            "total_events": self._action_count,
+            "events_by_type": dict(self.event_counts.most_common()),
+            "decorations": self.decoration_count,
+            "floor_range": [self.floor_min, self.floor_max],
+            "target_tile_range": [self.tile_min, self.tile_max],
+            "distinct_colors": self.distinct_colors(),
+            "angle_offset_range": [self.angle_offset_min, self.angle_offset_max],
+            "angle_offset_span": angle_span,
+            "estimated_load": self.estimate_load_cost(file_bytes)
+        }
+
+def level_stats(file_path: str) -> dict:
+    """流式统计关卡文件，不把整个关卡读入内存"""
+    logger.info(f"开始统计关卡: {file_path}")
+    start = time.perf_counter()
+    stats = LevelStats()
+    for key, value in StreamParser(file_path):
+        if key == 'action':
+            stats.add_action(value)
+        elif key == 'decoration':
+            stats.decoration_count += 1
+        elif key == 'settings' and isinstance(value, dict):
+            stats.settings = value
+        else:
+            stats.add_tile_data(key, value)
+
+    result = stats.summary(os.path.getsize(file_path))
+    result["scan_seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(f"统计完成，共 {result['total_events']} 个事件，耗时 {result['scan_seconds']} 秒")
+    return result
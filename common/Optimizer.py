@@ -0,0 +1,292 @@
+# 关卡优化模块
+from common.Logger import get_logger
+logger = get_logger("关卡优化")
+
+from typing import Optional
+import json
+import os
+import time
+
+from common.LevelStats import LevelStats
+from common.StreamParser import StreamParser
+
+# 不影响外观、只决定事件位置和时间的字段
+POSITION_KEYS = frozenset(("floor", "eventType", "startTile", "endTile", "angleOffset", "eventTag"))
+# 可以触发或重复其他事件的事件类型，关卡中出现时不删除任何Recolortrack
+TRIGGER_EVENT_TYPES = frozenset(("RepeatEvents", "SetConditionalEvents"))
+
+# 正在播放渐变动画的砖块，其颜色在一段时间内不确定
+_ANIMATING = object()
+
+def _freeze(value):
+    """把列表转换为元组，使字段值可以哈希"""
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+def _appearance(event: dict) -> tuple:
+    """事件设置的外观（除位置和时间外的所有字段）"""
+    return tuple(sorted((key, _freeze(value)) for key, value in event.items() if key not in POSITION_KEYS))
+
+def _angle_offset(event: dict) -> float:
+    """事件的angleOffset，没有时视为0"""
+    value = event.get("angleOffset", 0)
+    return value if isinstance(value, (int, float)) else 0
+
+class LevelOptimizer:
+    def __init__(self, level_data: dict):
+        """删除冗余事件：与砖块当前颜色相同的Recolortrack、被覆盖或不改变颜色的ColorTrack，并合并相邻的同色范围"""
+        self.level_data = level_data
+        self.tile_count = self._count_tiles()
+        self.report: dict = {
+            "events_before": len(level_data.get("actions", [])),
+            "events_after": 0,
+            "noop_recolortrack": 0,
+            "merged_recolortrack": 0,
+            "noop_colortrack": 0,
+            "overridden_colortrack": 0
+        }
+
+    def _count_tiles(self) -> Optional[int]:
+        """关卡的砖块总数（包括第0块）"""
+        stats = LevelStats()
+        for key in ("angleData", "pathData"):
+            if key in self.level_data:
+                stats.add_tile_data(key, self.level_data[key])
+        return stats.tile_count
+
+    def _resolve_range(self, event: dict) -> Optional[tuple[int, int]]:
+        """事件作用的砖块范围，无法确定时返回None"""
+        floor = event.get("floor")
+        if not isinstance(floor, int):
+            return None
+        tiles = []
+        for key in ("startTile", "endTile"):
+            reference = event.get(key)
+            if not isinstance(reference, list) or len(reference) != 2 or not isinstance(reference[0], int):
+                return None
+            offset, anchor = reference
+            if anchor == "Start":
+                tiles.append(offset)
+            elif anchor == "ThisTile":
+                tiles.append(floor + offset)
+            elif anchor == "End" and self.tile_count is not None:
+                tiles.append(self.tile_count - 1 + offset)
+            else:
+                return None
+        start, end = min(tiles), max(tiles)
+        # 间隔着色的范围不是连续的砖块
+        if event.get("gapLength", 0) not in (0, None):
+            return None
+        return start, end
+
+    def optimize(self) -> dict:
+        """返回优化后的关卡数据"""
+        actions = self.level_data.get("actions", [])
+        # 按砖块和angleOffset排序；稳定排序保证同一时刻的事件保持原有顺序
+        ordered = sorted(actions, key=lambda event: (event.get("floor", 0) if isinstance(event.get("floor"), int) else 0, _angle_offset(event)))
+
+        ordered = self._optimize_colortracks(ordered)
+        shared_tiles = self._shared_tiles(ordered)
+        if any(event.get("eventType") in TRIGGER_EVENT_TYPES for event in ordered):
+            logger.warning("关卡中包含可触发其他事件的事件，跳过Recolortrack优化")
+        elif shared_tiles is None:
+            logger.warning("关卡中包含无法确定作用范围的Recolortrack，跳过Recolortrack优化")
+        else:
+            ordered = self._optimize_recolortracks(ordered, shared_tiles)
+
+        self.report["events_after"] = len(ordered)
+        optimized = dict(self.level_data)
+        optimized["actions"] = ordered
+        return optimized
+
+    def _optimize_colortracks(self, actions: list[dict]) -> list[dict]:
+        """处理静态的ColorTrack：同一砖块上只保留最后一个，删除与当前颜色相同的"""
+        last_index: dict = {}
+        mixed_floors = set()
+        for index, event in enumerate(actions):
+            if event.get("eventType") == "ColorTrack":
+                floor = event.get("floor")
+                if event.get("justThisTile"):
+                    mixed_floors.add(floor)
+                last_index[floor] = index
+
+        result = []
+        # 当前沿用的颜色（justThisTile为False的最后一个ColorTrack）
+        carried = None
+        for index, event in enumerate(actions):
+            if event.get("eventType") != "ColorTrack":
+                result.append(event)
+                continue
+            floor = event.get("floor")
+            if floor not in mixed_floors and last_index[floor] != index:
+                self.report["overridden_colortrack"] += 1
+                continue
+            appearance = _appearance({key: value for key, value in event.items() if key != "justThisTile"})
+            if appearance == carried:
+                self.report["noop_colortrack"] += 1
+                continue
+            if not event.get("justThisTile"):
+                carried = appearance
+            result.append(event)
+        return result
+
+    def _shared_tiles(self, actions: list[dict]) -> Optional[set]:
+        """被多个floor上（或带eventTag）的Recolortrack着色的砖块；有无法确定作用范围的Recolortrack时返回None
+
+        不同floor上的事件之间的先后关系取决于路径和速度，这些砖块的颜色无法在单个floor内模拟
+        """
+        tile_floors: dict = {}
+        shared = set()
+        for event in actions:
+            if event.get("eventType") != "RecolorTrack":
+                continue
+            tile_range = self._resolve_range(event)
+            if tile_range is None:
+                return None
+            start, end = tile_range
+            floor = event.get("floor")
+            for tile in range(start, end + 1):
+                if event.get("eventTag"):
+                    # 可能在任意时刻被触发
+                    shared.add(tile)
+                elif tile_floors.setdefault(tile, floor) != floor:
+                    shared.add(tile)
+        return shared
+
+    def _optimize_recolortracks(self, actions: list[dict], shared_tiles: set) -> list[dict]:
+        """模拟每个砖块的颜色状态，删除无效的Recolortrack，并合并同一时刻相邻砖块的同色事件
+
+        不同floor上的事件之间的先后关系取决于路径和速度，这里只在同一个floor内模拟；
+        作用于shared_tiles中任一砖块的事件原样保留，不删除也不合并
+        """
+        self._result: list[dict] = []
+        self._state: dict = {}
+        # 同一时刻（floor和angleOffset相同）的可合并事件：砖块 -> (外观, 模板事件)
+        self._slot: dict = {}
+        self._slot_key = None
+        self._slot_events = 0
+        self._slot_position = 0
+        current_floor = None
+
+        for event in actions:
+            floor = event.get("floor")
+            if floor != current_floor:
+                self._flush_slot()
+                self._state.clear()
+                current_floor = floor
+            if event.get("eventType") != "RecolorTrack":
+                self._result.append(event)
+                continue
+
+            start, end = self._resolve_range(event)
+            appearance = _appearance(event)
+            if event.get("duration", 0) != 0:
+                # 渐变期间颜色不确定，后续相同颜色的事件不能删除
+                self._flush_slot()
+                self._result.append(event)
+                for tile in range(start, end + 1):
+                    self._state[tile] = _ANIMATING
+                continue
+            if any(tile in shared_tiles for tile in range(start, end + 1)):
+                # 也被其他floor着色的砖块，颜色取决于事件的实际先后，原样保留
+                self._flush_slot()
+                self._result.append(event)
+                for tile in range(start, end + 1):
+                    self._state[tile] = appearance
+                continue
+
+            if all(self._state.get(tile) == appearance for tile in range(start, end + 1)):
+                self.report["noop_recolortrack"] += 1
+                continue
+
+            key = (floor, _angle_offset(event))
+            if key != self._slot_key:
+                self._flush_slot()
+                self._slot_key = key
+                self._slot_position = len(self._result)
+            self._slot_events += 1
+            for tile in range(start, end + 1):
+                self._state[tile] = appearance
+                # 同一时刻后面的事件覆盖前面的
+                self._slot[tile] = (appearance, event)
+        self._flush_slot()
+        return self._result
+
+    def _flush_slot(self):
+        """把当前时刻的事件按砖块合并为连续范围后写入结果"""
+        if self._slot:
+            merged = self._merge_slot(self._slot)
+            self._result[self._slot_position:self._slot_position] = merged
+            self.report["merged_recolortrack"] += self._slot_events - len(merged)
+        self._slot = {}
+        self._slot_key = None
+        self._slot_events = 0
+
+    def _merge_slot(self, slot: dict) -> list[dict]:
+        """把同一时刻每个砖块的最终外观合并为连续范围的事件"""
+        merged = []
+        run_start = run_end = None
+        run_appearance = run_event = None
+        for tile in sorted(slot):
+            appearance, event = slot[tile]
+            if run_event is not None and tile == run_end + 1 and appearance == run_appearance:
+                run_end = tile
+                continue
+            if run_event is not None:
+                merged.append(self._range_event(run_event, run_start, run_end))
+            run_start = run_end = tile
+            run_appearance, run_event = appearance, event
+        if run_event is not None:
+            merged.append(self._range_event(run_event, run_start, run_end))
+        return merged
+
+    def _range_event(self, event: dict, start: int, end: int) -> dict:
+        """以event为模板构造作用于start到end的事件"""
+        if event.get("startTile") == [start, "Start"] and event.get("endTile") == [end, "Start"]:
+            return event
+        ranged = dict(event)
+        ranged["startTile"] = [start, "Start"]
+        ranged["endTile"] = [end, "Start"]
+        return ranged
+
+def load_level(file_path: str) -> dict:
+    """用流式读取器加载关卡（容忍多余的逗号，不需要先把文件读入内存）"""
+    level_data: dict = {}
+    for key, value in StreamParser(file_path):
+        if key == "action":
+            level_data.setdefault("actions", []).append(value)
+        elif key == "decoration":
+            level_data.setdefault("decorations", []).append(value)
+        else:
+            level_data[key] = value
+    level_data.setdefault("actions", [])
+    return level_data
+
+def optimize_level_file(input_path: str, output_path: str) -> dict:
+    """优化关卡文件并返回节省的事件数和字节数"""
+    start = time.perf_counter()
+    logger.info(f"开始优化关卡: {input_path}")
+    bytes_before = os.path.getsize(input_path)
+    level_data = load_level(input_path)
+    optimizer = LevelOptimizer(level_data)
+    optimized = optimizer.optimize()
+
+    # 与生成器相同的输出格式；先写临时文件，允许输出覆盖输入
+    partial_path = output_path + ".part"
+    with open(partial_path, 'w', encoding='utf-8') as f:
+        json.dump(optimized, f, indent=2, ensure_ascii=False)
+    os.replace(partial_path, output_path)
+
+    report = dict(optimizer.report)
+    report["bytes_before"] = bytes_before
+    report["bytes_after"] = os.path.getsize(output_path)
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    logger.info(
+        f"优化完成，事件数: {report['events_before']} -> {report['events_after']}，"
+        f"删除无效Recolortrack {report['noop_recolortrack']} 个，合并 {report['merged_recolortrack']} 个，"
+        f"删除ColorTrack {report['noop_colortrack'] + report['overridden_colortrack']} 个"
+    )
+    return report
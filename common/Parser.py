@@ -1,22 +1,73 @@
 # 解析模块
-from Logger import get_logger
+from common.Logger import get_logger
 logger = get_logger("解析")
 
+from typing import Optional
 import json
 import re
 
+# pathData中表示固定角度的字符
+PATH_ANGLES: dict = {
+    'R': 0, 'L': 180, 'U': 90, 'D': -90,
+    'E': 45, 'Q': 135, 'Z': -135, 'C': -45,
+    'J': 30, 'T': 60, 'G': 120, 'H': 150,
+    'N': -150, 'F': -120, 'B': -60, 'M': -30,
+    'p': 15, 'A': -15, 'Y': -75, 'V': -105,
+    'x': -165, 'W': 165, 'q': 105, 'o': 75,
+    '!': 999}
+# pathData中表示相对上一个角度偏移的字符
+PATH_RELATIVE_ANGLES: dict = {
+    '5': 72, '6': -72, '7': 360/7, '8': -360/7}
+
+UTF8_BOM = b'\xef\xbb\xbf'
+# 游戏保存的关卡在 ] 和 } 前带有多余的逗号
+TRAILING_COMMA = re.compile(rb',\s*([}\]])')
+
+def _load_fast_backend():
+    """可选的更快的JSON解析库，没有安装时返回None"""
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
 class Parser:
+    # 可选的JSON解析库，类属性便于在测试或基准中关闭
+    fast_backend = _load_fast_backend()
+
     def __init__(self, file_path: str) -> None:
-        with open(file_path, 'r', encoding='utf-8-sig') as file:
-            self.content: str = file.read()
+        with open(file_path, 'rb') as file:
+            self.raw: bytes = file.read()
         
-        self.Data: dict = self.parse(self.content)
+        self.Data: dict = self.parse(self.raw)
         if "pathData" in self.Data:
             self.convert_pathData_to_angleData()
     
     def __call__(self) -> dict:
         return self.Data
     
+    @property
+    def content(self) -> str:
+        """文件文本（按需解码）"""
+        return self.raw.decode('utf-8-sig', errors='replace')
+    
+    def load_strict(self, raw: bytes) -> Optional[dict]:
+        """不做任何修复直接解析，格式不合法时返回None"""
+        if raw.startswith(UTF8_BOM):
+            raw = raw[len(UTF8_BOM):]
+        
+        if self.fast_backend is not None:
+            try:
+                return self.fast_backend.loads(raw)
+            except (ValueError, TypeError):
+                # orjson不支持NaN、超过64位的整数等，交给标准库再试一次
+                pass
+        
+        try:
+            return json.loads(raw)
+        except (ValueError, UnicodeDecodeError):
+            return None
+    
     def repair_json(self, text: str) -> dict:
         json_text: str = ''.join(ch for ch in text if ch.isprintable())
         if json_text.startswith('\ufeff'):
@@ -81,43 +132,41 @@ class Parser:
             logger.error(f"修复JSON失败: {e}")
             return {}
     
-    def parse(self, data: str) -> dict:
-        return self.repair_json(data)
+    def parse(self, data) -> dict:
+        """先按合法JSON直接解析，失败后才进入逐字符修复流程"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        
+        result = self.load_strict(data)
+        if isinstance(result, dict):
+            return result
+        
+        # 最常见的问题是多余的逗号，直接在字节上用正则去掉后再试一次
+        result = self.load_strict(TRAILING_COMMA.sub(rb'\1', data))
+        if isinstance(result, dict):
+            return result
+        
+        logger.warning("关卡文件不是合法的JSON，尝试修复")
+        return self.repair_json(data.decode('utf-8-sig', errors='replace'))
 
     def convert_pathData_to_angleData(self) -> None:
         """将路径数据转换为角度数据"""
+        path_data = self.Data["pathData"]
+        # 只含固定角度字符（如生成器写出的全R）时直接查表
+        if set(path_data) <= PATH_ANGLES.keys():
+            self.Data["angleData"] = list(map(PATH_ANGLES.__getitem__, path_data))
+            return
+        
         angleData: list = []
-        for c in self.Data["pathData"]:
-            if c == 'R': angleData.append(0)
-            elif c == 'L': angleData.append(180)
-            elif c == 'U': angleData.append(90)
-            elif c == 'D': angleData.append(-90)
-            elif c == 'E': angleData.append(45)
-            elif c == 'Q': angleData.append(135)
-            elif c == 'Z': angleData.append(-135)
-            elif c == 'C': angleData.append(-45)
-            elif c == 'J': angleData.append(30)
-            elif c == 'T': angleData.append(60)
-            elif c == 'G': angleData.append(120)
-            elif c == 'H': angleData.append(150)
-            elif c == 'N': angleData.append(-150)
-            elif c == 'F': angleData.append(-120)
-            elif c == 'B': angleData.append(-60)
-            elif c == 'M': angleData.append(-30)
-            elif c == 'p': angleData.append(15)
-            elif c == 'A': angleData.append(-15)
-            elif c == 'Y': angleData.append(-75)
-            elif c == 'V': angleData.append(-105)
-            elif c == 'x': angleData.append(-165)
-            elif c == 'W': angleData.append(165)
-            elif c == 'q': angleData.append(105)
-            elif c == 'o': angleData.append(75)
-            elif c == '!': angleData.append(999)
-            elif c == '5': angleData.append(angleData[-1] + 72)
-            elif c == '6': angleData.append(angleData[-1] - 72)
-            elif c == '7': angleData.append(angleData[-1] + 360/7)
-            elif c == '8': angleData.append(angleData[-1] - 360/7)
-            else:
+        for c in path_data:
+            angle = PATH_ANGLES.get(c)
+            if angle is not None:
+                angleData.append(angle)
+                continue
+            
+            delta = PATH_RELATIVE_ANGLES.get(c)
+            if delta is None:
                 logger.error(f"未知操作符: {c}")
                 raise ValueError(f"未知操作符: {c}")
+            angleData.append(angleData[-1] + delta)
         self.Data["angleData"] = angleData
@@ -0,0 +1,368 @@
+# 性能分析模块
+from common.Logger import get_logger
+logger = get_logger("性能分析")
+
+from typing import Optional
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# 环境变量：设为1时开启分阶段计时
+ENV_PROFILE: str = "PICTOADOFAI_PROFILE"
+# 环境变量：运行报告的输出目录，默认为当前目录
+ENV_PROFILE_DIR: str = "PICTOADOFAI_PROFILE_DIR"
+# 环境变量：设为1时额外开启采样分析，并导出speedscope格式的调用栈
+ENV_SPEEDSCOPE: str = "PICTOADOFAI_SPEEDSCOPE"
+# 环境变量：设为1时额外记录各阶段的内存高水位(tracemalloc与RSS)
+ENV_PROFILE_MEMORY: str = "PICTOADOFAI_PROFILE_MEMORY"
+
+# 报告中列出的最大分配位置数量
+TOP_ALLOCATION_SITES: int = 15
+# 当前分配量比上次快照增长超过该比例时重新拍摄快照
+SNAPSHOT_GROWTH: float = 1.25
+
+def _env_enabled(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+def _current_rss() -> Optional[int]:
+    """当前进程的常驻内存(字节)，没有psutil时返回None"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+def _peak_rss() -> Optional[int]:
+    """进程生命周期内的常驻内存峰值(字节)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS返回字节，Linux返回KB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class _NullStage:
+    """关闭计时时使用的空上下文，避免任何额外开销"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _TimedStage:
+    def __init__(self, profiler: "StageProfiler", name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        self.child_time = 0.0
+        self.memory_baseline = 0
+        self.memory_peak = 0
+
+    def __enter__(self):
+        self.profiler._push(self)
+        if self.profiler.memory and tracemalloc.is_tracing():
+            self.profiler._enter_memory(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        self.profiler._pop(self, elapsed)
+        return False
+
+class StageProfiler:
+    def __init__(self):
+        """分阶段计时器，记录各阶段的调用次数、总耗时和自身耗时"""
+        self.memory: bool = _env_enabled(ENV_PROFILE_MEMORY)
+        self.enabled: bool = _env_enabled(ENV_PROFILE) or self.memory
+        self.sampling: bool = _env_enabled(ENV_SPEEDSCOPE)
+        self.output_dir: str = os.environ.get(ENV_PROFILE_DIR, ".")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats: dict = {}
+        self.memory_stats: dict = {}
+        self.top_allocations: list[dict] = []
+        self._snapshot_size: int = 0
+        self._traced_peak: int = 0
+        self.run_name: str = ""
+        self.run_start: float = time.perf_counter()
+
+    def enable(self, sampling: bool = False, output_dir: Optional[str] = None, memory: bool = False):
+        """用代码开启计时（等同于设置环境变量）"""
+        self.enabled = True
+        self.sampling = self.sampling or sampling
+        self.memory = self.memory or memory
+        if output_dir is not None:
+            self.output_dir = output_dir
+
+    def disable(self):
+        """关闭计时"""
+        self.enabled = False
+        self.sampling = False
+        self.memory = False
+
+    def reset(self):
+        """清空已记录的数据"""
+        with self._lock:
+            self.stats = {}
+            self.memory_stats = {}
+            self.top_allocations = []
+            self._snapshot_size = 0
+            self._traced_peak = 0
+            self.run_start = time.perf_counter()
+
+    def stage(self, name: str):
+        """返回一个计时上下文；未开启时返回共享的空上下文"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _TimedStage(self, name)
+
+    def _push(self, timed_stage: _TimedStage):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(timed_stage)
+
+    def _pop(self, timed_stage: _TimedStage, elapsed: float):
+        stack = self._local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_time += elapsed
+        self.record(timed_stage.name, elapsed, elapsed - timed_stage.child_time)
+        if self.memory and tracemalloc.is_tracing():
+            self._exit_memory(timed_stage, stack[-1] if stack else None)
+
+    def _enter_memory(self, timed_stage: _TimedStage):
+        """记录阶段开始时的分配量，并把此前的峰值交给外层阶段"""
+        current, peak = tracemalloc.get_traced_memory()
+        self._traced_peak = max(self._traced_peak, peak)
+        stack = self._local.stack
+        if len(stack) > 1:
+            parent = stack[-2]
+            parent.memory_peak = max(parent.memory_peak, peak)
+        tracemalloc.reset_peak()
+        timed_stage.memory_baseline = current
+        timed_stage.memory_peak = current
+
+    def _exit_memory(self, timed_stage: _TimedStage, parent: Optional[_TimedStage]):
+        """计算阶段的分配高水位和RSS，并在分配量明显增长时记录分配位置"""
+        current, peak = tracemalloc.get_traced_memory()
+        timed_stage.memory_peak = max(timed_stage.memory_peak, peak)
+        self._traced_peak = max(self._traced_peak, peak)
+        if parent is not None:
+            parent.memory_peak = max(parent.memory_peak, timed_stage.memory_peak)
+        rss = _current_rss()
+
+        with self._lock:
+            entry = self.memory_stats.get(timed_stage.name)
+            if entry is None:
+                entry = self.memory_stats[timed_stage.name] = {"peak": 0, "retained": 0, "rss": 0}
+            entry["peak"] = max(entry["peak"], timed_stage.memory_peak - timed_stage.memory_baseline)
+            entry["retained"] = max(entry["retained"], current - timed_stage.memory_baseline)
+            if rss is not None:
+                entry["rss"] = max(entry["rss"], rss)
+
+        if current > self._snapshot_size * SNAPSHOT_GROWTH:
+            self._take_snapshot(current, timed_stage.name)
+
+    def _take_snapshot(self, current: int, stage_name: str):
+        """拍摄tracemalloc快照，保存存活内存最多的分配位置"""
+        statistics = tracemalloc.take_snapshot().statistics("lineno")
+        self._snapshot_size = current
+        self.top_allocations = [{
+            "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_bytes": stat.size,
+            "count": stat.count,
+            "after_stage": stage_name
+        } for stat in statistics[:TOP_ALLOCATION_SITES]]
+
+    def record(self, name: str, elapsed: float, self_time: Optional[float] = None):
+        """记录一次阶段耗时"""
+        if self_time is None:
+            self_time = elapsed
+        with self._lock:
+            entry = self.stats.get(name)
+            if entry is None:
+                entry = self.stats[name] = {"count": 0, "total": 0.0, "self": 0.0, "min": elapsed, "max": elapsed}
+            entry["count"] += 1
+            entry["total"] += elapsed
+            entry["self"] += self_time
+            entry["min"] = min(entry["min"], elapsed)
+            entry["max"] = max(entry["max"], elapsed)
+
+    def summary(self) -> dict:
+        """生成运行汇总，各阶段按自身耗时从高到低排列"""
+        with self._lock:
+            wall_time = time.perf_counter() - self.run_start
+            stages = []
+            for name, entry in sorted(self.stats.items(), key=lambda item: item[1]["self"], reverse=True):
+                stage_summary = {
+                    "stage": name,
+                    "count": entry["count"],
+                    "total_seconds": round(entry["total"], 6),
+                    "self_seconds": round(entry["self"], 6),
+                    "mean_seconds": round(entry["total"] / entry["count"], 6),
+                    "min_seconds": round(entry["min"], 6),
+                    "max_seconds": round(entry["max"], 6),
+                    "self_percent": round(entry["self"] / wall_time * 100, 2) if wall_time > 0 else 0.0
+                }
+                memory_entry = self.memory_stats.get(name)
+                if memory_entry is not None:
+                    # 阶段内相对于进入时的分配峰值、退出时仍存活的分配量、退出时的最大RSS
+                    stage_summary["peak_alloc_bytes"] = memory_entry["peak"]
+                    stage_summary["retained_alloc_bytes"] = memory_entry["retained"]
+                    stage_summary["rss_max_bytes"] = memory_entry["rss"] or None
+                stages.append(stage_summary)
+            summary = {
+                "run": self.run_name,
+                "wall_seconds": round(wall_time, 6),
+                "stages": stages
+            }
+            if self.memory:
+                if tracemalloc.is_tracing():
+                    self._traced_peak = max(self._traced_peak, tracemalloc.get_traced_memory()[1])
+                summary["memory"] = {
+                    "tracemalloc_peak_bytes": self._traced_peak,
+                    "rss_peak_bytes": _peak_rss(),
+                    "top_allocations": self.top_allocations
+                }
+            return summary
+
+    def export_json(self, file_path: str, extra: Optional[dict] = None):
+        """把运行汇总导出为JSON"""
+        report = self.summary()
+        if extra:
+            report.update(extra)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        logger.info(f"性能报告已导出: {file_path}")
+
+    def run(self, name: str) -> "ProfileRun":
+        """包裹一次完整运行：开始时清空数据，结束时导出报告"""
+        return ProfileRun(self, name)
+
+class ProfileRun:
+    def __init__(self, profiler: StageProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self.sampler: Optional[SamplingProfiler] = None
+        self.report_path: Optional[str] = None
+        self.started_tracemalloc = False
+
+    def __enter__(self):
+        if not self.profiler.enabled:
+            return self
+        self.profiler.reset()
+        self.profiler.run_name = self.name
+        if self.profiler.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        if self.profiler.sampling:
+            self.sampler = SamplingProfiler()
+            self.sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.profiler.enabled:
+            return False
+        try:
+            os.makedirs(self.profiler.output_dir, exist_ok=True)
+            prefix = os.path.join(self.profiler.output_dir, f"profile_{self.name}_{time.strftime('%Y%m%d_%H%M%S')}")
+            if self.sampler is not None:
+                self.sampler.stop()
+                self.sampler.export_speedscope(prefix + ".speedscope.json", self.name)
+            self.report_path = prefix + ".json"
+            self.profiler.export_json(self.report_path, {"failed": exc_type is not None})
+        except Exception as e:
+            logger.error(f"性能报告导出失败: {e}")
+        finally:
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+        return False
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        """定时采样目标线程的调用栈，结果可导出为speedscope格式"""
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.frames: list[dict] = []
+        self._frame_index: dict = {}
+        self.samples: list[list[int]] = []
+        self.weights: list[float] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.start_time = 0.0
+        self.end_time = 0.0
+
+    def start(self):
+        """在后台线程中开始采样"""
+        self.start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.end_time = time.perf_counter()
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def _sample_loop(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                last = now
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            # speedscope要求调用栈从根到叶
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(now - last)
+            last = now
+
+    def export_speedscope(self, file_path: str, name: str = "PicToAdofai"):
+        """导出为speedscope的sampled格式"""
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.end_time - self.start_time,
+                "samples": self.samples,
+                "weights": self.weights
+            }],
+            "name": name,
+            "exporter": "PicToAdofai"
+        }
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False)
+        logger.info(f"采样调用栈已导出: {file_path}，共 {len(self.samples)} 个样本")
+
+# 全局计时器，各模块通过 stage("名称") 记录阶段耗时
+profiler = StageProfiler()
+
+def stage(name: str):
+    """记录一个阶段的耗时，由全局计时器的 StageProfiler.stage 完成，未开启计时时返回空上下文"""
+    return profiler.stage(name)
@@ -0,0 +1,137 @@
+# 进度模块
+import threading
+import time
+from typing import Optional
+
+class ProgressTracker:
+    # 各阶段在总进度中所占的区间(百分比)
+    PHASE_RANGES: dict = {
+        'decode': (0, 60),
+        'generate': (60, 80),
+        'save': (80, 100)}
+    PHASE_NAMES: dict = {
+        'decode': '处理视频帧',
+        'generate': '生成事件',
+        'save': '写入文件'}
+    # 瞬时速率的平滑系数与最短采样间隔(秒)
+    RATE_SMOOTHING: float = 0.3
+    RATE_INTERVAL: float = 0.5
+
+    def __init__(self):
+        """线程安全的进度通道，由处理器写入，由界面按固定频率读取"""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """重置所有计数"""
+        with self._lock:
+            self.phase: str = ''
+            self.frames_decoded: int = 0
+            self.frames_generated: int = 0
+            self.total_frames: Optional[int] = None
+            self.events_emitted: int = 0
+            self.bytes_written: int = 0
+            self.total_bytes: Optional[int] = None
+            self.start_time: float = time.monotonic()
+            self._phase_start: float = self.start_time
+            self._last_sample: tuple[float, int] = (self.start_time, 0)
+            self._rate: Optional[float] = None
+
+    def set_phase(self, phase: str):
+        """切换当前阶段"""
+        with self._lock:
+            self.phase = phase
+            self._phase_start = time.monotonic()
+            self._last_sample = (self._phase_start, 0)
+            self._rate = None
+
+    def set_total_frames(self, total_frames: Optional[int]):
+        """设置预计总帧数"""
+        with self._lock:
+            self.total_frames = total_frames
+
+    def set_total_bytes(self, total_bytes: Optional[int]):
+        """设置预计写入的总字节数"""
+        with self._lock:
+            self.total_bytes = total_bytes
+
+    def add_frames(self, count: int = 1):
+        """累加已解码的帧数"""
+        with self._lock:
+            self.frames_decoded += count
+
+    def add_generated(self, frames: int, events: int):
+        """累加已生成事件的帧数和事件数"""
+        with self._lock:
+            self.frames_generated += frames
+            self.events_emitted += events
+
+    def add_bytes(self, count: int):
+        """累加已写入的字节数"""
+        with self._lock:
+            self.bytes_written += count
+
+    def _phase_units(self) -> tuple[int, Optional[int]]:
+        """当前阶段的已完成量和总量"""
+        if self.phase == 'decode':
+            return self.frames_decoded, self.total_frames
+        if self.phase == 'generate':
+            return self.frames_generated, self.total_frames
+        if self.phase == 'save':
+            return self.bytes_written, self.total_bytes
+        return 0, None
+
+    def snapshot(self) -> dict:
+        """读取当前进度，包括速率和当前阶段的预计剩余时间"""
+        with self._lock:
+            now = time.monotonic()
+            done, total = self._phase_units()
+
+            # 用相邻两次读取之间的增量计算瞬时速率，并做指数平滑
+            last_time, last_done = self._last_sample
+            if now - last_time >= self.RATE_INTERVAL:
+                instant_rate = (done - last_done) / (now - last_time)
+                if self._rate is None:
+                    self._rate = instant_rate
+                else:
+                    self._rate = self.RATE_SMOOTHING * instant_rate + (1 - self.RATE_SMOOTHING) * self._rate
+                self._last_sample = (now, done)
+            elapsed = now - self._phase_start
+            rate = self._rate if self._rate is not None else (done / elapsed if elapsed > 0 else 0.0)
+
+            fraction = min(1.0, done / total) if total else 0.0
+            eta = (total - done) / rate if total and rate > 0 and done < total else None
+            low, high = self.PHASE_RANGES.get(self.phase, (0, 0))
+
+            return {
+                "phase": self.phase,
+                "frames_decoded": self.frames_decoded,
+                "frames_generated": self.frames_generated,
+                "total_frames": self.total_frames,
+                "events_emitted": self.events_emitted,
+                "bytes_written": self.bytes_written,
+                "rate": rate,
+                "eta": eta,
+                "percent": low + (high - low) * fraction,
+                "elapsed": now - self.start_time
+            }
+
+    def describe(self, snapshot: Optional[dict] = None) -> str:
+        """把进度快照格式化为一行说明文字"""
+        snapshot = snapshot or self.snapshot()
+        phase = snapshot["phase"]
+        parts = [self.PHASE_NAMES.get(phase, phase)]
+        if phase == 'decode':
+            total = snapshot["total_frames"]
+            parts.append(f"{snapshot['frames_decoded']}/{total if total else '?'} 帧")
+            parts.append(f"{snapshot['rate']:.1f} 帧/秒")
+        elif phase == 'generate':
+            parts.append(f"{snapshot['frames_generated']}/{snapshot['total_frames']} 帧")
+            parts.append(f"{snapshot['events_emitted']} 个事件")
+            parts.append(f"{snapshot['rate']:.1f} 帧/秒")
+        elif phase == 'save':
+            parts.append(f"{snapshot['bytes_written'] / 1024 / 1024:.1f} MB")
+            parts.append(f"{snapshot['rate'] / 1024 / 1024:.1f} MB/秒")
+        if snapshot["eta"] is not None:
+            parts.append(f"剩余约 {snapshot['eta']:.0f} 秒")
+        return " | ".join(parts)
@@ -0,0 +1,441 @@
+# 本地HTTP转换服务模块
+from common.Logger import get_logger
+logger = get_logger("转换服务")
+
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import SyncManager
+from urllib.parse import urlsplit, parse_qs
+import asyncio
+import ipaddress
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import uuid
+
+from common.LevelBuilder import TILE_FORMATS
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# 上传和下载时每次读写的块大小
+CHUNK_SIZE = 1 << 20
+# 请求头的最大长度
+MAX_HEADER_BYTES = 64 * 1024
+# 工作进程上报进度的间隔(秒)
+PROGRESS_INTERVAL = 0.5
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.wmv', '.mkv')
+
+HTTP_REASONS = {
+    200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    409: 'Conflict', 411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        """带状态码的请求错误"""
+        super().__init__(message)
+        self.status = status
+
+def _ignore_interrupt():
+    """子进程忽略Ctrl+C，由服务进程统一关闭"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _report_progress(job_id: str, progress, progress_queue, stopped: threading.Event):
+    """工作进程内的后台线程：定期把进度快照发回服务进程"""
+    progress_queue.put((job_id, progress.snapshot()))
+    while not stopped.wait(PROGRESS_INTERVAL):
+        progress_queue.put((job_id, progress.snapshot()))
+    progress_queue.put((job_id, progress.snapshot()))
+
+def _run_job(job_id: str, kind: str, input_path: str, output_path: str, params: dict, progress_queue) -> dict:
+    """在进程池中执行一个转换任务，返回统计信息"""
+    from common.Progress import ProgressTracker
+    progress = ProgressTracker()
+    stopped = threading.Event()
+    reporter = threading.Thread(target=_report_progress, args=(job_id, progress, progress_queue, stopped), daemon=True)
+    reporter.start()
+    try:
+        if kind == 'image':
+            from image_tool.converter import convert_image
+            return convert_image(input_path, output_path, progress=progress, **params)
+        from video_tool.converter import convert_video
+        return convert_video(input_path, output_path, progress=progress, **params)
+    finally:
+        stopped.set()
+        reporter.join()
+
+def _parse_params(kind: str, query: dict) -> dict:
+    """把查询参数转换为转换函数的参数"""
+    def get(name: str, cast, default=None):
+        values = query.get(name)
+        if not values or values[0] == '':
+            return default
+        try:
+            return cast(values[0])
+        except ValueError:
+            raise HTTPError(400, f"参数 {name} 格式错误: {values[0]}")
+
+    params = {
+        "max_pixels": get("max_pixels", int, 300000),
+        "tile_format": get("tile_format", str, "angleData")
+    }
+    if params["tile_format"] not in TILE_FORMATS:
+        raise HTTPError(400, f"参数 tile_format 只能是: {', '.join(TILE_FORMATS)}")
+    if kind == 'video':
+        max_size_mb = get("max_size_mb", float)
+        params.update(
+            engine=get("engine", str, "traditional"),
+            target_fps=get("fps", float, 10.0),
+            max_frames=get("max_frames", int, 100) or None,
+            diff_threshold=get("threshold", float, 10.0),
+            max_events=get("max_events", int),
+            max_bytes=int(max_size_mb * 1024 * 1024) if max_size_mb is not None else None,
+            decoder=get("decoder", str, "opencv"),
+            start_time=get("start", float, 0.0),
+            end_time=get("end", float)
+        )
+        from video_tool.decoders import DECODERS
+        if params["decoder"] not in DECODERS:
+            raise HTTPError(400, f"参数 decoder 只能是: {', '.join(DECODERS)}")
+    return params
+
+class ConversionService:
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 2,
+                 work_dir: Optional[str] = None, max_upload_mb: float = 1024):
+        """基于asyncio的本地HTTP服务，转换任务在进程池中执行，事件循环只负责收发数据"""
+        from video_tool.converter import ParameterError
+        if workers <= 0:
+            raise ParameterError("工作进程数必须大于0")
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="pictoadofai_")
+        self._owns_work_dir = work_dir is None
+        self.max_upload = int(max_upload_mb * 1024 * 1024)
+        # 任务ID -> 任务记录
+        self.jobs: dict = {}
+        self._context = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._progress_queue = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: set = set()
+        # 事件循环，任务记录只在循环线程中修改
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing = False
+
+    async def start(self):
+        """启动进程池和监听端口"""
+        try:
+            if not ipaddress.ip_address(self.host).is_loopback:
+                logger.warning(f"服务没有任何鉴权，不建议监听非本机地址: {self.host}")
+        except ValueError:
+            pass
+        os.makedirs(self.work_dir, exist_ok=True)
+
+        # 使用spawn启动，工作进程不继承事件循环和CUDA状态
+        self._context = multiprocessing.get_context("spawn")
+        self._manager = SyncManager(ctx=self._context)
+        self._manager.start(_ignore_interrupt)
+        self._progress_queue = self._manager.Queue()
+        self._executor = self._create_executor()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._loop = asyncio.get_running_loop()
+        self._loop.run_in_executor(None, self._drain_progress)
+        logger.info(f"转换服务已启动: http://{self.host}:{self.port}，工作进程数: {self.workers}")
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """创建执行转换任务的进程池"""
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context, initializer=_ignore_interrupt)
+
+    async def serve_forever(self):
+        """启动并一直运行，直到被取消"""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """关闭服务并清理临时文件"""
+        if self._closing:
+            return
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+        if self._owns_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+        logger.info("转换服务已关闭")
+
+    def _drain_progress(self):
+        """在线程中读取工作进程上报的进度（阻塞读取，不占用事件循环）"""
+        while not self._closing:
+            try:
+                job_id, snapshot = self._progress_queue.get(timeout=PROGRESS_INTERVAL)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            # 交给事件循环更新任务记录，避免与 _wait_job 同时修改状态
+            try:
+                self._loop.call_soon_threadsafe(self._apply_progress, job_id, snapshot)
+            except RuntimeError:
+                # 事件循环已关闭
+                return
+
+    def _apply_progress(self, job_id: str, snapshot: dict):
+        """在事件循环中记录工作进程上报的进度"""
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            return
+        job["progress"] = snapshot
+        # 第一次收到进度说明任务已被工作进程取走
+        if job["status"] == "queued":
+            job["status"] = "running"
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接上的单个请求（响应后关闭连接）"""
+        try:
+            try:
+                method, path, query, headers = await self._read_request_head(reader)
+                await self._route(method, path, query, headers, reader, writer)
+            except HTTPError as e:
+                await self._send_json(writer, e.status, {"error": str(e)})
+            except Exception as e:
+                logger.error(f"请求处理失败: {e}")
+                await self._send_json(writer, 500, {"error": str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request_head(self, reader: asyncio.StreamReader) -> tuple[str, str, dict, dict]:
+        """读取并解析请求行和请求头"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "请求头过长")
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("连接提前关闭")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "无效的请求行")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        return method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers
+
+    async def _route(self, method: str, path: str, query: dict, headers: dict,
+                     reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """按路径分发请求"""
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"]:
+            await self._send_json(writer, 200, {"status": "ok", "jobs": len(self.jobs)})
+        elif parts == ["jobs"]:
+            if method == "POST":
+                await self._create_job(query, headers, reader, writer)
+            elif method == "GET":
+                await self._send_json(writer, 200, {"jobs": [self._job_status(job) for job in self.jobs.values()]})
+            else:
+                raise HTTPError(405, "不支持的请求方法")
+        elif len(parts) >= 2 and parts[0] == "jobs":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HTTPError(404, f"任务不存在: {parts[1]}")
+            if len(parts) == 2 and method == "GET":
+                await self._send_json(writer, 200, self._job_status(job))
+            elif len(parts) == 2 and method == "DELETE":
+                self._delete_job(job)
+                await self._send_json(writer, 200, {"deleted": job["job_id"]})
+            elif parts[2:] == ["result"] and method == "GET":
+                await self._send_result(job, writer)
+            else:
+                raise HTTPError(405, "不支持的请求方法")
+        else:
+            raise HTTPError(404, f"路径不存在: {path}")
+
+    async def _create_job(self, query: dict, headers: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """接收上传的文件并提交转换任务"""
+        if "content-length" not in headers:
+            raise HTTPError(411, "需要Content-Length请求头")
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise HTTPError(400, "Content-Length格式错误")
+        if length <= 0:
+            raise HTTPError(400, "请求体为空")
+        if length > self.max_upload:
+            raise HTTPError(413, f"文件超过上传上限 {self.max_upload // 1024 // 1024} MB")
+
+        # 根据文件名或kind参数判断任务类型
+        filename = os.path.basename(query.get("filename", [""])[0])
+        extension = os.path.splitext(filename)[1].lower()
+        kind = query.get("kind", [""])[0]
+        if not kind:
+            kind = 'image' if extension in IMAGE_EXTENSIONS else 'video' if extension in VIDEO_EXTENSIONS else ''
+        if kind not in ('image', 'video'):
+            raise HTTPError(400, "无法判断任务类型，请指定kind=image或kind=video")
+        params = _parse_params(kind, query)
+
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.work_dir, job_id)
+        os.makedirs(job_dir)
+        input_path = os.path.join(job_dir, "input" + (extension or (".png" if kind == 'image' else ".mp4")))
+        output_path = os.path.join(job_dir, "output.adofai")
+
+        # 分块写入上传内容，不把整个文件读入内存
+        try:
+            with open(input_path, "wb") as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = await reader.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise HTTPError(400, "上传内容不完整")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "filename": filename,
+            "params": params,
+            "status": "queued",
+            "progress": None,
+            "stats": None,
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None,
+            "job_dir": job_dir,
+            "output_path": output_path
+        }
+        self.jobs[job_id] = job
+        executor = self._executor
+        future = asyncio.get_running_loop().run_in_executor(
+            executor, _run_job, job_id, kind, input_path, output_path, params, self._progress_queue
+        )
+        task = asyncio.ensure_future(self._wait_job(job, future, executor))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"提交任务 {job_id}: {kind} {filename}，{length} 字节")
+
+        await self._send_json(writer, 202, {
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "result_url": f"/jobs/{job_id}/result"
+        })
+
+    async def _wait_job(self, job: dict, future, executor: ProcessPoolExecutor):
+        """等待进程池中的任务结束并更新任务记录；executor为提交任务的进程池"""
+        try:
+            job["stats"] = await future
+            job["status"] = "done"
+            logger.info(f"任务 {job['job_id']} 完成")
+        except BrokenProcessPool:
+            job["status"] = "failed"
+            job["error"] = "工作进程意外退出"
+            logger.error(f"任务 {job['job_id']} 失败: 工作进程意外退出，重建进程池")
+            # 进程池损坏后无法再提交任务，换一个新的；旧池中的其他任务同样会失败，只由第一个发现的任务重建
+            if not self._closing and self._executor is executor:
+                self._executor = self._create_executor()
+                executor.shutdown(wait=False)
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"任务 {job['job_id']} 失败: {e}")
+        finally:
+            job["finished_at"] = time.time()
+
+    def _job_status(self, job: dict) -> dict:
+        """任务的对外状态（不包含服务端路径）"""
+        stats = dict(job["stats"]) if job["stats"] else None
+        if stats:
+            for key in ("image_path", "video_path", "output_path", "profile_report"):
+                stats.pop(key, None)
+        return {
+            "job_id": job["job_id"],
+            "kind": job["kind"],
+            "filename": job["filename"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "stats": stats,
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"]
+        }
+
+    def _delete_job(self, job: dict):
+        """删除已结束的任务及其文件"""
+        if job["status"] not in ("done", "failed"):
+            raise HTTPError(409, "任务尚未结束")
+        del self.jobs[job["job_id"]]
+        shutil.rmtree(job["job_dir"], ignore_errors=True)
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, data: dict):
+        """发送JSON响应"""
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        writer.write(self._response_head(status, {
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Length": str(len(body))
+        }) + body)
+        await writer.drain()
+
+    async def _send_result(self, job: dict, writer: asyncio.StreamWriter):
+        """以分块传输编码流式发送生成的关卡文件"""
+        if job["status"] != "done":
+            raise HTTPError(409, f"任务尚未完成，当前状态: {job['status']}")
+        name = os.path.splitext(job["filename"])[0] or job["job_id"]
+        writer.write(self._response_head(200, {
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Disposition": f"attachment; filename=\"{name}.adofai\"",
+            "Transfer-Encoding": "chunked"
+        }))
+        loop = asyncio.get_running_loop()
+        with open(job["output_path"], "rb") as f:
+            while True:
+                # 读文件放到线程中，避免大文件阻塞事件循环
+                chunk = await loop.run_in_executor(None, f.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+                await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _response_head(self, status: int, headers: dict) -> bytes:
+        """构造响应行和响应头"""
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        lines.append("Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+def run_service(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 2,
+                work_dir: Optional[str] = None, max_upload_mb: float = 1024):
+    """阻塞运行转换服务，直到被Ctrl+C中断"""
+    service = ConversionService(host, port, workers, work_dir, max_upload_mb)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("转换服务已被中断")
@@ -0,0 +1,103 @@
+# 转换服务客户端模块
+from common.Logger import get_logger
+logger = get_logger("服务客户端")
+
+from typing import Optional
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+import json
+import os
+import time
+
+from common.Service import CHUNK_SIZE, DEFAULT_HOST, DEFAULT_PORT
+
+class ServiceClient:
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 60.0):
+        """本地转换服务的客户端，只依赖标准库"""
+        self.base_url = f"http://{host}:{port}"
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, data=None, headers: Optional[dict] = None) -> dict:
+        """发送请求并解析JSON响应，服务端错误转换为异常"""
+        request = Request(self.base_url + path, data=data, headers=headers or {}, method=method)
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read().decode("utf-8")).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise Exception(f"服务返回错误 {e.code}: {message}")
+
+    def submit(self, file_path: str, kind: Optional[str] = None, **params) -> str:
+        """上传图片或视频并提交任务，返回任务ID
+
+        params为查询参数：max_pixels、tile_format，视频另有engine、decoder、fps、max_frames、start、end、threshold、max_events、max_size_mb
+        """
+        query = {"filename": os.path.basename(file_path)}
+        if kind:
+            query["kind"] = kind
+        query.update({name: value for name, value in params.items() if value is not None})
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            # 传入文件对象，urllib按块发送，不需要把整个文件读入内存
+            result = self._request("POST", "/jobs?" + urlencode(query), data=f, headers={
+                "Content-Length": str(size),
+                "Content-Type": "application/octet-stream"
+            })
+        logger.info(f"已提交任务: {result['job_id']}")
+        return result["job_id"]
+
+    def status(self, job_id: str) -> dict:
+        """查询任务状态和进度"""
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def wait(self, job_id: str, poll_interval: float = 1.0, timeout: Optional[float] = None) -> dict:
+        """轮询直到任务结束，返回最终状态"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            status = self.status(job_id)
+            if status["status"] in ("done", "failed"):
+                return status
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"等待任务超时: {job_id}")
+            time.sleep(poll_interval)
+
+    def download(self, job_id: str, output_path: str) -> int:
+        """流式下载生成的关卡文件，返回写入的字节数"""
+        request = Request(f"{self.base_url}/jobs/{job_id}/result", method="GET")
+        written = 0
+        try:
+            with urlopen(request, timeout=self.timeout) as response, open(output_path, "wb") as f:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+        except HTTPError as e:
+            raise Exception(f"下载失败 {e.code}: {e.read().decode('utf-8', 'replace')}")
+        logger.info(f"已下载 {written} 字节到 {output_path}")
+        return written
+
+    def delete(self, job_id: str) -> dict:
+        """删除已结束的任务"""
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def convert(self, file_path: str, output_path: str, kind: Optional[str] = None, **params) -> dict:
+        """提交、等待并下载，返回任务的统计信息；任务结束后无论成功与否都从服务端删除"""
+        job_id = self.submit(file_path, kind, **params)
+        finished = False
+        try:
+            status = self.wait(job_id)
+            finished = True
+            if status["status"] != "done":
+                raise Exception(f"转换失败: {status['error']}")
+            self.download(job_id, output_path)
+            return status["stats"]
+        finally:
+            # 等待超时时任务仍在运行，服务端不允许删除
+            if finished:
+                self.delete(job_id)
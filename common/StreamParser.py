@@ -0,0 +1,193 @@
+# 流式解析模块
+from common.Logger import get_logger
+logger = get_logger("流式解析")
+
+from typing import Iterator
+import codecs
+import json
+import re
+
+from common.Parser import TRAILING_COMMA
+
+# 与Parser相同的去逗号规则，作用于文本
+_TRAILING_COMMA = re.compile(TRAILING_COMMA.pattern.decode('ascii'), re.ASCII)
+# 逐个元素读取的顶层数组，其余顶层值整体解析
+STREAMED_KEYS: dict = {
+    'actions': 'action',
+    'decorations': 'decoration'}
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r'\s*')
+_STRUCTURE = re.compile(r'["{}\[\]]')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_SCALAR = re.compile(r'[^,\]}\s]*')
+
+class StreamParser:
+    def __init__(self, file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """按块读取关卡文件，逐个产出顶层字段和事件，内存占用与文件大小无关"""
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._file = None
+        self._text_decoder = None
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        # 已丢弃的缓冲区字符数，用于在错误信息中给出文件中的位置
+        self._consumed = 0
+        self.bytes_read = 0
+
+    def __iter__(self) -> Iterator[tuple[str, object]]:
+        """依次产出 (字段名, 值)；actions和decorations中的每个元素分别以 ('action', 事件) 和 ('decoration', 装饰) 产出，空数组以 (字段名, []) 产出"""
+        with open(self.file_path, 'rb') as self._file:
+            # utf-8-sig会去掉文件开头的BOM
+            self._text_decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+            self._buffer = ''
+            self._pos = 0
+            self._eof = False
+            self._consumed = 0
+            self.bytes_read = 0
+
+            self._expect('{')
+            while True:
+                token = self._peek()
+                if token == '}':
+                    self._pos += 1
+                    return
+                if token == ',':
+                    # 容忍多余的逗号
+                    self._pos += 1
+                    continue
+
+                key = self._read_value()
+                if not isinstance(key, str):
+                    self._error("字段名必须是字符串")
+                self._expect(':')
+
+                item_name = STREAMED_KEYS.get(key)
+                if item_name is not None and self._peek() == '[':
+                    self._pos += 1
+                    empty = True
+                    for item in self._iter_array():
+                        empty = False
+                        yield item_name, item
+                    if empty:
+                        # 空数组整体产出，便于调用方保留该字段
+                        yield key, []
+                else:
+                    yield key, self._read_value()
+
+    def _read_more(self, min_chars: int = 0) -> bool:
+        """向缓冲区追加数据，已到文件末尾时返回False"""
+        if self._eof:
+            return False
+        # 丢弃已经解析过的部分，避免缓冲区无限增长
+        if self._pos > 0:
+            self._consumed += self._pos
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+
+        # 单个值跨越多个块时按缓冲区大小成倍读取，避免反复重新解析
+        size = max(self.chunk_size, min_chars, len(self._buffer))
+        raw = self._file.read(size)
+        self.bytes_read += len(raw)
+        if not raw:
+            self._eof = True
+            self._buffer += self._text_decoder.decode(b'', final=True)
+            return False
+        self._buffer += self._text_decoder.decode(raw)
+        return True
+
+    def _peek(self) -> str:
+        """跳过空白并返回下一个字符，文件结束时返回空字符串"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                return ''
+
+    def _expect(self, char: str):
+        """读取指定的结构字符"""
+        if self._peek() != char:
+            self._error(f"应为 '{char}'")
+        self._pos += 1
+
+    def _error(self, message: str):
+        """抛出带文件位置的解析错误"""
+        found = self._buffer[self._pos:self._pos + 20]
+        raise ValueError(f"{message}，位置: 第 {self._consumed + self._pos} 个字符附近: {found!r}")
+
+    def _iter_array(self) -> Iterator[object]:
+        """逐个产出数组元素（容忍元素之间和末尾多余的逗号）"""
+        while True:
+            token = self._peek()
+            if token == ']':
+                self._pos += 1
+                return
+            if token == ',':
+                self._pos += 1
+                continue
+            if token == '':
+                self._error("文件在数组中途结束")
+            yield self._read_value()
+
+    def _read_value(self) -> object:
+        """从当前位置解析一个完整的JSON值"""
+        if self._peek() == '':
+            self._error("文件意外结束")
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # 数字可能恰好在缓冲区末尾被截断，需要读更多数据再确认
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                end = self._value_end(self._pos)
+                if end is not None:
+                    # 值是完整的但不是严格JSON，去掉多余的逗号后再解析
+                    try:
+                        value = json.loads(_TRAILING_COMMA.sub(r'\1', self._buffer[self._pos:end]))
+                    except json.JSONDecodeError as e:
+                        self._error(f"无法解析: {e}")
+                    self._pos = end
+                    return value
+                if self._eof:
+                    self._error("文件被截断")
+            self._read_more(len(self._buffer) - self._pos)
+
+    def _value_end(self, pos: int):
+        """扫描括号和字符串找到值的结束位置，值不完整时返回None"""
+        buffer = self._buffer
+        first = buffer[pos]
+        if first == '"':
+            match = _STRING.match(buffer, pos)
+            return match.end() if match else None
+        if first not in '{[':
+            end = _SCALAR.match(buffer, pos).end()
+            return end if end < len(buffer) else None
+
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(buffer, pos)
+            if match is None:
+                return None
+            char = match.group()
+            if char == '"':
+                string = _STRING.match(buffer, match.start())
+                if string is None:
+                    return None
+                pos = string.end()
+                continue
+            depth += 1 if char in '{[' else -1
+            pos = match.end()
+            if depth == 0:
+                return pos
+
+def iter_actions(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[dict]:
+    """只产出关卡中的事件"""
+    for key, value in StreamParser(file_path, chunk_size):
+        if key == 'action':
+            yield value
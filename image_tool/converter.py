@@ -0,0 +1,65 @@
+# 无界面图片转换模块
+from common.Logger import get_logger
+logger = get_logger("图片转换")
+
+from typing import Optional
+import os
+import time
+
+from common.LevelBuilder import check_tile_format
+from common.Profiler import profiler
+from common.Progress import ProgressTracker
+
+def convert_image(image_path: str, output_path: str, max_pixels: int = 300000,
+                  progress: Optional[ProgressTracker] = None, tile_format: str = "angleData", encode_workers: int = 1) -> dict:
+    """完整的图片转换流程：处理图片、生成并保存关卡，返回统计信息"""
+    if max_pixels <= 0:
+        raise ValueError("最大像素数必须大于0")
+    check_tile_format(tile_format)
+    if encode_workers < 0:
+        raise ValueError("序列化进程数不能为负数")
+    if not os.path.isfile(image_path):
+        raise FileNotFoundError(f"图片文件不存在: {image_path}")
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    if not os.path.isdir(output_dir):
+        raise NotADirectoryError(f"输出目录不存在: {output_dir}")
+
+    from image_tool.image_processor import ImageProcessor
+    from image_tool.adofai_generator import ADOFAIGenerator
+
+    start_time = time.perf_counter()
+    with profiler.run("image_convert") as profile_run:
+        # 图片只有一帧，沿用视频的阶段划分上报进度
+        if progress is not None:
+            progress.set_total_frames(1)
+            progress.set_phase('decode')
+        pixel_data, width, height = ImageProcessor().process_image(image_path, max_pixels)
+
+        if progress is not None:
+            progress.add_frames(1)
+            progress.set_phase('generate')
+        generator = ADOFAIGenerator(pixel_data, width, height, tile_format, encode_workers)
+        generator.generate_and_save(output_path)
+        if progress is not None:
+            progress.add_generated(1, len(generator.actions))
+            progress.set_phase('save')
+
+    size = os.path.getsize(output_path)
+    if progress is not None:
+        progress.set_total_bytes(size)
+        progress.add_bytes(size)
+
+    stats = {
+        "image_path": image_path,
+        "output_path": output_path,
+        "width": width,
+        "height": height,
+        "tiles": width * height,
+        "tile_format": tile_format,
+        "total_events": len(generator.actions),
+        "bytes": size,
+        "seconds": round(time.perf_counter() - start_time, 3),
+        "profile_report": profile_run.report_path
+    }
+    logger.info(f"转换统计: {stats}")
+    return stats
@@ -4,6 +4,7 @@ logger = get_logger("图片处理")
 
 from PIL import Image
 import math
+from common.Profiler import stage
 
 class ImageProcessor:
     def __init__(self):
@@ -13,9 +14,12 @@ class ImageProcessor:
         """加载图片"""
         logger.info(f"加载图片: {file_path}")
         try:
-            image = Image.open(file_path)
+            with stage("decode"):
+                image = Image.open(file_path)
+                image.load()
             # 转换为RGBA模式
-            image = image.convert("RGBA")
+            with stage("color_conversion"):
+                image = image.convert("RGBA")
             logger.debug(f"图片加载成功，尺寸: {image.width}x{image.height}，模式: {image.mode}")
             return image
         except Exception as e:
@@ -60,12 +64,13 @@ class ImageProcessor:
         logger.info(f"获取图片像素数据，尺寸: {width}x{height}")
         
         pixel_data = []
-        for y in range(height):
-            row = []
-            for x in range(width):
-                pixel = image.getpixel((x, y))
-                row.append(pixel)
-            pixel_data.append(row)
+        with stage("pixel_extraction"):
+            for y in range(height):
+                row = []
+                for x in range(width):
+                    pixel = image.getpixel((x, y))
+                    row.append(pixel)
+                pixel_data.append(row)
         
         logger.debug(f"像素数据获取成功，共 {len(pixel_data)} 行，每行 {len(pixel_data[0])} 个像素")
         return pixel_data
@@ -85,7 +90,8 @@ class ImageProcessor:
         image = self.load_image(file_path)
         
         # 缩放图片
-        resized_image = self.resize_image(image, max_pixels)
+        with stage("resize"):
+            resized_image = self.resize_image(image, max_pixels)
         
         # 获取像素数据
         pixel_data = self.get_pixel_data(resized_image)
@@ -12,6 +12,7 @@ from io import StringIO
 
 from image_tool.image_processor import ImageProcessor
 from image_tool.adofai_generator import ADOFAIGenerator
+from common.Profiler import profiler
 
 class ImageToADOFAIApp:
     def __init__(self):
@@ -163,16 +164,17 @@ class ImageToADOFAIApp:
         try:
             logger.info("开始转换图片到ADOFAI关卡")
             
-            # 处理图片
-            pixel_data, width, height = self.image_processor.process_image(
-                self.image_path, 
-                self.max_pixels
-            )
-            
-            # 生成关卡
-            generator = ADOFAIGenerator(pixel_data, width, height)
-            generator.generate_and_save(self.output_path)
-            
+            with profiler.run("image_convert"):
+                # 处理图片
+                pixel_data, width, height = self.image_processor.process_image(
+                    self.image_path, 
+                    self.max_pixels
+                )
+                
+                # 生成关卡
+                generator = ADOFAIGenerator(pixel_data, width, height)
+                generator.generate_and_save(self.output_path)
+                
             logger.info("转换完成！")
             
             # 显示成功消息
@@ -8,12 +8,13 @@ from ttkbootstrap.constants import BOTH, YES, LEFT, RIGHT, X, Y
 from ttkbootstrap.dialogs import Messagebox
 from tkinter import filedialog, Label, W, END
 import threading
-from PIL import Image, ImageTk
-import cv2
 
-from video_tool.video_processor import VideoProcessor
-from video_tool.torch_video_processor import TorchVideoProcessor
-from video_tool.video_to_adofai import VideoToADOFAI
+# cv2、torch、PIL等重量级依赖在首次使用时才导入，保证界面快速启动
+from video_tool.engines import AUTO_ENGINE, ENGINE_LABELS, create_processor
+from common.Progress import ProgressTracker
+
+# 界面轮询进度通道的间隔(毫秒)
+PROGRESS_POLL_INTERVAL = 200
 
 class VideoToADOFAIApp:
     def __init__(self):
@@ -29,16 +30,19 @@ class VideoToADOFAIApp:
         self.diff_threshold = 10.0  # 默认颜色差异阈值
         self.max_frames = 100  # 默认最大帧数
         self.max_pixels = 300000  # 默认最大像素数
+        self.max_events = None  # 事件数预算，None表示不限制
+        self.max_size_mb = None  # 文件大小预算(MB)，None表示不限制
         self.output_path = ""
-        self.processor_type = "pytorch"  # 默认使用PyTorch处理器
+        self.processor_type = AUTO_ENGINE  # 默认按输入视频测速选择处理器
+        self.active_engine = None  # 最近一次实际使用的引擎（自动引擎选中的结果）
         
-        # 初始化处理器
-        self.video_processor = None
-        self.torch_video_processor = None
-        self.video_to_adofai = VideoToADOFAI()
+        # 处理器实例在引擎被选中并首次使用时才创建
+        self.processors = {}
+        self._processor_lock = threading.Lock()
         
-        # 初始化处理器实例
-        self._init_processors()
+        # 进度通道，由处理器写入，界面按固定频率读取
+        self.progress = ProgressTracker()
+        self._polling_progress = False
         
         # 预览相关
         self.preview_frame = None
@@ -47,46 +51,45 @@ class VideoToADOFAIApp:
         # 创建UI组件
         self.create_widgets()
     
-    def _init_processors(self):
-        """初始化处理器实例"""
-        try:
-            # 初始化PyTorch处理器
-            self.torch_video_processor = TorchVideoProcessor()
-            logger.info("PyTorch处理器初始化成功")
-            
-            # 初始化传统处理器
-            self.video_processor = VideoProcessor()
-            logger.info("传统处理器初始化成功")
+    def _get_processor(self):
+        """返回当前引擎的处理器，首次使用时才导入并初始化；自动引擎按当前视频测速选择"""
+        with self._processor_lock:
+            engine = self.processor_type
+            if engine == AUTO_ENGINE:
+                # 本机已测过该最大像素数时直接使用缓存的选择，否则在当前视频开头的几帧上测速
+                from video_tool.engine_selector import cached_engine, select_engine
+                engine = cached_engine(self.max_pixels)
+                if engine is None:
+                    engine, processor = select_engine(self.video_path, self.target_fps, self.max_pixels)
+                    self.processors.setdefault(engine, processor)
+            self.active_engine = engine
+            processor = self.processors.get(engine)
+            if processor is not None:
+                return processor
             
-            # 根据处理器类型选择当前处理器
-            self._select_processor()
-        except Exception as e:
-            logger.error(f"处理器初始化失败: {e}")
-            # 至少确保传统处理器可用
             try:
-                self.video_processor = VideoProcessor()
-                self.processor_type = "traditional"
-                self.current_processor = self.video_processor
-                logger.info("仅传统处理器初始化成功")
-            except Exception as e2:
-                logger.error(f"传统处理器初始化也失败: {e2}")
-                self.current_processor = None
-    
-    def _select_processor(self):
-        """选择当前处理器"""
-        if self.processor_type == "pytorch" and self.torch_video_processor:
-            self.current_processor = self.torch_video_processor
-            logger.info("使用PyTorch处理器")
-        else:
-            self.current_processor = self.video_processor
-            logger.info("使用传统处理器")
+                processor = create_processor(engine)
+                logger.info(f"处理器初始化成功: {engine}")
+            except Exception as e:
+                logger.error(f"处理器初始化失败: {e}")
+                if engine == "traditional":
+                    raise
+                # 回退到传统处理器
+                logger.info("回退到传统处理器")
+                engine = self.active_engine = "traditional"
+                if self.processor_type != AUTO_ENGINE:
+                    self.processor_type = engine
+                    self.root.after(0, lambda: self.processor_var.set("traditional"))
+                processor = self.processors.get("traditional") or create_processor("traditional")
+            
+            self.processors[engine] = processor
+            return processor
     
     def _on_processor_change(self):
         """处理处理器类型变更"""
         new_type = self.processor_var.get()
         if new_type != self.processor_type:
             self.processor_type = new_type
-            self._select_processor()
             logger.info(f"处理器类型已更改为: {new_type}")
     
     def create_widgets(self):
@@ -123,21 +126,14 @@ class VideoToADOFAIApp:
         processor_frame_inner = ttk.Frame(processor_frame)
         processor_frame_inner.pack(side=LEFT, padx=5)
         
-        ttk.Radiobutton(
-            processor_frame_inner, 
-            text="PyTorch (GPU加速)", 
-            variable=self.processor_var, 
-            value="pytorch",
-            command=self._on_processor_change
-        ).pack(anchor=W, pady=2)
-        
-        ttk.Radiobutton(
-            processor_frame_inner, 
-            text="传统 (CPU)", 
-            variable=self.processor_var, 
-            value="traditional",
-            command=self._on_processor_change
-        ).pack(anchor=W, pady=2)
+        for engine, label in ENGINE_LABELS.items():
+            ttk.Radiobutton(
+                processor_frame_inner, 
+                text=label, 
+                variable=self.processor_var, 
+                value=engine,
+                command=self._on_processor_change
+            ).pack(anchor=W, pady=2)
         
         # 视频参数设置
         params_frame = ttk.Labelframe(control_frame, text="视频参数", padding=10)
@@ -170,6 +166,18 @@ class VideoToADOFAIApp:
         self.pixels_entry.insert(0, str(self.max_pixels))
         self.pixels_entry.pack(side=LEFT, padx=5)
         
+        # 预算设置，填写后自动选择颜色差异阈值
+        budget_frame = ttk.Labelframe(control_frame, text="预算 (留空表示不限制，填写后自动选择阈值)", padding=10)
+        budget_frame.pack(fill=X, pady=5)
+        
+        ttk.Label(budget_frame, text="最大事件数: ").pack(side=LEFT, padx=5)
+        self.max_events_entry = ttk.Entry(budget_frame, width=12)
+        self.max_events_entry.pack(side=LEFT, padx=5)
+        
+        ttk.Label(budget_frame, text="最大文件大小 (MB): ").pack(side=LEFT, padx=5)
+        self.max_size_entry = ttk.Entry(budget_frame, width=10)
+        self.max_size_entry.pack(side=LEFT, padx=5)
+        
         # 输出路径选择
         output_frame = ttk.Labelframe(control_frame, text="输出路径", padding=10)
         output_frame.pack(fill=X, pady=5)
@@ -206,6 +214,15 @@ class VideoToADOFAIApp:
         )
         self.preview_button.pack(side=LEFT, padx=5)
         
+        self.analyze_button = ttk.Button(
+            button_frame, 
+            text="分析阈值", 
+            command=self.start_analysis,
+            bootstyle="warning",
+            width=15
+        )
+        self.analyze_button.pack(side=LEFT, padx=5)
+        
         # 进度条
         progress_frame = ttk.Labelframe(control_frame, text="转换进度", padding=10)
         progress_frame.pack(fill=X, pady=5)
@@ -236,6 +253,7 @@ class VideoToADOFAIApp:
             title="选择视频",
             filetypes=[
                 ("视频文件", "*.mp4;*.avi;*.mov;*.wmv;*.mkv"),
+                ("动图", "*.gif;*.apng;*.png;*.webp"),
                 ("所有文件", "*.*")
             ]
         )
@@ -304,6 +322,24 @@ class VideoToADOFAIApp:
             Messagebox.show_error(f"无效的最大像素数: {e}", "错误")
             return False
         
+        try:
+            max_events_text = self.max_events_entry.get().strip()
+            self.max_events = int(max_events_text) if max_events_text else None
+            if self.max_events is not None and self.max_events <= 0:
+                raise ValueError("最大事件数必须大于0")
+        except ValueError as e:
+            Messagebox.show_error(f"无效的最大事件数: {e}", "错误")
+            return False
+        
+        try:
+            max_size_text = self.max_size_entry.get().strip()
+            self.max_size_mb = float(max_size_text) if max_size_text else None
+            if self.max_size_mb is not None and self.max_size_mb <= 0:
+                raise ValueError("最大文件大小必须大于0")
+        except ValueError as e:
+            Messagebox.show_error(f"无效的最大文件大小: {e}", "错误")
+            return False
+        
         if not self.output_path:
             self.output_path = "video_output.adofai"
             self.output_entry.delete(0, END)
@@ -320,15 +356,17 @@ class VideoToADOFAIApp:
         
         try:
             logger.info("开始预览第一帧")
+            import cv2
+            from PIL import Image, ImageTk
+            from video_tool.decoders import open_decoder
             
-            # 打开视频
-            video = cv2.VideoCapture(self.video_path)
-            if not video.isOpened():
-                raise Exception("无法打开视频文件")
-            
-            # 读取第一帧
-            ret, frame = video.read()
-            if not ret:
+            # 打开视频（动图用Pillow读取）并读取第一帧
+            decoder = open_decoder("opencv", self.video_path)
+            try:
+                _, frame = next(decoder.frames(1, 0, 1), (None, None))
+            finally:
+                decoder.close()
+            if frame is None:
                 raise Exception("无法读取视频帧")
             
             # 转换为RGB格式
@@ -351,9 +389,6 @@ class VideoToADOFAIApp:
                 # 保持引用以防止垃圾回收
                 self._preview_image_ref = self.preview_frame
             
-            # 释放视频
-            video.release()
-            
             logger.info("第一帧预览成功")
         except Exception as e:
             logger.error(f"预览失败: {e}")
@@ -369,82 +404,134 @@ class VideoToADOFAIApp:
         self.preview_button.configure(state="disabled")
         
         # 在新线程中执行转换，避免阻塞UI
+        self.start_progress_polling()
         threading.Thread(target=self.convert, daemon=True).start()
     
+    def start_analysis(self):
+        """开始阈值分析（不生成关卡）"""
+        if not self.validate_input():
+            return
+        
+        # 禁用按钮，防止重复点击
+        self.convert_button.configure(state="disabled")
+        self.preview_button.configure(state="disabled")
+        self.analyze_button.configure(state="disabled")
+        
+        # 在新线程中执行分析，避免阻塞UI
+        self.start_progress_polling()
+        threading.Thread(target=self.analyze, daemon=True).start()
+    
+    def analyze(self):
+        """单次遍历视频，预测不同颜色差异阈值下的事件数和文件大小"""
+        try:
+            logger.info("开始分析颜色差异阈值")
+            self.root.after(0, lambda: self.update_progress(10, "分析颜色差异..."))
+            
+            from video_tool.threshold_analyzer import analyze_video
+            current_processor = self._get_processor()
+            
+            histogram = analyze_video(
+                current_processor, 
+                self.video_path, 
+                self.target_fps, 
+                self.max_pixels, 
+                self.max_frames,
+                self.progress
+            )
+            self.stop_progress_polling()
+            
+            thresholds = sorted({0.0, 5.0, 10.0, 20.0, 40.0, 80.0, self.diff_threshold})
+            lines = []
+            for estimate in histogram.summary(thresholds):
+                marker = " <- 当前" if estimate["threshold"] == self.diff_threshold else ""
+                lines.append(
+                    f"阈值 {estimate['threshold']:g}: "
+                    f"{estimate['recolortrack_events']} 个事件, "
+                    f"约 {estimate['estimated_bytes'] / 1024 / 1024:.1f} MB{marker}"
+                )
+                logger.info(lines[-1])
+            
+            self.root.after(0, lambda: self.update_progress(100, "分析完成"))
+            self.root.after(0, lambda: 
+                Messagebox.show_info(
+                    f"分析完成！\n\n" \
+                    f"尺寸: {histogram.width}x{histogram.height}\n" \
+                    f"分析帧数: {histogram.frame_count}\n\n" + \
+                    "\n".join(lines), \
+                    "阈值分析"
+                )
+            )
+        except Exception as e:
+            logger.error(f"分析失败: {e}")
+            self.stop_progress_polling()
+            self.root.after(0, lambda: self.update_progress(0, "分析失败"))
+            self.root.after(0, lambda e=e: 
+                Messagebox.show_error(f"分析失败: {e}", "错误")
+            )
+        finally:
+            self.root.after(0, lambda: self.convert_button.configure(state="normal"))
+            self.root.after(0, lambda: self.preview_button.configure(state="normal"))
+            self.root.after(0, lambda: self.analyze_button.configure(state="normal"))
+    
+    def show_tuned_threshold(self, threshold: float):
+        """把按预算选定的阈值回填到界面"""
+        self.diff_threshold = threshold
+        def update_entry():
+            self.diff_entry.delete(0, END)
+            self.diff_entry.insert(0, str(threshold))
+        self.root.after(0, update_entry)
+    
     def update_progress(self, value, text):
         """更新进度条"""
         self.progress_var.set(value)
         self.progress_label.config(text=text)
     
+    def start_progress_polling(self):
+        """重置进度通道并开始按固定频率刷新进度条"""
+        self.progress.reset()
+        self._polling_progress = True
+        self._poll_progress()
+    
+    def stop_progress_polling(self):
+        """停止刷新进度条（可在工作线程中调用）"""
+        self._polling_progress = False
+    
+    def _poll_progress(self):
+        """读取进度快照并刷新界面，之后重新调度自身"""
+        if not self._polling_progress:
+            return
+        snapshot = self.progress.snapshot()
+        if snapshot["phase"]:
+            self.update_progress(snapshot["percent"], self.progress.describe(snapshot))
+        self.root.after(PROGRESS_POLL_INTERVAL, self._poll_progress)
+    
     def convert(self):
         """执行转换过程"""
         try:
             logger.info("开始转换视频到ADOFAI关卡")
             
-            # 更新进度
-            self.root.after(0, lambda: self.update_progress(10, "加载视频..."))
-            
-            # 确保处理器已初始化
-            if not hasattr(self, 'current_processor') or self.current_processor is None:
-                self._init_processors()
-            
-            # 使用当前选择的处理器
-            current_processor = self.current_processor
-            logger.info(f"使用处理器类型: {self.processor_type}")
-            
-            # 更新进度
-            self.root.after(0, lambda: self.update_progress(20, "提取视频帧..."))
-            
-            # 使用生成器模式处理视频，逐帧处理
-            processed_frames = []
-            frame_count = 0
-            
-            # 检查处理器是否可用
-            if not current_processor:
-                raise Exception("视频处理器初始化失败，请检查日志")
-            
-            # 检查处理器是否支持生成器方法
-            if hasattr(current_processor, 'process_video_generator'):
-                logger.info("使用流式处理模式")
-                
-                # 使用生成器逐帧处理
-                for i, frame_data in enumerate(current_processor.process_video_generator(
-                    self.video_path, 
-                    self.target_fps, 
-                    self.max_pixels, 
-                    self.max_frames
-                )):
-                    processed_frames.append(frame_data)
-                    frame_count = i + 1
-                    
-                    # 更新进度
-                    progress = 20 + (frame_count / (self.max_frames or 100)) * 30
-                    progress = min(50, progress)
-                    self.root.after(0, lambda i=frame_count: self.update_progress(progress, f"处理第 {i} 帧..."))
-            else:
-                # 回退到传统处理方式
-                logger.info("使用传统处理模式")
-                processed_frames = current_processor.process_video(
-                    self.video_path, 
-                    self.target_fps, 
-                    self.max_pixels, 
-                    self.max_frames
-                )
-                frame_count = len(processed_frames)
-                self.root.after(0, lambda: self.update_progress(50, f"处理完成 {frame_count} 帧"))
-            
-            # 生成关卡
-            self.root.after(0, lambda: self.update_progress(70, "生成ADOFAI关卡..."))
-            
-            video_to_adofai = VideoToADOFAI()
-            success = video_to_adofai.convert(
-                processed_frames, 
-                self.target_fps, 
-                self.output_path, 
-                self.diff_threshold
+            # 使用当前选择的处理器，首次使用时才初始化
+            from video_tool.converter import convert_video
+            max_bytes = int(self.max_size_mb * 1024 * 1024) if self.max_size_mb is not None else None
+            processor = self._get_processor()
+            stats = convert_video(
+                self.video_path,
+                self.output_path,
+                engine=self.active_engine,
+                target_fps=self.target_fps,
+                max_frames=self.max_frames,
+                max_pixels=self.max_pixels,
+                diff_threshold=self.diff_threshold,
+                max_events=self.max_events,
+                max_bytes=max_bytes,
+                progress=self.progress,
+                processor=processor
             )
+            if stats["diff_threshold"] != self.diff_threshold:
+                self.show_tuned_threshold(stats["diff_threshold"])
             
             # 更新进度
+            self.stop_progress_polling()
             self.root.after(0, lambda: self.update_progress(100, "转换完成！"))
             
             logger.info("转换完成！")
@@ -454,7 +541,8 @@ class VideoToADOFAIApp:
                 Messagebox.show_info(
                     f"转换完成！\n\n" \
                     f"视频: {os.path.basename(self.video_path)}\n" \
-                    f"提取帧数: {len(processed_frames)}\n" \
+                    f"提取帧数: {stats['frames']}\n" \
+                    f"事件数: {stats['total_events']}\n" \
                     f"目标帧率: {self.target_fps} fps\n" \
                     f"输出文件: {self.output_path}", \
                     "成功"
@@ -464,6 +552,7 @@ class VideoToADOFAIApp:
             logger.error(f"转换失败: {e}")
             
             # 更新进度
+            self.stop_progress_polling()
             self.root.after(0, lambda: self.update_progress(0, "转换失败"))
             
             # 显示错误消息
@@ -0,0 +1,201 @@
+# 动图帧源模块
+from common.Logger import get_logger
+logger = get_logger("动图解码")
+
+from typing import BinaryIO, Iterator, Optional
+import struct
+import cv2
+import numpy as np
+from PIL import Image
+
+from common.Profiler import stage
+from video_tool.decoders import DecodeError, VideoDecoder
+
+# 按动图逐帧解码的扩展名（静态图片也可以，按一帧处理）
+ANIMATED_IMAGE_EXTENSIONS = ('.gif', '.apng', '.png', '.webp')
+# 没有记录时长或时长为0的帧按100毫秒显示，与浏览器对GIF的处理一致
+DEFAULT_FRAME_DURATION: int = 100
+
+def is_animated_image(file_path: str) -> bool:
+    """按扩展名判断是否作为动图读取"""
+    return file_path.lower().endswith(ANIMATED_IMAGE_EXTENSIONS)
+
+def _duration_ms(duration) -> int:
+    """记录的帧时长换算为实际显示时长（毫秒）"""
+    return int(duration) if duration and duration > 0 else DEFAULT_FRAME_DURATION
+
+def frame_duration(image: Image.Image) -> int:
+    """当前帧的显示时长（毫秒）"""
+    return _duration_ms(image.info.get("duration"))
+
+def _skip_sub_blocks(f: BinaryIO):
+    """跳过GIF的数据子块序列"""
+    while True:
+        size = f.read(1)
+        if not size or size[0] == 0:
+            return
+        f.seek(size[0], 1)
+
+def _gif_durations(f: BinaryIO) -> Optional[list]:
+    """从GIF的图形控制扩展读取各帧时长，不解码图像数据"""
+    header = f.read(13)
+    if len(header) < 13:
+        return None
+    if header[10] & 0x80:
+        # 全局颜色表
+        f.seek(3 << ((header[10] & 0x07) + 1), 1)
+    durations = []
+    delay = None
+    while True:
+        block = f.read(1)
+        if not block or block == b";":
+            return durations
+        if block == b"!":
+            label = f.read(1)
+            if label == b"\xf9":
+                data = f.read(5)
+                if len(data) < 5:
+                    return None
+                # 延迟时间以1/100秒为单位
+                delay = struct.unpack("<H", data[2:4])[0] * 10
+            _skip_sub_blocks(f)
+        elif block == b",":
+            descriptor = f.read(9)
+            if len(descriptor) < 9:
+                return None
+            if descriptor[8] & 0x80:
+                # 局部颜色表
+                f.seek(3 << ((descriptor[8] & 0x07) + 1), 1)
+            # LZW最小码长
+            f.read(1)
+            _skip_sub_blocks(f)
+            durations.append(delay)
+            delay = None
+        else:
+            return None
+
+def _png_durations(f: BinaryIO) -> Optional[list]:
+    """从APNG的fcTL块读取各帧时长"""
+    f.read(8)
+    durations = []
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return durations
+        length, chunk_type = struct.unpack(">I4s", chunk)
+        if chunk_type == b"fcTL":
+            data = f.read(length)
+            if len(data) < 26:
+                return None
+            delay_num, delay_den = struct.unpack(">HH", data[20:24])
+            # 分母为0时按1/100秒计
+            durations.append(delay_num / (delay_den or 100) * 1000)
+            f.seek(4, 1)
+        elif chunk_type == b"IEND":
+            return durations
+        else:
+            f.seek(length + 4, 1)
+
+def _webp_durations(f: BinaryIO) -> Optional[list]:
+    """从WebP的ANMF块读取各帧时长"""
+    f.seek(12)
+    durations = []
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return durations
+        chunk_type, length = struct.unpack("<4sI", chunk)
+        if chunk_type == b"ANMF":
+            data = f.read(16)
+            if len(data) < 16:
+                return None
+            durations.append(int.from_bytes(data[12:15], "little"))
+            f.seek(length - 16 + (length & 1), 1)
+        else:
+            # 块按偶数字节对齐
+            f.seek(length + (length & 1), 1)
+
+def scan_frame_durations(file_path: str, image_format: Optional[str]) -> Optional[list]:
+    """只读取文件中的帧控制信息，返回各帧的显示时长（毫秒）；格式不支持或文件损坏时返回None"""
+    scanners = {"GIF": _gif_durations, "PNG": _png_durations, "WEBP": _webp_durations}
+    scanner = scanners.get(image_format)
+    if scanner is None:
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            durations = scanner(f)
+    except (OSError, struct.error) as e:
+        logger.warning(f"读取帧时长失败: {e}")
+        return None
+    return [_duration_ms(duration) for duration in durations] if durations is not None else None
+
+class AnimatedImageDecoder(VideoDecoder):
+    def __init__(self, file_path: str):
+        """用Pillow打开GIF、APNG或WebP动图，按需用 Image.seek 逐帧解码，不一次解码全部帧"""
+        self.file_path = file_path
+        try:
+            self.image = Image.open(file_path)
+        except OSError as e:
+            raise DecodeError(f"无法打开图片文件: {e}") from e
+        n_frames = getattr(self.image, "n_frames", 1)
+        # 各帧时长之和，用于报告进度；读取失败时按第一帧的时长估算
+        durations = scan_frame_durations(file_path, self.image.format) if n_frames > 1 else None
+        if durations is not None and len(durations) == n_frames:
+            self.total_duration = sum(durations)
+        else:
+            self.total_duration = n_frames * frame_duration(self.image)
+        # 帧率为平均帧率，只用于日志
+        self.info = {
+            "fps": n_frames * 1000 / self.total_duration,
+            "total_frames": n_frames,
+            "width": self.image.width,
+            "height": self.image.height
+        }
+
+    def duration(self) -> float:
+        """各帧显示时长之和（秒）"""
+        return self.total_duration / 1000
+
+    def frames(self, target_fps: float, max_pixels: int, max_frames: Optional[int] = None, start_frame: int = 0,
+               start_time: float = 0.0, end_time: Optional[float] = None) -> Iterator[tuple[int, np.ndarray]]:
+        """按每帧的显示时长取每个采样时刻正在显示的帧；原始分辨率的帧由引擎缩放"""
+
+        def slot_time(index: int) -> float:
+            """第index个采样帧在动图中的时刻（毫秒，取到微秒，避免浮点误差越过帧的边界）"""
+            return round((start_time + index / target_fps) * 1000, 3)
+
+        def finished(index: int) -> bool:
+            """采样帧序号或时刻已超出范围"""
+            return bool(max_frames and index >= max_frames) or (end_time is not None and slot_time(index) >= end_time * 1000)
+
+        frame_count = start_frame
+        if finished(frame_count):
+            logger.info(f"开始帧 {start_frame} 之后没有需要处理的帧")
+            return
+
+        # 当前帧的显示时间为 [frame_start, frame_start + 时长)
+        frame_start = 0
+        for index in range(self.info["total_frames"]):
+            # GIF和APNG的帧依赖前一帧，必须顺序定位；每次只保留当前帧。
+            # WebP在load时才更新帧的时长，所以定位后立即解码
+            with stage("decode"):
+                try:
+                    self.image.seek(index)
+                    self.image.load()
+                except (OSError, EOFError) as e:
+                    raise DecodeError(f"第 {index + 1} 帧解码失败: {e}") from e
+            frame_end = frame_start + frame_duration(self.image)
+            if slot_time(frame_count) < frame_end:
+                with stage("color_conversion"):
+                    pixels = cv2.cvtColor(np.asarray(self.image.convert("RGB")), cv2.COLOR_RGB2BGR)
+                # 一帧显示时间较长时覆盖多个采样时刻，重复产出以保持时间轴
+                while slot_time(frame_count) < frame_end and not finished(frame_count):
+                    yield frame_count, pixels
+                    frame_count += 1
+                if finished(frame_count):
+                    return
+            frame_start = frame_end
+
+    def close(self):
+        """关闭图片文件"""
+        self.image.close()
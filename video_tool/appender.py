@@ -0,0 +1,213 @@
+# 关卡追加模块
+from common.Logger import get_logger
+logger = get_logger("关卡追加")
+
+from typing import Optional
+import os
+import time
+
+from common.LevelBuilder import LevelBuilder, encode_value
+from common.Profiler import profiler, stage
+from common.Progress import ProgressTracker
+from common.StreamParser import StreamParser
+from video_tool.converter import validate_parameters
+from video_tool.engine_selector import resolve_engine
+from video_tool.packed_frame import PackedFrame
+from video_tool.video_to_adofai import VideoToADOFAI
+
+# 生成器输出中actions数组之后的固定结尾（与json.dump indent=2一致）
+LEVEL_TAIL = '\n  ],\n  "decorations": []\n}'
+# actions中相邻事件之间的分隔，事件位于第二层缩进
+ACTION_SEPARATOR = ',\n    '
+
+class LevelAppender:
+    def __init__(self, level_path: str, target_fps: float):
+        """从VideoToADOFAI生成的关卡恢复状态，只转换新增的帧并追加到文件末尾"""
+        self.level_path = level_path
+        self.fps = target_fps
+        self.width = 0
+        self.height = 0
+        # 砖块 -> 当前颜色（重放所有Recolortrack得到）
+        self.tile_colors: dict = {}
+        # 最后一个有事件的帧的序号及该帧着色的砖块
+        self.last_frame = 0
+        self.last_frame_tiles: dict = {}
+        self.total_events = 0
+        self.recolortrack_count = 0
+        self._tail = b''
+
+    def load(self):
+        """流式读取关卡（angleData或pathData格式），恢复网格尺寸、最后一帧的angleOffset和每个砖块的颜色"""
+        logger.info(f"读取已有关卡: {self.level_path}")
+        tile_count = None
+        last_offset = 0
+        position_events = []
+        for key, value in StreamParser(self.level_path):
+            if key == 'angleData' and isinstance(value, list):
+                tile_count = len(value)
+            elif key == 'pathData' and isinstance(value, str):
+                # pathData格式的关卡每个字符是一个砖块
+                tile_count = len(value)
+            elif key == 'action':
+                self.total_events += 1
+                event_type = value.get('eventType')
+                if event_type == 'PositionTrack':
+                    position_events.append(value)
+                elif event_type == 'RecolorTrack':
+                    tile, color, offset = self._parse_recolortrack(value)
+                    if offset < last_offset:
+                        raise ValueError("关卡中的Recolortrack不是按帧顺序排列的，可能已被优化或编辑，无法追加")
+                    if offset > last_offset:
+                        last_offset = offset
+                        self.last_frame_tiles = {}
+                    self.last_frame_tiles[tile] = color
+                    self.tile_colors[tile] = color
+                    self.recolortrack_count += 1
+
+        if not tile_count or not self.tile_colors:
+            raise ValueError("关卡中没有砖块或Recolortrack事件，不是视频转换生成的关卡")
+        # 每行末尾的PositionTrack向左移动一整行，没有换行时只有一行
+        self.width = -position_events[0]['positionOffset'][0] if position_events else tile_count
+        self.height = tile_count // self.width if self.width > 0 else 0
+        if self.width <= 0 or self.width * self.height != tile_count:
+            raise ValueError(f"无法从关卡恢复画面尺寸，砖块数: {tile_count}")
+
+        # angleOffset = 帧序号 * (180 / fps)
+        self.last_frame = round(last_offset * self.fps / 180)
+        if abs(self.last_frame * (180 / self.fps) - last_offset) > 1e-6:
+            raise ValueError(f"关卡的angleOffset与目标帧率 {self.fps} 不一致")
+
+        # 追加时替换actions末尾的PositionTrack和文件结尾，要求与生成器的输出完全一致
+        expected_positions = LevelBuilder(self.width, self.height).position_events()
+        if position_events != expected_positions:
+            raise ValueError("关卡的PositionTrack与视频转换生成的不一致，无法追加")
+        self._tail = (''.join(ACTION_SEPARATOR + encode_value(event, 2) for event in position_events) + LEVEL_TAIL).encode('utf-8')
+        with open(self.level_path, 'rb') as f:
+            f.seek(max(0, os.path.getsize(self.level_path) - len(self._tail)))
+            if f.read() != self._tail:
+                raise ValueError("关卡结尾与视频转换生成的格式不一致（可能已被编辑或优化），无法追加")
+
+        logger.info(f"恢复关卡状态: {self.width}x{self.height}，最后一帧: {self.last_frame + 1}，事件数: {self.total_events}")
+
+    def _parse_recolortrack(self, event: dict) -> tuple[int, str, float]:
+        """取出生成器写入的Recolortrack的砖块、颜色和angleOffset"""
+        start = event.get('startTile')
+        if (event.get('floor') != 1 or not isinstance(start, list) or len(start) != 2 or start[1] != 'Start'
+                or event.get('endTile') != start or event.get('duration', 0) != 0):
+            raise ValueError(f"关卡中包含不是视频转换生成的Recolortrack（startTile: {start}，endTile: {event.get('endTile')}），可能已被优化或编辑，无法追加")
+        return start[0], event.get('trackColor'), event.get('angleOffset', 0)
+
+    def check_reference_frame(self, frame: PackedFrame, diff_threshold: float):
+        """确认重新解码的最后一帧与关卡中记录的颜色一致"""
+        if frame.size != (self.width, self.height):
+            raise ValueError(f"视频帧尺寸 {frame.width}x{frame.height} 与关卡 {self.width}x{self.height} 不一致，请使用相同的最大像素数")
+        # 阈值为0时每个砖块的颜色都等于上一帧，否则只有最后一帧着色的砖块可以核对
+        tiles = self.tile_colors if diff_threshold == 0 else self.last_frame_tiles
+        colors = frame.packed().ravel()
+        for tile, color in tiles.items():
+            if f"{colors[tile - 1]:06x}" != color:
+                raise ValueError(f"视频第 {self.last_frame + 1} 帧与关卡中的颜色不一致，请使用相同的视频和参数")
+
+    def append(self, frames, diff_threshold: float, progress: Optional[ProgressTracker] = None) -> tuple[int, int]:
+        """从最后一帧开始的帧序列中生成新帧的事件并写入关卡，返回 (新帧数, 新事件数)"""
+        video_to_adofai = VideoToADOFAI()
+        frames = iter(frames)
+        prev_frame = next(frames, None)
+        if prev_frame is None:
+            raise ValueError(f"无法从视频中读取第 {self.last_frame + 1} 帧")
+        prev_frame = PackedFrame.coerce(prev_frame)
+        self.check_reference_frame(prev_frame, diff_threshold)
+        width, height = prev_frame.size
+
+        new_frames = 0
+        new_events = 0
+        cut = os.path.getsize(self.level_path) - len(self._tail)
+        with open(self.level_path, 'r+b') as f:
+            f.seek(cut)
+            f.truncate()
+            try:
+                for frame_index, frame in enumerate(frames, self.last_frame + 1):
+                    new_frames += 1
+                    frame = PackedFrame.coerce(frame)
+                    # 与generate_level相同：尺寸不同的帧跳过，但仍占用帧序号
+                    if frame.size != (width, height):
+                        logger.warning(f"第 {frame_index+1} 帧尺寸与第一帧不同，跳过")
+                        continue
+                    store = video_to_adofai.create_event_store()
+                    event_count = video_to_adofai.add_recolortrack_events(
+                        store, frame_index, frame, width, height, self.fps, diff_threshold, prev_frame
+                    )
+                    prev_frame = frame
+                    if event_count:
+                        with stage("serialization"):
+                            text = ''.join(ACTION_SEPARATOR + ACTION_SEPARATOR.join(texts) for texts in store.iter_text(2)).encode('utf-8')
+                        with stage("disk_write"):
+                            f.write(text)
+                        if progress is not None:
+                            progress.add_bytes(len(text))
+                    new_events += event_count
+                f.write(self._tail)
+            except BaseException:
+                # 恢复原来的文件内容
+                f.seek(cut)
+                f.truncate()
+                f.write(self._tail)
+                raise
+
+        self.total_events += new_events
+        self.recolortrack_count += new_events
+        return new_frames, new_events
+
+def append_video(video_path: str, level_path: str, engine: str = "traditional", target_fps: float = 10.0,
+                 max_frames: Optional[int] = None, max_pixels: int = 300000, diff_threshold: float = 10.0,
+                 progress: Optional[ProgressTracker] = None, processor=None, decoder: str = "opencv",
+                 start_time: float = 0.0, end_time: Optional[float] = None) -> dict:
+    """把视频中关卡尚未包含的帧追加到已有关卡，结果与用相同参数完整转换一致，返回统计信息
+
+    参数（包括引擎、解码后端和开始时间）必须与生成关卡时相同；max_frames为追加后的总帧数，None表示直到视频结束；
+    end_time为追加到的时间（秒），None表示直到视频结束
+    """
+    validate_parameters(target_fps, max_frames, max_pixels, diff_threshold, start_time=start_time, end_time=end_time)
+    if not os.path.isfile(video_path):
+        raise FileNotFoundError(f"视频文件不存在: {video_path}")
+    if not os.path.isfile(level_path):
+        raise FileNotFoundError(f"关卡文件不存在: {level_path}")
+
+    clock_start = time.perf_counter()
+    with profiler.run("video_append") as profile_run:
+        appender = LevelAppender(level_path, target_fps)
+        with stage("load_level"):
+            appender.load()
+        if max_frames is not None and max_frames <= appender.last_frame:
+            raise ValueError(f"关卡已包含 {appender.last_frame + 1} 帧，超过最大帧数 {max_frames}")
+
+        if processor is None:
+            engine, processor = resolve_engine(engine, video_path, target_fps, max_pixels, decoder)
+        # 从关卡的最后一帧开始解码，该帧只作为比较的基准
+        frames = processor.process_video_generator(video_path, target_fps, max_pixels, max_frames, progress, start_frame=appender.last_frame,
+                                                   start_time=start_time, end_time=end_time)
+        new_frames, new_events = appender.append(frames, diff_threshold, progress)
+
+    stats = {
+        "video_path": video_path,
+        "output_path": level_path,
+        "engine": engine,
+        "decoder": processor.decoder,
+        "target_fps": target_fps,
+        "start_time": start_time,
+        "end_time": end_time,
+        "diff_threshold": diff_threshold,
+        "frames": appender.last_frame + 1 + new_frames,
+        "new_frames": new_frames,
+        "width": appender.width,
+        "height": appender.height,
+        "tiles": appender.width * appender.height,
+        "recolortrack_events": appender.recolortrack_count,
+        "new_events": new_events,
+        "total_events": appender.total_events,
+        "bytes": os.path.getsize(level_path),
+        "seconds": round(time.perf_counter() - clock_start, 3),
+        "profile_report": profile_run.report_path
+    }
+    logger.info(f"追加统计: {stats}")
+    return stats
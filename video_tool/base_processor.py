@@ -0,0 +1,163 @@
+# 视频处理公共模块
+from common.Logger import get_logger
+logger = get_logger("视频处理")
+
+from typing import Iterator, Optional
+import gc
+import cv2
+import numpy as np
+from PIL import Image
+from common.Progress import ProgressTracker
+from common.Profiler import stage
+from video_tool.decoders import DEFAULT_DECODER, DecodeError, OpenCVDecoder, check_decoder, open_decoder, scaled_size, video_info
+from video_tool.packed_frame import PackedFrame, legacy_frame_bytes
+
+class BaseVideoProcessor:
+    """所有处理引擎共用的解码与采样：由解码后端按目标帧率解码帧，再交给子类的 process_decoded 缩放和提取像素
+
+    子类只需实现 process_decoded（输入为解码出的BGR数组，返回PackedFrame），
+    需要额外释放资源（如GPU缓存）时覆盖 release_memory
+    """
+
+    def __init__(self, decoder: str = DEFAULT_DECODER):
+        """decoder为解码后端，见 video_tool.decoders.DECODERS"""
+        check_decoder(decoder)
+        self.decoder = decoder
+
+    def load_video(self, file_path: str) -> cv2.VideoCapture:
+        """加载视频文件"""
+        logger.info(f"加载视频: {file_path}")
+        try:
+            video = cv2.VideoCapture(file_path)
+            if not video.isOpened():
+                raise DecodeError("无法打开视频文件")
+
+            # 获取视频信息
+            info = self.get_video_info(video)
+            logger.info(f"视频信息: FPS={info['fps']:.2f}, 总帧数={info['total_frames']}, 分辨率={info['width']}x{info['height']}")
+            return video
+        except Exception as e:
+            logger.error(f"视频加载失败: {e}")
+            raise
+
+    def get_video_info(self, video: cv2.VideoCapture) -> dict:
+        """获取视频信息"""
+        try:
+            return video_info(video)
+        except Exception as e:
+            logger.error(f"获取视频信息失败: {e}")
+            raise
+
+    def decode_to_image(self, frame: np.ndarray) -> Image.Image:
+        """把OpenCV解码出的BGR数组转换为RGB的PIL图片"""
+        with stage("color_conversion"):
+            return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    def extract_frames(self, video: cv2.VideoCapture, target_fps: float, max_frames: Optional[int] = None) -> list[Image.Image]:
+        """根据目标帧率提取视频帧"""
+        logger.info(f"开始提取视频帧，目标帧率: {target_fps}")
+
+        try:
+            frames = [self.decode_to_image(frame) for _, frame in OpenCVDecoder(video=video).frames(target_fps, 0, max_frames)]
+            logger.info(f"帧提取完成，共提取 {len(frames)} 帧")
+            return frames
+        except Exception as e:
+            logger.error(f"帧提取失败: {e}")
+            raise
+
+    def process_decoded(self, frame: np.ndarray, max_pixels: int) -> PackedFrame:
+        """处理一帧解码出的BGR数组，返回紧凑的RGB帧；由各引擎实现"""
+        raise NotImplementedError
+
+    def release_memory(self):
+        """释放不再使用的内存"""
+        gc.collect()
+
+    def process_video(self, file_path: str, target_fps: float, max_pixels: int, max_frames: Optional[int] = None, progress: Optional[ProgressTracker] = None,
+                      start_time: float = 0.0, end_time: Optional[float] = None) -> list[PackedFrame]:
+        """完整处理视频，返回处理后的帧序列"""
+        logger.info(f"开始处理视频: {file_path}")
+
+        try:
+            # 使用生成器版本处理视频
+            processed_frames = list(self.process_video_generator(file_path, target_fps, max_pixels, max_frames, progress,
+                                                              start_time=start_time, end_time=end_time))
+            logger.info("视频处理完成")
+            return processed_frames
+        except Exception as e:
+            logger.error(f"视频处理失败: {e}")
+            raise
+
+    def process_video_generator(self, file_path: str, target_fps: float, max_pixels: int, max_frames: Optional[int] = None, progress: Optional[ProgressTracker] = None, start_frame: int = 0,
+                                start_time: float = 0.0, end_time: Optional[float] = None) -> Iterator[PackedFrame]:
+        """使用生成器模式处理视频，逐帧处理，减少内存使用
+
+        start_time/end_time为转换的时间段（秒），end_time为None表示直到视频结束；
+        start_frame为时间段内开始的采样帧序号，max_frames包括之前跳过的帧
+        """
+        import psutil
+
+        logger.info(f"开始流式处理视频: {file_path}")
+
+        decoder = None
+        processed = 0
+        try:
+            # 打开视频
+            decoder = open_decoder(self.decoder, file_path)
+            info = decoder.info
+            logger.info(f"视频信息: FPS={info['fps']:.2f}, 总帧数={info['total_frames']}, 分辨率={info['width']}x{info['height']}")
+            if start_time or end_time is not None:
+                logger.info(f"转换时间段: {start_time:g} 秒 - {'结束' if end_time is None else f'{end_time:g} 秒'}")
+
+            # 报告预计处理的帧数
+            if progress is not None:
+                progress.set_total_frames(decoder.expected_frames(target_fps, max_frames, start_frame, start_time, end_time))
+                progress.set_phase('decode')
+
+            for frame_count, frame in decoder.frames(target_fps, max_pixels, max_frames, start_frame, start_time, end_time):
+                # 监控内存使用
+                if frame_count % 10 == 0:
+                    memory = psutil.virtual_memory()
+                    logger.debug(f"内存使用: {memory.percent:.1f}%, 已处理帧: {frame_count}")
+
+                    # 如果内存使用过高，进行垃圾回收
+                    if memory.percent > 80:
+                        logger.warning(f"内存使用过高: {memory.percent:.1f}%, 执行垃圾回收")
+                        self.release_memory()
+                        memory = psutil.virtual_memory()
+                        logger.info(f"垃圾回收后内存使用: {memory.percent:.1f}%")
+
+                # 处理帧
+                logger.info(f"处理第 {frame_count+1} 帧")
+                packed_frame = self.process_decoded(frame, max_pixels)
+                processed += 1
+                if progress is not None:
+                    progress.add_frames(1)
+                if frame_count == start_frame:
+                    logger.info(
+                        f"每帧像素数据: {packed_frame.nbytes} 字节，"
+                        f"逐像素元组格式约 {legacy_frame_bytes(packed_frame.width, packed_frame.height)} 字节"
+                    )
+
+                # 生成处理结果
+                yield packed_frame
+
+                # 释放不再使用的帧数据
+                del frame
+                del packed_frame
+
+                # 每处理几帧后进行一次垃圾回收
+                if frame_count % 5 == 0:
+                    self.release_memory()
+
+            # 最后进行一次垃圾回收
+            self.release_memory()
+            logger.info(f"流式处理完成，共处理 {processed} 帧")
+        except Exception as e:
+            logger.error(f"视频处理失败: {e}")
+            self.release_memory()
+            raise
+        finally:
+            # 确保解码器被释放（包括调用方提前结束迭代的情况）
+            if decoder is not None:
+                decoder.close()
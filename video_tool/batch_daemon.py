@@ -0,0 +1,409 @@
+# 批量转换守护模块
+from common.Logger import get_logger
+logger = get_logger("批量转换")
+
+from typing import Optional
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+# 监视的视频扩展名，与界面的文件选择框一致
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.wmv', '.mkv')
+# 写入过程中的临时文件后缀，完成后原子替换为正式文件
+PARTIAL_SUFFIX = '.part'
+STATS_FILE_NAME = 'stats.jsonl'
+
+def _apply_memory_limit(memory_limit: Optional[int]):
+    """在工作进程内限制地址空间大小（仅POSIX系统支持）"""
+    if memory_limit is None:
+        return
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"无法设置内存上限，只能依靠主进程检查常驻内存: {e}")
+
+def _peak_rss_bytes() -> Optional[int]:
+    """当前进程启动以来的最大常驻内存"""
+    try:
+        import resource
+        # Linux下ru_maxrss单位为KB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+def _worker_main(worker_id: int, job_queue, result_queue, engine: str, options: dict, memory_limit: Optional[int]):
+    """工作进程主循环：预先导入处理引擎，之后反复从自己的队列中取任务；启动失败时报告错误后退出"""
+    try:
+        from video_tool.engines import AUTO_ENGINE, create_processor
+        # CUDA会预留远超实际用量的虚拟地址空间，PyTorch引擎（以及可能选中它的自动引擎）只依靠主进程检查常驻内存
+        if engine not in ('pytorch', AUTO_ENGINE):
+            _apply_memory_limit(memory_limit)
+
+        # 在第一个任务之前导入cv2/torch并创建处理器，之后所有任务复用；自动引擎在第一个任务的视频上测速后创建
+        from video_tool.converter import convert_video
+        from video_tool.engine_selector import resolve_engine
+        decoder = options.get("decoder", "opencv")
+        processor = create_processor(engine, decoder) if engine != AUTO_ENGINE else None
+    except Exception as e:
+        # 例如未安装torch时使用PyTorch引擎；重启进程也无法恢复，交给主进程停止
+        result_queue.put({"type": "startup_failed", "worker_id": worker_id, "pid": os.getpid(), "error": str(e)})
+        return
+    result_queue.put({"type": "ready", "worker_id": worker_id, "pid": os.getpid()})
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+
+        result = {"type": "result", "worker_id": worker_id, "job_id": job["job_id"]}
+        try:
+            if processor is None:
+                engine, processor = resolve_engine(engine, job["video_path"], options.get("target_fps", 10.0), options.get("max_pixels", 300000), decoder)
+            stats = convert_video(
+                job["video_path"],
+                job["partial_path"],
+                engine=engine,
+                processor=processor,
+                **options
+            )
+            os.replace(job["partial_path"], job["output_path"])
+            stats["output_path"] = job["output_path"]
+            result.update(status="ok", stats=stats)
+        except MemoryError:
+            result.update(status="memory", error="超出内存上限")
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        finally:
+            if os.path.exists(job["partial_path"]):
+                os.remove(job["partial_path"])
+        result["worker_peak_rss_bytes"] = _peak_rss_bytes()
+        result_queue.put(result)
+
+class _Worker:
+    def __init__(self, worker_id: int, process, job_queue):
+        """主进程中对一个工作进程的记录"""
+        self.worker_id = worker_id
+        self.process = process
+        self.job_queue = job_queue
+        self.ready = False
+        self.job: Optional[dict] = None
+        self.job_started: float = 0.0
+
+class BatchDaemon:
+    def __init__(self, input_dir: str, output_dir: str, workers: int = 2, engine: str = "traditional",
+                 job_timeout: Optional[float] = None, memory_limit_mb: Optional[float] = None,
+                 poll_interval: float = 2.0, stats_path: Optional[str] = None, **options):
+        """监视输入目录，用固定数量的常驻工作进程并发转换新视频
+
+        options为传给convert_video的转换参数（target_fps、max_frames、max_pixels、diff_threshold等）
+        """
+        from video_tool.converter import ParameterError
+        if workers <= 0:
+            raise ParameterError("工作进程数必须大于0")
+        if job_timeout is not None and job_timeout <= 0:
+            raise ParameterError("任务超时时间必须大于0")
+        if memory_limit_mb is not None and memory_limit_mb <= 0:
+            raise ParameterError("内存上限必须大于0")
+        if not os.path.isdir(input_dir):
+            raise FileNotFoundError(f"输入目录不存在: {input_dir}")
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.worker_count = workers
+        self.engine = engine
+        self.job_timeout = job_timeout
+        self.memory_limit = int(memory_limit_mb * 1024 * 1024) if memory_limit_mb is not None else None
+        self.poll_interval = poll_interval
+        self.stats_path = stats_path or os.path.join(output_dir, STATS_FILE_NAME)
+        self.options = options
+
+        # 使用spawn启动，避免fork后继承主进程的CUDA上下文和线程状态
+        self._context = multiprocessing.get_context("spawn")
+        self._result_queue = self._context.Queue()
+        self._workers: list[_Worker] = []
+        self._pending: list[dict] = []
+        # 路径 -> (大小, 修改时间)，连续两次扫描不变才认为上传完成
+        self._observed: dict = {}
+        # 已入队的文件 -> 入队时的(大小, 修改时间)，同名文件被重新上传后会再次转换
+        self._known: dict = {}
+        self._next_job_id = 1
+        self._stopping = False
+        # 工作进程启动失败的原因，设置后不再重启进程
+        self.startup_error: Optional[str] = None
+        self.completed = 0
+        self.failed = 0
+
+    def _spawn_worker(self, worker_id: int) -> _Worker:
+        """启动一个工作进程"""
+        job_queue = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, job_queue, self._result_queue, self.engine, self.options, self.memory_limit),
+            name=f"adofai-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        logger.info(f"启动工作进程 {worker_id}，PID: {process.pid}")
+        return _Worker(worker_id, process, job_queue)
+
+    def _output_path(self, video_path: str) -> str:
+        """视频对应的输出关卡路径"""
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        return os.path.join(self.output_dir, name + ".adofai")
+
+    def scan(self):
+        """扫描输入目录，把大小稳定的新视频加入队列"""
+        try:
+            names = sorted(os.listdir(self.input_dir))
+        except OSError as e:
+            logger.error(f"扫描输入目录失败: {e}")
+            return
+
+        for name in names:
+            if not name.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+            path = os.path.join(self.input_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            if self._known.get(path) == signature:
+                continue
+
+            # 上传中的文件大小仍在变化，等下一次扫描
+            if self._observed.get(path) != signature:
+                self._observed[path] = signature
+                continue
+            del self._observed[path]
+            self._known[path] = signature
+
+            output_path = self._output_path(path)
+            if os.path.exists(output_path) and os.path.getmtime(output_path) >= stat.st_mtime:
+                logger.info(f"已存在输出，跳过: {name}")
+                continue
+
+            job = {
+                "job_id": self._next_job_id,
+                "video_path": path,
+                "output_path": output_path,
+                "partial_path": output_path + PARTIAL_SUFFIX,
+                "size": stat.st_size,
+                "queued_at": time.time()
+            }
+            self._next_job_id += 1
+            self._pending.append(job)
+            logger.info(f"加入队列: {name}（任务 {job['job_id']}）")
+
+    def _dispatch(self):
+        """把排队的任务分配给空闲的工作进程"""
+        for worker in self._workers:
+            if not self._pending:
+                return
+            # 只分配给已完成预加载的进程，任务计时不包含导入引擎的时间
+            if worker.ready and worker.job is None and worker.process.is_alive():
+                worker.job = self._pending.pop(0)
+                worker.job_started = time.monotonic()
+                worker.job["started_at"] = time.time()
+                worker.job_queue.put(worker.job)
+                logger.info(f"工作进程 {worker.worker_id} 开始任务 {worker.job['job_id']}: {worker.job['video_path']}")
+
+    def _collect_results(self, timeout: float) -> bool:
+        """等待并处理工作进程返回的一条消息，超时则返回False"""
+        try:
+            message = self._result_queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        worker = self._workers[message["worker_id"]]
+        if message["type"] == "ready":
+            if worker.process.pid == message["pid"]:
+                worker.ready = True
+                logger.info(f"工作进程 {message['worker_id']} 已就绪")
+        elif message["type"] == "startup_failed":
+            if worker.process.pid == message["pid"]:
+                self._startup_failed(worker, message["error"])
+        elif worker.job is not None and worker.job["job_id"] == message["job_id"]:
+            self._finish(worker, message["status"], message)
+        return True
+
+    def _startup_failed(self, worker: _Worker, error: str):
+        """工作进程在就绪前退出：排队中的任务全部记为失败并停止，不再重启进程"""
+        if self.startup_error is not None:
+            return
+        self.startup_error = error
+        logger.error(f"工作进程 {worker.worker_id} 启动失败: {error}")
+        for job in self._pending:
+            self.failed += 1
+            self._write_stats({
+                "job_id": job["job_id"],
+                "video_path": job["video_path"],
+                "output_path": None,
+                "status": "startup_failed",
+                "error": error,
+                "input_bytes": job["size"],
+                "queued_at": job["queued_at"],
+                "worker_id": worker.worker_id,
+                "worker_pid": worker.process.pid
+            })
+        self._pending.clear()
+        self._stopping = True
+
+    def _finish(self, worker: _Worker, status: str, message: Optional[dict] = None):
+        """记录一个任务的结果并写入统计日志"""
+        job = worker.job
+        worker.job = None
+        message = message or {}
+        stats = message.get("stats") or {}
+        record = {
+            "job_id": job["job_id"],
+            "video_path": job["video_path"],
+            "output_path": job["output_path"] if status == "ok" else None,
+            "status": status,
+            "error": message.get("error"),
+            "input_bytes": job["size"],
+            "queued_at": job["queued_at"],
+            "started_at": job["started_at"],
+            "wait_seconds": round(job["started_at"] - job["queued_at"], 3),
+            "duration_seconds": round(time.monotonic() - worker.job_started, 3),
+            "frames": stats.get("frames"),
+            "width": stats.get("width"),
+            "height": stats.get("height"),
+            "diff_threshold": stats.get("diff_threshold"),
+            "recolortrack_events": stats.get("recolortrack_events"),
+            "total_events": stats.get("total_events"),
+            "bytes": stats.get("bytes"),
+            "worker_id": worker.worker_id,
+            "worker_pid": worker.process.pid,
+            "worker_peak_rss_bytes": message.get("worker_peak_rss_bytes")
+        }
+
+        if status == "ok":
+            self.completed += 1
+            logger.info(f"任务 {job['job_id']} 完成，耗时 {record['duration_seconds']} 秒，{record['total_events']} 个事件")
+        else:
+            self.failed += 1
+            logger.error(f"任务 {job['job_id']} 失败（{status}）: {record['error']}")
+        self._write_stats(record)
+
+    def _write_stats(self, record: dict):
+        """向统计日志追加一条任务记录"""
+        try:
+            with open(self.stats_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"写入统计日志失败: {e}")
+
+    def _worker_rss(self, worker: _Worker) -> Optional[int]:
+        """工作进程当前的常驻内存（需要psutil）"""
+        try:
+            import psutil
+            return psutil.Process(worker.process.pid).memory_info().rss
+        except Exception:
+            return None
+
+    def _restart_worker(self, worker: _Worker, status: str, error: str, respawn: bool = True):
+        """终止卡住或超限的工作进程，记录任务失败并补充新的进程（respawn为False时不补充）"""
+        logger.warning(f"终止工作进程 {worker.worker_id}: {error}")
+        worker.process.terminate()
+        worker.process.join(5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+        if worker.job is not None:
+            partial_path = worker.job["partial_path"]
+            self._finish(worker, status, {"error": error})
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        if respawn:
+            self._workers[worker.worker_id] = self._spawn_worker(worker.worker_id)
+
+    def _check_workers(self):
+        """检查任务超时、内存超限和意外退出的工作进程"""
+        for worker in list(self._workers):
+            if not worker.process.is_alive():
+                if not worker.ready:
+                    # 先处理已到达的消息：进程可能已报告就绪或启动失败的原因
+                    while self._collect_results(0):
+                        pass
+                if not worker.ready:
+                    self._startup_failed(worker, f"工作进程启动时退出，退出码: {worker.process.exitcode}")
+                    continue
+                # 启动失败后只记录进行中任务的结果，不再补充进程
+                if self.startup_error is not None and worker.job is None:
+                    continue
+                self._restart_worker(worker, "crashed", f"工作进程意外退出，退出码: {worker.process.exitcode}",
+                                     respawn=self.startup_error is None)
+                continue
+            if worker.job is None:
+                continue
+            elapsed = time.monotonic() - worker.job_started
+            if self.job_timeout is not None and elapsed > self.job_timeout:
+                self._restart_worker(worker, "timeout", f"任务超过 {self.job_timeout} 秒")
+                continue
+            if self.memory_limit is not None:
+                rss = self._worker_rss(worker)
+                if rss is not None and rss > self.memory_limit:
+                    self._restart_worker(worker, "memory", f"常驻内存 {rss / 1024 / 1024:.0f} MB 超出上限")
+
+    def _busy(self) -> bool:
+        """是否还有排队中或进行中的任务"""
+        return bool(self._pending) or any(worker.job is not None for worker in self._workers)
+
+    def stop(self, *args):
+        """请求停止（可作为信号处理函数）"""
+        logger.info("收到停止请求，等待进行中的任务结束")
+        self._stopping = True
+
+    def run(self, once: bool = False):
+        """主循环；once为True时处理完目录中已有的视频后退出"""
+        logger.info(f"开始监视目录: {self.input_dir}，工作进程数: {self.worker_count}")
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, self.stop)
+
+        self._workers = [self._spawn_worker(worker_id) for worker_id in range(self.worker_count)]
+        try:
+            if once:
+                # 单次模式不等待上传完成，直接把当前文件视为稳定
+                self.scan()
+                self.scan()
+            while not self._stopping:
+                if not once:
+                    self.scan()
+                self._dispatch()
+                self._collect_results(self.poll_interval)
+                self._check_workers()
+                if once and not self._busy():
+                    break
+
+            # 停止时不再分配新任务，等待进行中的任务
+            self._pending.clear()
+            while self._busy():
+                self._collect_results(self.poll_interval)
+                self._check_workers()
+        except KeyboardInterrupt:
+            logger.warning("已被用户中断，终止所有工作进程")
+            for worker in self._workers:
+                worker.process.terminate()
+                if worker.job is not None and os.path.exists(worker.job["partial_path"]):
+                    os.remove(worker.job["partial_path"])
+            raise
+        finally:
+            self.shutdown()
+        logger.info(f"批量转换结束，成功 {self.completed} 个，失败 {self.failed} 个")
+        if self.startup_error is not None:
+            raise Exception(f"工作进程启动失败: {self.startup_error}")
+
+    def shutdown(self):
+        """通知所有工作进程退出"""
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.job_queue.put(None)
+        for worker in self._workers:
+            worker.process.join(10)
+            if worker.process.is_alive():
+                worker.process.terminate()
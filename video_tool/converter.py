@@ -0,0 +1,160 @@
+# 无界面视频转换模块
+from common.Logger import get_logger
+logger = get_logger("视频转换")
+
+from typing import Optional
+import os
+import time
+
+from common.LevelBuilder import check_tile_format
+from common.Profiler import profiler, stage
+from common.Progress import ProgressTracker
+from video_tool.engine_selector import resolve_engine
+
+class BudgetError(Exception):
+    """预算过小，任何阈值都无法满足"""
+
+class ParameterError(ValueError):
+    """转换参数不合法"""
+
+def validate_parameters(target_fps: float, max_frames: Optional[int], max_pixels: int, diff_threshold: float,
+                        max_events: Optional[int] = None, max_bytes: Optional[int] = None,
+                        start_time: float = 0.0, end_time: Optional[float] = None,
+                        encode_workers: int = 1, palette_frames: int = 10):
+    """检查转换参数，与界面的输入校验规则一致，不合法时抛出ParameterError"""
+    if target_fps <= 0:
+        raise ParameterError("目标帧率必须大于0")
+    if diff_threshold < 0:
+        raise ParameterError("颜色差异阈值不能为负数")
+    if max_frames is not None and max_frames <= 0:
+        raise ParameterError("最大帧数必须大于0")
+    if max_pixels <= 0:
+        raise ParameterError("最大像素数必须大于0")
+    if max_events is not None and max_events <= 0:
+        raise ParameterError("最大事件数必须大于0")
+    if max_bytes is not None and max_bytes <= 0:
+        raise ParameterError("最大文件大小必须大于0")
+    if start_time < 0:
+        raise ParameterError("开始时间不能为负数")
+    if end_time is not None and end_time <= start_time:
+        raise ParameterError("结束时间必须大于开始时间")
+    if encode_workers < 0:
+        raise ParameterError("序列化进程数不能为负数")
+    if palette_frames <= 0:
+        raise ParameterError("用于生成调色板的帧数必须大于0")
+
+def convert_video(video_path: str, output_path: str, engine: str = "traditional", target_fps: float = 10.0,
+                  max_frames: Optional[int] = 100, max_pixels: int = 300000, diff_threshold: float = 10.0,
+                  max_events: Optional[int] = None, max_bytes: Optional[int] = None,
+                  progress: Optional[ProgressTracker] = None, processor=None, tile_format: str = "angleData",
+                  encode_workers: int = 1, palette: Optional[str] = None, palette_frames: int = 10,
+                  decoder: str = "opencv", start_time: float = 0.0, end_time: Optional[float] = None) -> dict:
+    """完整的视频转换流程：处理视频帧、按预算选择阈值、生成并保存关卡，返回统计信息
+
+    tile_format为"pathData"时砖块数据写成每块一个字符的字符串，文件更小、加载更快；
+    encode_workers为保存时并行序列化事件的进程数，0表示使用全部核心，输出与串行完全一致；
+    palette为"adaptive"（无损）或"fixed"（用前palette_frames帧量化为256色，有损）时帧按调色板下标保存；
+    decoder为解码后端（opencv、ffmpeg或pyav），传入processor时使用processor自己的解码后端；
+    start_time/end_time为转换的时间段（秒），关卡的时间轴从start_time开始计算
+    """
+    validate_parameters(target_fps, max_frames, max_pixels, diff_threshold, max_events, max_bytes, start_time, end_time,
+                        encode_workers, palette_frames)
+    check_tile_format(tile_format)
+    from video_tool.decoders import check_decoder
+    check_decoder(decoder)
+    if not os.path.isfile(video_path):
+        raise FileNotFoundError(f"视频文件不存在: {video_path}")
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    if not os.path.isdir(output_dir):
+        raise NotADirectoryError(f"输出目录不存在: {output_dir}")
+
+    from video_tool.video_to_adofai import VideoToADOFAI
+    from video_tool.palette import FrameIndexer
+    from video_tool.decoders import DecodeError
+    indexer = FrameIndexer(palette, palette_frames) if palette is not None else None
+
+    clock_start = time.perf_counter()
+    with profiler.run("video_convert") as profile_run:
+        if processor is None:
+            # engine为auto时在视频开头的几帧上测速选择，统计中记录实际使用的引擎
+            engine, processor = resolve_engine(engine, video_path, target_fps, max_pixels, decoder)
+        logger.info(f"使用处理器类型: {engine}，解码后端: {processor.decoder}")
+
+        # 使用生成器模式处理视频，逐帧处理
+        processed_frames = []
+        with stage("frame_collection"):
+            frames = processor.process_video_generator(video_path, target_fps, max_pixels, max_frames, progress,
+                                                       start_time=start_time, end_time=end_time)
+            if indexer is not None:
+                frames = indexer.index_frames(frames)
+            for frame_data in frames:
+                processed_frames.append(frame_data)
+
+        if not processed_frames:
+            raise DecodeError("没有从视频中读取到任何帧")
+        if indexer is not None:
+            logger.info(f"调色板颜色数: {indexer.palette.size}，帧数据共 {sum(frame.nbytes for frame in processed_frames)} 字节")
+
+        # 按预算自动选择颜色差异阈值
+        if max_events is not None or max_bytes is not None:
+            diff_threshold = tune_threshold(processed_frames, target_fps, max_events, max_bytes, tile_format)
+
+        # 生成并保存关卡
+        video_to_adofai = VideoToADOFAI(tile_format, encode_workers)
+        video_to_adofai.convert(processed_frames, target_fps, output_path, diff_threshold, progress)
+
+    first_frame_data, width, height = processed_frames[0]
+    stats = {
+        "video_path": video_path,
+        "output_path": output_path,
+        "engine": engine,
+        "decoder": processor.decoder,
+        "target_fps": target_fps,
+        "start_time": start_time,
+        "end_time": end_time,
+        "diff_threshold": diff_threshold,
+        "tile_format": tile_format,
+        "palette": palette,
+        "palette_colors": indexer.palette.size if indexer is not None else None,
+        "frames": len(processed_frames),
+        "width": width,
+        "height": height,
+        "tiles": width * height,
+        "recolortrack_events": video_to_adofai.recolortrack_count,
+        "total_events": len(video_to_adofai.actions),
+        "bytes": os.path.getsize(output_path),
+        "seconds": round(time.perf_counter() - clock_start, 3),
+        "profile_report": profile_run.report_path
+    }
+    logger.info(f"转换统计: {stats}")
+    return stats
+
+def tune_threshold(processed_frames: list, target_fps: float, max_events: Optional[int], max_bytes: Optional[int],
+                   tile_format: str = "angleData") -> float:
+    """在已处理帧的颜色距离直方图上查找满足预算的最小阈值"""
+    from video_tool.threshold_analyzer import ThresholdAnalyzer
+
+    histogram = ThresholdAnalyzer(tile_format).analyze(processed_frames, target_fps)
+    threshold = histogram.find_threshold(max_events, max_bytes)
+    if threshold is None:
+        raise BudgetError("预算过小，即使只保留第一帧也无法满足")
+    return threshold
+
+def analyze_video_file(video_path: str, engine: str = "traditional", target_fps: float = 10.0,
+                       max_frames: Optional[int] = 100, max_pixels: int = 300000,
+                       progress: Optional[ProgressTracker] = None, processor=None, tile_format: str = "angleData",
+                       decoder: str = "opencv", start_time: float = 0.0, end_time: Optional[float] = None):
+    """无界面的阈值分析，返回颜色距离直方图"""
+    validate_parameters(target_fps, max_frames, max_pixels, 0.0, start_time=start_time, end_time=end_time)
+    check_tile_format(tile_format)
+    from video_tool.decoders import check_decoder
+    check_decoder(decoder)
+    if not os.path.isfile(video_path):
+        raise FileNotFoundError(f"视频文件不存在: {video_path}")
+
+    from video_tool.threshold_analyzer import analyze_video
+
+    if processor is None:
+        engine, processor = resolve_engine(engine, video_path, target_fps, max_pixels, decoder)
+    with profiler.run("video_analyze"):
+        return analyze_video(processor, video_path, target_fps, max_pixels, max_frames, progress, tile_format, start_time, end_time)
@@ -0,0 +1,322 @@
+# 视频解码模块
+from common.Logger import get_logger
+logger = get_logger("视频解码")
+
+from typing import Iterator, Optional
+import math
+import os
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+from common.Profiler import stage
+
+# opencv：cv2.VideoCapture解码原始分辨率的帧，由引擎缩放；
+# ffmpeg：ffmpeg子进程用fps和scale滤镜直接输出目标帧率、目标尺寸的帧；
+# pyav：PyAV多线程解码，抽帧间隔较大时跳过非参考帧，解码时缩放
+DECODERS = ("opencv", "ffmpeg", "pyav")
+DEFAULT_DECODER = "opencv"
+# 环境变量：ffmpeg可执行文件的路径，默认在PATH中查找
+ENV_FFMPEG: str = "PICTOADOFAI_FFMPEG"
+
+class DecodeError(Exception):
+    """输入文件无法打开或解码"""
+
+def scaled_size(width: int, height: int, max_pixels: int) -> tuple[int, int]:
+    """保持长宽比、像素数不超过max_pixels的 (宽度, 高度)，已经足够小时返回原尺寸"""
+    if width * height <= max_pixels:
+        return width, height
+    scale = math.sqrt(max_pixels / (width * height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def check_decoder(decoder: str):
+    """检查解码后端名称"""
+    if decoder not in DECODERS:
+        raise ValueError(f"不支持的解码后端: {decoder}，可选: {', '.join(DECODERS)}")
+
+def probe_video(file_path: str) -> dict:
+    """用OpenCV读取视频的帧率、总帧数和分辨率（只读取文件头，不解码）"""
+    video = cv2.VideoCapture(file_path)
+    try:
+        if not video.isOpened():
+            raise DecodeError("无法打开视频文件")
+        return video_info(video)
+    finally:
+        video.release()
+
+def video_info(video: cv2.VideoCapture) -> dict:
+    """已打开的视频的帧率、总帧数和分辨率"""
+    return {
+        "fps": video.get(cv2.CAP_PROP_FPS),
+        "total_frames": int(video.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "width": int(video.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    }
+
+class VideoDecoder:
+    """解码后端：按目标帧率产出 (采样帧序号, BGR数组)；第k个采样帧对应视频中 start_time + k / target_fps 秒处的画面
+
+    start_time/end_time限定转换的时间段（秒），end_time为None表示直到视频结束；序号从时间段开始处的0算起
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.info = probe_video(file_path)
+
+    def duration(self) -> float:
+        """视频时长（秒），按帧率和总帧数估算"""
+        fps = self.info["fps"]
+        return self.info["total_frames"] / fps if fps > 0 else 0.0
+
+    def expected_frames(self, target_fps: float, max_frames: Optional[int] = None, start_frame: int = 0,
+                        start_time: float = 0.0, end_time: Optional[float] = None) -> int:
+        """预计产出的帧数，用于报告进度"""
+        end = self.duration() if end_time is None else min(end_time, self.duration())
+        # 减去一个很小的数，避免浮点误差使整数帧数向上取整
+        expected = math.ceil(max(0.0, end - start_time) * target_fps - 1e-9)
+        if max_frames:
+            expected = min(expected, max_frames)
+        return max(0, expected - start_frame)
+
+    def frames(self, target_fps: float, max_pixels: int, max_frames: Optional[int] = None, start_frame: int = 0,
+               start_time: float = 0.0, end_time: Optional[float] = None) -> Iterator[tuple[int, np.ndarray]]:
+        """产出采样帧；start_frame之前的帧不产出，max_frames包括之前跳过的帧"""
+        raise NotImplementedError
+
+    def close(self):
+        """释放解码器占用的资源"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+class OpenCVDecoder(VideoDecoder):
+    def __init__(self, file_path: Optional[str] = None, video: Optional[cv2.VideoCapture] = None):
+        """用cv2.VideoCapture解码，可以传入已打开的视频"""
+        self.file_path = file_path
+        self.video = video if video is not None else cv2.VideoCapture(file_path)
+        if not self.video.isOpened():
+            raise DecodeError("无法打开视频文件")
+        self.info = video_info(self.video)
+
+    def frame_interval(self, target_fps: float) -> int:
+        """相邻采样帧之间的原始帧数（至少为1）"""
+        return max(1, int(self.info["fps"] / target_fps))
+
+    def frame_range(self, start_time: float = 0.0, end_time: Optional[float] = None) -> tuple[int, int]:
+        """时间段对应的原始帧范围 [开始, 结束)；总帧数未知且不限结束时间时结束为0"""
+        fps = self.info["fps"]
+        total_frames = self.info["total_frames"]
+        first_frame = round(start_time * fps)
+        if end_time is None:
+            return first_frame, total_frames
+        end_frame = math.ceil(end_time * fps - 1e-9)
+        return first_frame, min(total_frames, end_frame) if total_frames > 0 else end_frame
+
+    def expected_frames(self, target_fps: float, max_frames: Optional[int] = None, start_frame: int = 0,
+                        start_time: float = 0.0, end_time: Optional[float] = None) -> int:
+        """按帧间隔预计产出的帧数"""
+        first_frame, end_frame = self.frame_range(start_time, end_time)
+        expected = math.ceil(max(0, end_frame - first_frame) / self.frame_interval(target_fps))
+        if max_frames:
+            expected = min(expected, max_frames)
+        return max(0, expected - start_frame)
+
+    def frames(self, target_fps: float, max_pixels: int, max_frames: Optional[int] = None, start_frame: int = 0,
+               start_time: float = 0.0, end_time: Optional[float] = None) -> Iterator[tuple[int, np.ndarray]]:
+        """只定位一次，之后顺序解码原始分辨率的帧，两个采样帧之间的帧用grab跳过；缩放由引擎完成"""
+        frame_interval = self.frame_interval(target_fps)
+        first_frame, end_frame = self.frame_range(start_time, end_time)
+        logger.info(f"原始帧率: {self.info['fps']:.2f}, 帧间隔: {frame_interval}")
+
+        current_frame = first_frame + start_frame * frame_interval
+        frame_count = start_frame
+        if (end_frame > 0 and current_frame >= end_frame) or (max_frames and frame_count >= max_frames):
+            logger.info(f"开始帧 {start_frame} 之后没有需要处理的帧")
+            return
+
+        # 只定位一次：OpenCV先跳到之前的关键帧，再解码到目标帧
+        if current_frame > 0:
+            with stage("seek"):
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
+        position = current_frame
+
+        while True:
+            # 顺序读取，不再逐帧定位（每次定位都要从关键帧重新解码）
+            with stage("decode"):
+                ret = True
+                while ret and position < current_frame:
+                    ret = self.video.grab()
+                    position += 1
+                if ret:
+                    ret, frame = self.video.read()
+                    position += 1
+            if not ret:
+                break
+
+            yield frame_count, frame
+
+            frame_count += 1
+            current_frame += frame_interval
+
+            # 检查是否达到最大帧数限制
+            if max_frames and frame_count >= max_frames:
+                logger.info(f"达到最大帧数限制: {max_frames}")
+                break
+
+            # 检查是否超出时间段或视频总帧数
+            if current_frame >= end_frame:
+                break
+
+    def close(self):
+        """释放视频"""
+        self.video.release()
+
+class FFmpegDecoder(VideoDecoder):
+    def __init__(self, file_path: str):
+        """从ffmpeg子进程读取rawvideo，抽帧和缩放都在ffmpeg中完成，Python只收到目标尺寸的帧"""
+        super().__init__(file_path)
+        self.executable = os.environ.get(ENV_FFMPEG) or shutil.which("ffmpeg")
+        if not self.executable:
+            raise Exception(f"找不到ffmpeg，请安装ffmpeg或用环境变量 {ENV_FFMPEG} 指定路径")
+        self.process: Optional[subprocess.Popen] = None
+
+    def frames(self, target_fps: float, max_pixels: int, max_frames: Optional[int] = None, start_frame: int = 0,
+               start_time: float = 0.0, end_time: Optional[float] = None) -> Iterator[tuple[int, np.ndarray]]:
+        """用fps和scale滤镜输出目标帧率、目标尺寸的BGR帧"""
+        count = max_frames - start_frame if max_frames else None
+        seek_time = start_time + start_frame / target_fps
+        if (count is not None and count <= 0) or (end_time is not None and seek_time >= end_time):
+            logger.info(f"开始帧 {start_frame} 之后没有需要处理的帧")
+            return
+        width, height = scaled_size(self.info["width"], self.info["height"], max_pixels)
+        frame_bytes = width * height * 3
+
+        command = [self.executable, "-v", "error", "-nostdin"]
+        if seek_time > 0:
+            # 输入端定位：先跳到之前的关键帧，再解码到开始时间，时间戳从0重新计算
+            command += ["-ss", f"{seek_time:.6f}"]
+        if end_time is not None:
+            command += ["-t", f"{end_time - seek_time:.6f}"]
+        command += [
+            "-i", self.file_path, "-map", "0:v:0",
+            "-vf", f"fps={target_fps!r},scale={width}:{height}:flags=area",
+            "-pix_fmt", "bgr24", "-f", "rawvideo"]
+        if count is not None:
+            command += ["-frames:v", str(count)]
+        command.append("-")
+        logger.info(f"ffmpeg解码: {width}x{height}，目标帧率 {target_fps}")
+
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=frame_bytes)
+        frame_count = start_frame
+        while True:
+            with stage("decode"):
+                data = self.process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield frame_count, np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+            frame_count += 1
+
+        error = self.process.stderr.read().decode("utf-8", errors="replace").strip()
+        if self.process.wait() != 0:
+            raise DecodeError(f"ffmpeg解码失败: {error}")
+
+    def close(self):
+        """结束ffmpeg子进程（调用方提前结束迭代时子进程可能仍在运行）"""
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process.stderr.close()
+            self.process = None
+
+class PyAVDecoder(VideoDecoder):
+    def __init__(self, file_path: str):
+        """用PyAV多线程解码，解码时缩放并转换为BGR"""
+        import av
+        self.file_path = file_path
+        try:
+            self.container = av.open(file_path)
+        except av.FFmpegError as e:
+            raise DecodeError(f"无法打开视频文件: {e}") from e
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.info = {
+            "fps": float(rate) if rate else 0.0,
+            "total_frames": self.stream.frames,
+            "width": self.stream.codec_context.width,
+            "height": self.stream.codec_context.height
+        }
+        if not self.info["total_frames"] and self.stream.duration is not None:
+            self.info["total_frames"] = int(self.stream.duration * self.stream.time_base * self.info["fps"])
+
+    def frames(self, target_fps: float, max_pixels: int, max_frames: Optional[int] = None, start_frame: int = 0,
+               start_time: float = 0.0, end_time: Optional[float] = None) -> Iterator[tuple[int, np.ndarray]]:
+        """按时间戳取每个采样时刻的画面，只定位一次"""
+        width, height = scaled_size(self.info["width"], self.info["height"], max_pixels)
+        source_fps = self.info["fps"] or target_fps
+        # 每隔一帧以上才取一帧时，非参考帧（通常是B帧）大多用不到，跳过它们的解码；采样时刻取最近的已解码帧
+        if source_fps >= 2 * target_fps:
+            self.stream.codec_context.skip_frame = "NONREF"
+        time_base = self.stream.time_base
+        # 视频第一帧的时间戳，时间段按相对于它的秒数计算
+        origin = float(self.stream.start_time * time_base) if self.stream.start_time is not None else 0.0
+        # 时间戳误差在半个原始帧以内都算作同一时刻
+        tolerance = 0.5 / source_fps
+
+        def slot_time(index: int) -> float:
+            """第index个采样帧在视频中的时刻"""
+            return start_time + index / target_fps
+
+        def finished(index: int) -> bool:
+            """采样帧序号或时刻已超出范围"""
+            return bool(max_frames and index >= max_frames) or (end_time is not None and slot_time(index) >= end_time)
+
+        frame_count = start_frame
+        if finished(frame_count):
+            logger.info(f"开始帧 {start_frame} 之后没有需要处理的帧")
+            return
+        if slot_time(frame_count) > 0:
+            # 只定位一次：跳到开始时刻之前的关键帧，之后向前解码
+            with stage("seek"):
+                self.container.seek(int((origin + slot_time(frame_count)) / time_base), stream=self.stream)
+
+        decoded = self.container.decode(self.stream)
+        while not finished(frame_count):
+            with stage("decode"):
+                frame = next(decoded, None)
+            if frame is None:
+                break
+            frame_time = (frame.time if frame.time is not None else frame.index / source_fps) - origin
+            if slot_time(frame_count) > frame_time + tolerance:
+                continue
+            with stage("resize"):
+                pixels = frame.reformat(width=width, height=height, format="bgr24", interpolation="AREA").to_ndarray()
+            # 跳过非参考帧后相邻两个已解码帧可能跨越多个采样时刻，重复产出以保持时间轴
+            while slot_time(frame_count) <= frame_time + tolerance and not finished(frame_count):
+                yield frame_count, pixels
+                frame_count += 1
+
+    def close(self):
+        """关闭容器"""
+        self.container.close()
+
+def open_decoder(decoder: str, file_path: str) -> VideoDecoder:
+    """按名称打开视频的解码后端；GIF、APNG和WebP动图总是用Pillow逐帧读取"""
+    check_decoder(decoder)
+    from video_tool.animated_image import AnimatedImageDecoder, is_animated_image
+    if is_animated_image(file_path):
+        logger.info("输入为动图，使用Pillow逐帧解码")
+        return AnimatedImageDecoder(file_path)
+    logger.info(f"解码后端: {decoder}")
+    if decoder == "ffmpeg":
+        return FFmpegDecoder(file_path)
+    if decoder == "pyav":
+        return PyAVDecoder(file_path)
+    return OpenCVDecoder(file_path)
@@ -0,0 +1,33 @@
+# 帧间变化检测模块
+from common.Logger import get_logger
+logger = get_logger("帧间变化检测")
+
+from typing import Optional
+import numpy as np
+
+from video_tool.packed_frame import PackedFrame
+
+# RGB空间中两种颜色之间的最大平方距离
+MAX_SQUARED_DISTANCE = 3 * 255 ** 2
+# 每个平方距离对应的欧氏距离，用于把任意阈值换算成平方距离的下限
+DISTANCE_TABLE = np.sqrt(np.arange(MAX_SQUARED_DISTANCE + 1, dtype=np.float64))
+
+def squared_distance_cutoff(threshold: float) -> int:
+    """返回欧氏距离不小于threshold的最小平方距离，与 np.sqrt(平方距离) >= threshold 的判断完全一致"""
+    return int(np.searchsorted(DISTANCE_TABLE, threshold, side="left"))
+
+def squared_distances(pixels: np.ndarray, prev_pixels: np.ndarray) -> np.ndarray:
+    """逐像素的RGB平方距离（最后一维为通道）；逐通道累加，比在长度为3的轴上求和快得多"""
+    delta = pixels.astype(np.int16) - prev_pixels
+    distances = np.zeros(delta.shape[:-1], dtype=np.int32)
+    for channel in range(3):
+        channel_delta = delta[..., channel].astype(np.int32)
+        distances += channel_delta * channel_delta
+    return distances
+
+def changed_tiles(frame: PackedFrame, prev_frame: Optional[PackedFrame], cutoff: int) -> np.ndarray:
+    """返回与前一帧平方距离不小于cutoff的砖块下标（从0开始，按行优先排列）"""
+    width, height = frame.size
+    if prev_frame is None or cutoff <= 0:
+        return np.arange(width * height)
+    return np.flatnonzero(squared_distances(frame.pixels, prev_frame.pixels).ravel() >= cutoff)
@@ -0,0 +1,140 @@
+# 引擎自动选择模块
+from common.Logger import get_logger
+logger = get_logger("引擎选择")
+
+from typing import Optional
+from importlib import metadata
+import json
+import os
+import platform
+import time
+
+from common.Profiler import stage
+from video_tool.decoders import DecodeError
+from video_tool.engines import AUTO_ENGINE, ENGINES, FrameEngine, create_processor
+
+# 环境变量：引擎选择缓存文件的路径
+ENV_ENGINE_CACHE: str = "PICTOADOFAI_ENGINE_CACHE"
+# 每个引擎测速的帧数（另有1帧预热，不计时）
+SAMPLE_FRAMES: int = 5
+# 缓存格式版本，测速方式改变时递增使旧的选择失效
+CACHE_VERSION: int = 1
+
+def engine_cache_path() -> str:
+    """引擎选择缓存文件的路径，默认位于用户缓存目录"""
+    path = os.environ.get(ENV_ENGINE_CACHE)
+    if path:
+        return path
+    cache_dir = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "PicToAdofai", "engine_choice.json")
+
+def machine_key() -> str:
+    """标识本机软硬件环境和已注册引擎的字符串，不导入torch（只读取安装的版本号）"""
+    try:
+        torch_version = metadata.version("torch")
+    except metadata.PackageNotFoundError:
+        torch_version = "none"
+    parts = [
+        f"v{CACHE_VERSION}",
+        platform.system(),
+        platform.machine(),
+        platform.processor() or "unknown",
+        f"cpu{os.cpu_count()}",
+        f"py{platform.python_version()}",
+        f"torch{torch_version}",
+        # 注册了新引擎后需要重新测速
+        ",".join(sorted(ENGINES))]
+    return "|".join(parts)
+
+def _load_cache(path: str) -> dict:
+    """读取缓存，文件不存在或损坏时返回空字典"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(path: str, cache: dict):
+    """先写临时文件再替换，避免并发的进程读到写了一半的缓存"""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"无法保存引擎选择缓存: {e}")
+
+def _cache_entry_key(max_pixels: int, decoder: str) -> str:
+    """缓存中按最大像素数和解码后端区分的键；解码后端不缩放时各引擎的工作量不同"""
+    return str(max_pixels) if decoder == "opencv" else f"{max_pixels}/{decoder}"
+
+def cached_engine(max_pixels: int, decoder: str = "opencv") -> Optional[str]:
+    """本机在该最大像素数和解码后端下已选定的引擎，没有记录时返回None"""
+    entry = _load_cache(engine_cache_path()).get(machine_key(), {}).get(_cache_entry_key(max_pixels, decoder))
+    if isinstance(entry, dict) and entry.get("engine") in ENGINES:
+        return entry["engine"]
+    return None
+
+def measure_engine(processor: FrameEngine, video_path: str, target_fps: float, max_pixels: int, sample_frames: int = SAMPLE_FRAMES) -> float:
+    """用处理器处理视频开头的几帧，返回每秒处理的帧数；第1帧用于预热（如CUDA初始化），不计时"""
+    frames = processor.process_video_generator(video_path, target_fps, max_pixels, sample_frames + 1)
+    start = time.perf_counter()
+    count = 0
+    for count, _ in enumerate(frames):
+        if count == 0:
+            start = time.perf_counter()
+    if count == 0:
+        raise Exception("视频帧数不足，无法测速")
+    return count / max(time.perf_counter() - start, 1e-9)
+
+def select_engine(video_path: str, target_fps: float, max_pixels: int, sample_frames: int = SAMPLE_FRAMES,
+                  use_cache: bool = True, decoder: str = "opencv") -> tuple[str, FrameEngine]:
+    """在输入视频开头的几帧上测量每个可用引擎的速度，返回最快的 (引擎名, 处理器)；结果按本机和最大像素数缓存"""
+    if use_cache:
+        engine = cached_engine(max_pixels, decoder)
+        if engine is not None:
+            logger.info(f"使用缓存的引擎选择: {engine}（最大像素数 {max_pixels}）")
+            return engine, create_processor(engine, decoder)
+
+    measurements = {}
+    processors = {}
+    decode_error = None
+    with stage("engine_selection"):
+        for engine in ENGINES:
+            try:
+                processor = create_processor(engine, decoder)
+                measurements[engine] = measure_engine(processor, video_path, target_fps, max_pixels, sample_frames)
+            except Exception as e:
+                # 未安装依赖（如torch）或无法处理该视频的引擎不参与选择
+                logger.info(f"引擎 {engine} 不可用: {e}")
+                if isinstance(e, DecodeError):
+                    decode_error = e
+                continue
+            processors[engine] = processor
+            logger.info(f"引擎 {engine}: {measurements[engine]:.2f} 帧/秒")
+    if not measurements:
+        # 视频本身无法解码时报告解码错误，而不是引擎不可用
+        if decode_error is not None:
+            raise decode_error
+        raise Exception("没有可用的处理引擎")
+
+    engine = max(measurements, key=measurements.get)
+    logger.info(f"自动选择引擎: {engine}（最大像素数 {max_pixels}）")
+    if use_cache:
+        path = engine_cache_path()
+        cache = _load_cache(path)
+        cache.setdefault(machine_key(), {})[_cache_entry_key(max_pixels, decoder)] = {
+            "engine": engine,
+            "frames_per_second": {name: round(value, 3) for name, value in measurements.items()},
+            "measured_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        _save_cache(path, cache)
+    return engine, processors[engine]
+
+def resolve_engine(engine: str, video_path: str, target_fps: float, max_pixels: int,
+                   decoder: str = "opencv") -> tuple[str, FrameEngine]:
+    """返回 (实际使用的引擎名, 处理器)；engine为auto时按输入视频测速选择"""
+    if engine == AUTO_ENGINE:
+        return select_engine(video_path, target_fps, max_pixels, decoder=decoder)
+    return engine, create_processor(engine, decoder)
@@ -0,0 +1,63 @@
+# 处理引擎模块
+from common.Logger import get_logger
+logger = get_logger("处理引擎")
+
+from typing import TYPE_CHECKING, Iterator, Optional, Protocol
+import importlib
+
+if TYPE_CHECKING:
+    from common.Progress import ProgressTracker
+    from video_tool.packed_frame import PackedFrame
+
+# 按输入视频测速后选择最快引擎的引擎名
+AUTO_ENGINE: str = 'auto'
+AUTO_ENGINE_LABEL: str = '自动 (按输入测速选择)'
+
+class FrameEngine(Protocol):
+    """处理引擎的接口：把视频按目标帧率采样、缩放为不超过max_pixels的PackedFrame
+
+    继承 video_tool.base_processor.BaseVideoProcessor 并实现 process_decoded 即可得到完整实现
+    """
+    # 解码后端，见 video_tool.decoders.DECODERS
+    decoder: str
+
+    def process_video_generator(self, file_path: str, target_fps: float, max_pixels: int, max_frames: Optional[int] = None,
+                                progress: Optional["ProgressTracker"] = None, start_frame: int = 0,
+                                start_time: float = 0.0, end_time: Optional[float] = None) -> Iterator["PackedFrame"]:
+        """逐帧产出处理后的帧；只处理start_time到end_time秒的时间段（第一帧对应start_time），
+        start_frame为时间段内开始的采样帧序号，max_frames包括之前跳过的帧"""
+        ...
+
+    def process_video(self, file_path: str, target_fps: float, max_pixels: int, max_frames: Optional[int] = None,
+                      progress: Optional["ProgressTracker"] = None,
+                      start_time: float = 0.0, end_time: Optional[float] = None) -> list["PackedFrame"]:
+        """返回全部处理后的帧"""
+        ...
+
+# 引擎名 -> (模块, 类名)，模块在首次创建处理器时才导入，避免在启动时导入torch等重量级依赖
+ENGINES: dict = {}
+# 引擎名称及界面显示名，自动引擎总在最后
+ENGINE_LABELS: dict = {AUTO_ENGINE: AUTO_ENGINE_LABEL}
+
+def register_engine(name: str, label: str, module: str, class_name: str):
+    """注册处理引擎，界面、命令行和自动选择都会列出已注册的引擎"""
+    if name == AUTO_ENGINE:
+        raise ValueError(f"引擎名 {AUTO_ENGINE} 已保留给自动选择")
+    ENGINES[name] = (module, class_name)
+    del ENGINE_LABELS[AUTO_ENGINE]
+    ENGINE_LABELS[name] = label
+    ENGINE_LABELS[AUTO_ENGINE] = AUTO_ENGINE_LABEL
+
+register_engine('pytorch', 'PyTorch (GPU加速)', 'video_tool.torch_video_processor', 'TorchVideoProcessor')
+register_engine('traditional', '传统 (CPU)', 'video_tool.video_processor', 'VideoProcessor')
+register_engine('opencv', 'OpenCV (CPU，纯数组)', 'video_tool.opencv_processor', 'OpenCVVideoProcessor')
+
+def create_processor(engine: str, decoder: str = "opencv") -> FrameEngine:
+    """按名称导入并创建处理器，decoder为解码后端"""
+    logger.info(f"初始化处理引擎: {engine}")
+    if engine == AUTO_ENGINE:
+        raise ValueError("自动引擎需要输入视频才能选择，请使用 engine_selector.resolve_engine")
+    if engine not in ENGINES:
+        raise ValueError(f"未知的处理引擎: {engine}")
+    module, class_name = ENGINES[engine]
+    return getattr(importlib.import_module(module), class_name)(decoder)
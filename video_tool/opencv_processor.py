@@ -0,0 +1,43 @@
+# OpenCV视频处理模块
+from common.Logger import get_logger
+logger = get_logger("OpenCV视频处理")
+
+import cv2
+import numpy as np
+from PIL import Image
+from common.Profiler import stage
+from video_tool.base_processor import BaseVideoProcessor, scaled_size
+from video_tool.packed_frame import PackedFrame
+
+class OpenCVVideoProcessor(BaseVideoProcessor):
+    """OpenCV引擎：解码出的数组直接用cv2.resize（INTER_AREA）缩放，全程不经过PIL图片
+
+    先在BGR数组上缩放再转换颜色，颜色转换只处理缩小后的像素
+    """
+
+    def resize_array(self, frame: np.ndarray, max_pixels: int) -> np.ndarray:
+        """保持长宽比把 (高, 宽, 通道) 数组缩放到指定最大像素数"""
+        height, width = frame.shape[:2]
+        new_size = scaled_size(width, height, max_pixels)
+        if new_size == (width, height):
+            return frame
+        # 缩小时INTER_AREA按面积取平均，效果接近LANCZOS且快得多
+        return cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+
+    def process_decoded(self, frame: np.ndarray, max_pixels: int) -> PackedFrame:
+        """缩放解码出的BGR数组并转换为RGB帧"""
+        with stage("resize"):
+            resized = self.resize_array(frame, max_pixels)
+        with stage("color_conversion"):
+            rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        with stage("pixel_extraction"):
+            packed_frame = PackedFrame(rgb)
+        logger.debug(f"帧处理完成，最终尺寸: {packed_frame.width}x{packed_frame.height}")
+        return packed_frame
+
+    def process_frame(self, frame: Image.Image, max_pixels: int) -> PackedFrame:
+        """处理单张PIL图片，返回紧凑的RGB帧"""
+        with stage("resize"):
+            resized = self.resize_array(np.asarray(frame.convert("RGB")), max_pixels)
+        with stage("pixel_extraction"):
+            return PackedFrame(resized)
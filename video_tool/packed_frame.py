@@ -0,0 +1,98 @@
+# 紧凑帧模块
+from common.Logger import get_logger
+logger = get_logger("紧凑帧")
+
+from typing import Iterable, Iterator
+import sys
+import numpy as np
+from PIL import Image
+
+class PackedFrame:
+    """处理后的一帧：形状为 (height, width, 3) 的uint8 RGB数组
+
+    ADOFAI的颜色不含透明度，每个像素只需3字节；可以像原来的 (pixel_data, width, height) 一样解包
+    """
+    __slots__ = ("pixels", "width", "height")
+
+    def __init__(self, pixels: np.ndarray):
+        """用RGB数组创建帧，RGBA数组会去掉透明度通道"""
+        pixels = np.asarray(pixels)
+        if pixels.ndim != 3 or pixels.shape[2] not in (3, 4):
+            raise ValueError(f"帧数据的形状必须是 (高, 宽, 3)，实际为 {pixels.shape}")
+        self.pixels = np.ascontiguousarray(pixels[:, :, :3], dtype=np.uint8)
+        self.height, self.width = self.pixels.shape[:2]
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> "PackedFrame":
+        """从PIL图片创建帧"""
+        return cls(np.asarray(image.convert("RGB")))
+
+    @classmethod
+    def from_rows(cls, pixel_data: list[list[tuple]], width: int, height: int) -> "PackedFrame":
+        """从旧格式的逐像素元组列表创建帧"""
+        pixels = np.array(pixel_data, dtype=np.uint8).reshape(height, width, -1)
+        return cls(pixels)
+
+    @classmethod
+    def coerce(cls, frame) -> "PackedFrame":
+        """接受PackedFrame或旧格式的 (pixel_data, width, height)"""
+        if isinstance(frame, cls):
+            return frame
+        pixel_data, width, height = frame
+        if isinstance(pixel_data, np.ndarray):
+            return cls(pixel_data.reshape(height, width, -1))
+        return cls.from_rows(pixel_data, width, height)
+
+    def __iter__(self) -> Iterator:
+        """解包为 (像素数组, 宽度, 高度)"""
+        return iter((self.pixels, self.width, self.height))
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """(宽度, 高度)"""
+        return self.width, self.height
+
+    @property
+    def nbytes(self) -> int:
+        """像素数据占用的字节数"""
+        return self.pixels.nbytes
+
+    def packed(self) -> np.ndarray:
+        """每个像素打包为一个uint32（0xRRGGBB），形状为 (height, width)"""
+        pixels = self.pixels.astype(np.uint32)
+        return (pixels[:, :, 0] << 16) | (pixels[:, :, 1] << 8) | pixels[:, :, 2]
+
+    def packed_at(self, indices: np.ndarray) -> np.ndarray:
+        """按行优先下标取出部分像素的打包颜色"""
+        pixels = np.take(self.pixels.reshape(-1, 3), indices, axis=0).astype(np.uint32)
+        return (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+
+    def to_rows(self) -> list[list[tuple]]:
+        """转换为旧格式的逐像素RGBA元组列表"""
+        return [[(int(r), int(g), int(b), 255) for r, g, b in row] for row in self.pixels.tolist()]
+
+    def save(self, file_path: str):
+        """保存为.npy文件"""
+        np.save(file_path, self.pixels)
+
+    @classmethod
+    def load(cls, file_path: str) -> "PackedFrame":
+        """从.npy文件读取"""
+        return cls(np.load(file_path))
+
+def save_frames(file_path: str, frames: Iterable[PackedFrame]):
+    """把帧序列保存为一个.npz文件，各帧尺寸可以不同"""
+    arrays = {f"frame_{i:06d}": PackedFrame.coerce(frame).pixels for i, frame in enumerate(frames)}
+    np.savez(file_path, **arrays)
+    logger.info(f"已保存 {len(arrays)} 帧到 {file_path}")
+
+def load_frames(file_path: str) -> list[PackedFrame]:
+    """读取save_frames保存的帧序列"""
+    with np.load(file_path) as archive:
+        return [PackedFrame(archive[name]) for name in sorted(archive.files)]
+
+def legacy_frame_bytes(width: int, height: int) -> int:
+    """旧格式 list[list[tuple]] 一帧占用的内存（每像素一个RGBA元组，元素为小整数缓存）"""
+    pixel_tuple = sys.getsizeof((0, 0, 0, 0))
+    row_list = sys.getsizeof([None] * width)
+    return height * (row_list + width * pixel_tuple) + sys.getsizeof([None] * height)
@@ -0,0 +1,203 @@
+# 调色板模块
+from common.Logger import get_logger
+logger = get_logger("调色板")
+
+from typing import Iterable, Iterator, Optional
+import numpy as np
+from PIL import Image
+
+from video_tool.dirty_regions import squared_distances
+from video_tool.packed_frame import PackedFrame
+
+# adaptive：按出现的颜色逐帧扩充，颜色不变（无损）；fixed：用前几帧量化出最多256色，每砖块只占1字节（有损）
+PALETTE_MODES = ("adaptive", "fixed")
+# 自适应调色板的最大颜色数（uint16下标）
+MAX_PALETTE_SIZE = 1 << 16
+# 不超过该颜色数时使用uint8下标，并预先计算所有颜色两两之间的距离
+TABLE_PALETTE_SIZE = 256
+# fixed模式用于量化的帧数
+DEFAULT_PALETTE_FRAMES = 10
+
+def _pack(colors: np.ndarray) -> np.ndarray:
+    """把 (..., 3) 的RGB数组打包为uint32（0xRRGGBB）"""
+    colors = colors.astype(np.uint32)
+    return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+def _unpack(packed: np.ndarray) -> np.ndarray:
+    """把uint32颜色拆回 (n, 3) 的RGB数组"""
+    return np.stack(((packed >> 16) & 0xff, (packed >> 8) & 0xff, packed & 0xff), axis=-1).astype(np.uint8)
+
+class Palette:
+    def __init__(self, colors: Optional[np.ndarray] = None):
+        """全视频共用的调色板，帧只保存每个砖块的颜色下标"""
+        self.colors = np.empty((0, 3), dtype=np.uint8) if colors is None else np.ascontiguousarray(colors, dtype=np.uint8)
+        # 按打包颜色排序的查找表，用于自适应扩充
+        self._keys: Optional[np.ndarray] = None
+        self._key_indices: Optional[np.ndarray] = None
+        self._packed: Optional[np.ndarray] = None
+        self._distance_table: Optional[np.ndarray] = None
+
+    @property
+    def size(self) -> int:
+        """颜色数"""
+        return len(self.colors)
+
+    @property
+    def dtype(self):
+        """当前颜色数所需的下标类型"""
+        return np.uint8 if self.size <= TABLE_PALETTE_SIZE else np.uint16
+
+    def packed(self) -> np.ndarray:
+        """每个颜色打包后的uint32，只计算一次"""
+        if self._packed is None:
+            self._packed = _pack(self.colors)
+        return self._packed
+
+    def distance_table(self) -> np.ndarray:
+        """颜色两两之间的平方距离，形状为 (size, size)"""
+        if self._distance_table is None:
+            self._distance_table = squared_distances(self.colors[:, None, :], self.colors[None, :, :])
+        return self._distance_table
+
+    def index(self, packed: np.ndarray) -> Optional[np.ndarray]:
+        """返回打包颜色在调色板中的下标，新颜色追加到调色板末尾；超过最大颜色数时返回None且不修改调色板"""
+        if self._keys is None:
+            order = np.argsort(self.packed(), kind="stable")
+            self._keys = self.packed()[order]
+            self._key_indices = order
+        positions = np.searchsorted(self._keys, packed)
+        found = np.zeros(packed.shape, dtype=bool)
+        if len(self._keys):
+            found = self._keys[np.minimum(positions, len(self._keys) - 1)] == packed
+        if not found.all():
+            new_colors = np.unique(packed[~found])
+            if self.size + len(new_colors) > MAX_PALETTE_SIZE:
+                return None
+            self._extend(new_colors)
+            positions = np.searchsorted(self._keys, packed)
+        return self._key_indices[positions].astype(self.dtype)
+
+    def _extend(self, new_colors: np.ndarray):
+        """追加调色板中还没有的颜色（已排序、不重复）"""
+        new_indices = np.arange(self.size, self.size + len(new_colors))
+        self.colors = np.concatenate((self.colors, _unpack(new_colors)))
+        keys = np.concatenate((self._keys, new_colors))
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._key_indices = np.concatenate((self._key_indices, new_indices))[order]
+        self._packed = None
+        self._distance_table = None
+
+    def changed_tiles(self, indices: np.ndarray, prev_indices: np.ndarray, cutoff: int) -> np.ndarray:
+        """比较两帧的下标，返回平方距离不小于cutoff的砖块下标（从0开始，按行优先排列）"""
+        indices = indices.ravel()
+        prev_indices = prev_indices.ravel()
+        if cutoff <= 0:
+            return np.arange(len(indices))
+        # 下标相同的砖块颜色一定相同
+        differ = np.flatnonzero(indices != prev_indices)
+        current, previous = indices[differ], prev_indices[differ]
+        if self.size <= TABLE_PALETTE_SIZE:
+            distances = self.distance_table()[current, previous]
+        else:
+            distances = squared_distances(self.colors[current], self.colors[previous])
+        return differ[distances >= cutoff]
+
+    @classmethod
+    def quantize(cls, frames: list[PackedFrame], colors: int = TABLE_PALETTE_SIZE) -> tuple["Palette", Image.Image]:
+        """把多帧拼在一起做中位切分量化，返回调色板和用于映射其他帧的PIL调色板图片"""
+        width = frames[0].width
+        sample = np.concatenate([frame.pixels for frame in frames if frame.width == width])
+        palette_image = Image.fromarray(sample).quantize(colors=colors, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        palette_colors = np.array(palette_image.getpalette(), dtype=np.uint8).reshape(-1, 3)
+        return cls(palette_colors), palette_image
+
+class IndexedFrame(PackedFrame):
+    """用调色板下标保存的帧，每个砖块1或2字节；需要RGB数组时按调色板展开"""
+    __slots__ = ("indices", "palette")
+
+    def __init__(self, indices: np.ndarray, palette: Palette):
+        """用 (height, width) 的下标数组和调色板创建帧"""
+        self.indices = indices
+        self.palette = palette
+        self.height, self.width = indices.shape
+
+    @property
+    def pixels(self) -> np.ndarray:
+        """展开为 (height, width, 3) 的RGB数组"""
+        return self.palette.colors[self.indices]
+
+    @property
+    def nbytes(self) -> int:
+        """下标数组占用的字节数（调色板由所有帧共用，不计入）"""
+        return self.indices.nbytes
+
+    def packed(self) -> np.ndarray:
+        """每个像素打包为一个uint32（0xRRGGBB），形状为 (height, width)"""
+        return self.palette.packed()[self.indices]
+
+    def packed_at(self, indices: np.ndarray) -> np.ndarray:
+        """按行优先下标取出部分像素的打包颜色"""
+        return self.palette.packed()[np.take(self.indices.ravel(), indices)]
+
+class FrameIndexer:
+    def __init__(self, mode: str = "adaptive", palette_frames: int = DEFAULT_PALETTE_FRAMES):
+        """把处理后的帧转换为共用一个调色板的IndexedFrame"""
+        if mode not in PALETTE_MODES:
+            raise ValueError(f"不支持的调色板模式: {mode}，可选: {', '.join(PALETTE_MODES)}")
+        if palette_frames <= 0:
+            raise ValueError("用于生成调色板的帧数必须大于0")
+        self.mode = mode
+        self.palette_frames = palette_frames
+        self.palette = Palette()
+        self._palette_image: Optional[Image.Image] = None
+        # 自适应调色板颜色数超过上限后，之后的帧保持RGB格式
+        self.overflowed = False
+
+    def index_frames(self, frames: Iterable) -> Iterator[PackedFrame]:
+        """依次产出转换后的帧"""
+        if self.mode == "adaptive":
+            for frame in frames:
+                yield self._index_adaptive(PackedFrame.coerce(frame))
+            return
+
+        # fixed模式先缓存前几帧生成调色板
+        buffered = []
+        for frame in frames:
+            frame = PackedFrame.coerce(frame)
+            if self._palette_image is None:
+                buffered.append(frame)
+                if len(buffered) < self.palette_frames:
+                    continue
+                self._build_fixed(buffered)
+                yield from (self._index_fixed(item) for item in buffered)
+                buffered = []
+            else:
+                yield self._index_fixed(frame)
+        if buffered:
+            self._build_fixed(buffered)
+            yield from (self._index_fixed(item) for item in buffered)
+
+    def _index_adaptive(self, frame: PackedFrame) -> PackedFrame:
+        """按需扩充调色板，颜色不变"""
+        if self.overflowed:
+            return frame
+        indices = self.palette.index(frame.packed().ravel())
+        if indices is None:
+            self.overflowed = True
+            logger.warning(f"颜色数超过 {MAX_PALETTE_SIZE}，之后的帧不再使用调色板")
+            return frame
+        return IndexedFrame(indices.reshape(frame.height, frame.width), self.palette)
+
+    def _build_fixed(self, frames: list[PackedFrame]):
+        """用前几帧量化出固定调色板"""
+        self.palette, self._palette_image = Palette.quantize(frames)
+        logger.info(f"用前 {len(frames)} 帧生成调色板，共 {self.palette.size} 种颜色")
+
+    def _index_fixed(self, frame: PackedFrame) -> IndexedFrame:
+        """把每个像素映射到固定调色板中最接近的颜色"""
+        image = Image.fromarray(frame.pixels).quantize(palette=self._palette_image, dither=Image.Dither.NONE)
+        indices = np.asarray(image, dtype=np.uint8)
+        if indices.size and int(indices.max()) >= self.palette.size:
+            raise Exception("量化结果超出调色板范围")
+        return IndexedFrame(indices, self.palette)
@@ -0,0 +1,199 @@
+# 阈值分析模块
+from common.Logger import get_logger
+logger = get_logger("阈值分析")
+
+from typing import Iterable, Optional
+import json
+import numpy as np
+
+from common.LevelBuilder import LevelBuilder
+from common.Progress import ProgressTracker
+from video_tool.decoders import DecodeError
+from video_tool.dirty_regions import DISTANCE_TABLE, MAX_SQUARED_DISTANCE, squared_distance_cutoff
+from video_tool.packed_frame import PackedFrame
+from video_tool.video_to_adofai import VIDEO_BPM, VideoToADOFAI
+
+class ThresholdHistogram:
+    def __init__(self, width: int, height: int, fps: float):
+        """初始化颜色距离直方图"""
+        self.width = width
+        self.height = height
+        self.fps = fps
+        # 下标为逐砖块逐帧的颜色平方距离（整数，可精确统计）
+        self.histogram = np.zeros(MAX_SQUARED_DISTANCE + 1, dtype=np.int64)
+        self.frame_count = 0
+        self.skipped_frames = 0
+        # 除第一帧外各帧angleOffset文本长度之和，用于估算事件字节数
+        self.angle_offset_chars = 0
+        self._tail_counts: Optional[np.ndarray] = None
+        self._base_bytes = 0
+        self._event_bytes = 0.0
+        self._first_frame_event_bytes = 0.0
+
+    def add_frame_distances(self, squared_distances: np.ndarray, frame_index: int):
+        """累加一帧（非第一帧）的颜色平方距离"""
+        self.histogram += np.bincount(squared_distances.ravel(), minlength=MAX_SQUARED_DISTANCE + 1)
+        self.angle_offset_chars += len(repr(frame_index * (180 / self.fps)))
+        self._tail_counts = None
+
+    def finalize(self, video_to_adofai: VideoToADOFAI):
+        """计算字节估算所需的常量"""
+        tiles = self.width * self.height
+
+        # 不含任何Recolortrack事件的关卡骨架大小
+        builder = LevelBuilder(self.width, self.height, VIDEO_BPM, video_to_adofai.tile_format)
+        self._base_bytes = _dumps_size(builder.build([builder.move_track_event()] + builder.position_events()))
+
+        # 单个事件在关卡中的字节数，以砖块1和angleOffset 0.0为基准
+        sample = video_to_adofai.build_recolortrack_event(1, "000000", 0.0)
+        event_bytes = _dumps_size({"a": [sample, sample]}) - _dumps_size({"a": [sample]})
+
+        # 砖块编号在startTile和endTile中各出现一次，按平均位数修正
+        average_floor_digits = _average_digits(tiles) if tiles else 1.0
+        self._first_frame_event_bytes = event_bytes + 2 * (average_floor_digits - 1)
+
+        later_frames = self.frame_count - 1
+        average_offset_chars = self.angle_offset_chars / later_frames if later_frames > 0 else len(repr(0.0))
+        self._event_bytes = self._first_frame_event_bytes + average_offset_chars - len(repr(0.0))
+
+    def _cutoff(self, threshold: float) -> int:
+        """返回第一个不会被跳过的平方距离"""
+        return squared_distance_cutoff(threshold)
+
+    def count_changed(self, threshold: float) -> int:
+        """统计颜色距离不小于阈值、需要生成事件的砖块帧数"""
+        if self._tail_counts is None:
+            self._tail_counts = np.cumsum(self.histogram[::-1])[::-1]
+        cutoff = self._cutoff(threshold)
+        if cutoff > MAX_SQUARED_DISTANCE:
+            return 0
+        return int(self._tail_counts[cutoff])
+
+    def estimate(self, threshold: float) -> dict:
+        """估算指定阈值下的事件数和输出文件大小"""
+        first_frame_events = self.width * self.height if self.frame_count else 0
+        changed_events = self.count_changed(threshold)
+        recolortrack_events = first_frame_events + changed_events
+        estimated_bytes = self._base_bytes \
+            + first_frame_events * self._first_frame_event_bytes \
+            + changed_events * self._event_bytes
+
+        return {
+            "threshold": threshold,
+            "recolortrack_events": recolortrack_events,
+            "total_events": recolortrack_events + 1 + max(self.height - 1, 0),
+            "estimated_bytes": int(estimated_bytes)
+        }
+
+    def summary(self, thresholds: Iterable[float]) -> list[dict]:
+        """批量估算多个阈值"""
+        return [self.estimate(threshold) for threshold in thresholds]
+
+    def _threshold_for_cutoff(self, cutoff: int) -> float:
+        """返回使直方图截断位置为cutoff的最小阈值"""
+        if cutoff > MAX_SQUARED_DISTANCE:
+            # 超过最大可能距离，只保留第一帧的事件
+            return float(np.nextafter(DISTANCE_TABLE[-1], np.inf))
+        return float(DISTANCE_TABLE[cutoff])
+
+    def _fits_budget(self, estimate: dict, max_events: Optional[int], max_bytes: Optional[int]) -> bool:
+        """判断估算结果是否满足预算"""
+        if max_events is not None and estimate["total_events"] > max_events:
+            return False
+        if max_bytes is not None and estimate["estimated_bytes"] > max_bytes:
+            return False
+        return True
+
+    def find_threshold(self, max_events: Optional[int] = None, max_bytes: Optional[int] = None) -> Optional[float]:
+        """在直方图上二分查找满足事件数或文件大小预算的最小阈值，无法满足时返回None"""
+        if max_events is None and max_bytes is None:
+            raise ValueError("至少需要指定一个预算")
+
+        logger.info(f"开始查找满足预算的阈值，事件上限: {max_events}，文件大小上限: {max_bytes}")
+
+        # 事件数和文件大小都随截断位置单调不增
+        low = 0
+        high = MAX_SQUARED_DISTANCE + 1
+        if not self._fits_budget(self.estimate(self._threshold_for_cutoff(high)), max_events, max_bytes):
+            logger.error("即使只保留第一帧的事件也超出预算")
+            return None
+
+        while low < high:
+            middle = (low + high) // 2
+            if self._fits_budget(self.estimate(self._threshold_for_cutoff(middle)), max_events, max_bytes):
+                high = middle
+            else:
+                low = middle + 1
+
+        threshold = self._threshold_for_cutoff(low)
+        estimate = self.estimate(threshold)
+        logger.info(
+            f"选定颜色差异阈值: {threshold:.4f}，"
+            f"Recolortrack事件数: {estimate['recolortrack_events']}，"
+            f"总事件数: {estimate['total_events']}，"
+            f"预计文件大小: {estimate['estimated_bytes']} 字节"
+        )
+        return threshold
+
+def _dumps_size(data) -> int:
+    """按save_level的格式序列化后的字节数"""
+    return len(json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
+
+def _average_digits(count: int) -> float:
+    """1到count之间整数的平均十进制位数"""
+    total = 0
+    digits = 1
+    low = 1
+    while low <= count:
+        high = min(count, low * 10 - 1)
+        total += (high - low + 1) * digits
+        digits += 1
+        low *= 10
+    return total / count
+
+class ThresholdAnalyzer:
+    def __init__(self, tile_format: str = "angleData"):
+        """初始化阈值分析器，tile_format与生成关卡时相同，用于估算关卡骨架的大小"""
+        self.video_to_adofai = VideoToADOFAI(tile_format)
+
+    def analyze(self, frames: Iterable[PackedFrame], fps: float) -> ThresholdHistogram:
+        """单次流式遍历帧序列，构建颜色距离直方图"""
+        logger.info("开始分析颜色差异分布")
+
+        histogram: Optional[ThresholdHistogram] = None
+        prev_frame: Optional[np.ndarray] = None
+
+        for i, frame in enumerate(frames):
+            frame = PackedFrame.coerce(frame)
+            frame_width, frame_height = frame.size
+            if histogram is None:
+                histogram = ThresholdHistogram(frame_width, frame_height, fps)
+                logger.info(f"使用第一帧的尺寸: {frame_width}x{frame_height}")
+
+            # 与generate_level一致，跳过尺寸不同的帧
+            if frame_width != histogram.width or frame_height != histogram.height:
+                logger.warning(f"第 {i+1} 帧尺寸与第一帧不同，跳过")
+                histogram.skipped_frames += 1
+                continue
+
+            current_frame = frame.pixels.astype(np.int32)
+            if prev_frame is not None:
+                squared_distances = ((current_frame - prev_frame) ** 2).sum(axis=2)
+                histogram.add_frame_distances(squared_distances, i)
+
+            histogram.frame_count += 1
+            prev_frame = current_frame
+
+        if histogram is None:
+            raise DecodeError("没有可分析的帧")
+
+        histogram.finalize(self.video_to_adofai)
+        logger.info(f"分析完成，共 {histogram.frame_count} 帧，跳过 {histogram.skipped_frames} 帧")
+        return histogram
+
+def analyze_video(processor, file_path: str, target_fps: float, max_pixels: int, max_frames: Optional[int] = None, progress: Optional[ProgressTracker] = None,
+                  tile_format: str = "angleData", start_time: float = 0.0, end_time: Optional[float] = None) -> ThresholdHistogram:
+    """无界面接口：用指定处理器流式分析视频（start_time到end_time秒的时间段），不生成关卡"""
+    frames = processor.process_video_generator(file_path, target_fps, max_pixels, max_frames, progress,
+                                               start_time=start_time, end_time=end_time)
+    return ThresholdAnalyzer(tile_format).analyze(frames, target_fps)
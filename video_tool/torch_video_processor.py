@@ -2,17 +2,20 @@
 from common.Logger import get_logger
 logger = get_logger("PyTorch视频处理")
 
-from typing import Optional
-import cv2
 import torch
 import torch.nn.functional as F
 from PIL import Image
-import math
 import numpy as np
+from common.Profiler import stage
+from video_tool.base_processor import BaseVideoProcessor, scaled_size
+from video_tool.decoders import DEFAULT_DECODER
+from video_tool.packed_frame import PackedFrame
 
-class TorchVideoProcessor:
-    def __init__(self):
+class TorchVideoProcessor(BaseVideoProcessor):
+    """PyTorch引擎：在GPU（没有时为CPU）上用双线性插值缩放"""
+    def __init__(self, decoder: str = DEFAULT_DECODER):
         """初始化PyTorch视频处理器"""
+        super().__init__(decoder)
         # 检查GPU可用性
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         logger.info(f"使用设备: {self.device}")
@@ -20,95 +23,6 @@ class TorchVideoProcessor:
             logger.info(f"GPU型号: {torch.cuda.get_device_name(0)}")
             logger.info(f"GPU内存: {torch.cuda.get_device_properties(0).total_memory / 1e9:.2f} GB")
     
-    def load_video(self, file_path: str) -> cv2.VideoCapture:
-        """加载视频文件"""
-        logger.info(f"加载视频: {file_path}")
-        try:
-            video = cv2.VideoCapture(file_path)
-            if not video.isOpened():
-                raise Exception("无法打开视频文件")
-            
-            # 获取视频信息
-            fps = video.get(cv2.CAP_PROP_FPS)
-            total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-            width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            
-            logger.info(f"视频信息: FPS={fps:.2f}, 总帧数={total_frames}, 分辨率={width}x{height}")
-            return video
-        except Exception as e:
-            logger.error(f"视频加载失败: {e}")
-            raise
-    
-    def get_video_info(self, video: cv2.VideoCapture) -> dict:
-        """获取视频信息"""
-        try:
-            fps = video.get(cv2.CAP_PROP_FPS)
-            total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-            width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            
-            return {
-                "fps": fps,
-                "total_frames": total_frames,
-                "width": width,
-                "height": height
-            }
-        except Exception as e:
-            logger.error(f"获取视频信息失败: {e}")
-            raise
-    
-    def extract_frames(self, video: cv2.VideoCapture, target_fps: float, max_frames: Optional[int] = None) -> list[Image.Image]:
-        """根据目标帧率提取视频帧"""
-        logger.info(f"开始提取视频帧，目标帧率: {target_fps}")
-        
-        try:
-            # 获取视频信息
-            video_info = self.get_video_info(video)
-            original_fps = video_info["fps"]
-            total_frames = video_info["total_frames"]
-            
-            # 计算帧间隔
-            frame_interval = int(original_fps / target_fps)
-            logger.info(f"原始帧率: {original_fps:.2f}, 帧间隔: {frame_interval}")
-            
-            frames = []
-            current_frame = 0
-            frame_count = 0
-            
-            while True:
-                # 设置当前帧位置
-                video.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-                
-                # 读取帧
-                ret, frame = video.read()
-                if not ret:
-                    break
-                
-                # 转换为PIL Image
-                # OpenCV读取的帧是BGR格式，需要转换为RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(frame_rgb)
-                frames.append(pil_image)
-                
-                frame_count += 1
-                current_frame += frame_interval
-                
-                # 检查是否达到最大帧数限制
-                if max_frames and frame_count >= max_frames:
-                    logger.info(f"达到最大帧数限制: {max_frames}")
-                    break
-                
-                # 检查是否超出视频总帧数
-                if current_frame >= total_frames:
-                    break
-            
-            logger.info(f"帧提取完成，共提取 {len(frames)} 帧")
-            return frames
-        except Exception as e:
-            logger.error(f"帧提取失败: {e}")
-            raise
-    
     def resize_frame(self, frame: Image.Image, max_pixels: int) -> Image.Image:
         """保持长宽比缩放帧到指定最大像素数"""
         original_width, original_height = frame.size
@@ -121,17 +35,8 @@ class TorchVideoProcessor:
             logger.debug("帧像素数已小于目标值，无需缩放")
             return frame
         
-        # 计算缩放比例
-        scale = math.sqrt(max_pixels / original_pixels)
-        logger.debug(f"计算缩放比例: {scale:.6f}")
-        
-        # 计算新尺寸
-        new_width = int(original_width * scale)
-        new_height = int(original_height * scale)
-        
-        # 确保尺寸至少为1x1
-        new_width = max(1, new_width)
-        new_height = max(1, new_height)
+        # 计算新尺寸（至少为1x1）
+        new_width, new_height = scaled_size(original_width, original_height, max_pixels)
         
         logger.debug(f"缩放后帧尺寸: {new_width}x{new_height}，像素数: {new_width * new_height}")
         
@@ -163,45 +68,33 @@ class TorchVideoProcessor:
             resized_frame = frame.resize((new_width, new_height), Image.Resampling.LANCZOS)
             return resized_frame
     
-    def process_frame(self, frame: Image.Image, max_pixels: int) -> tuple[list[list[tuple]], int, int]:
-        """处理单帧，返回像素数据、宽度和高度"""
+    def process_frame(self, frame: Image.Image, max_pixels: int) -> PackedFrame:
+        """处理单帧，返回紧凑的RGB帧"""
         logger.debug("开始处理帧")
         
         # 缩放帧
-        resized_frame = self.resize_frame(frame, max_pixels)
-        
-        # 转换为RGBA模式
-        rgba_frame = resized_frame.convert("RGBA")
+        with stage("resize"):
+            resized_frame = self.resize_frame(frame, max_pixels)
         
-        # 获取像素数据
-        width, height = rgba_frame.size
-        pixel_data = []
+        # 转换为RGB模式
+        with stage("color_conversion"):
+            rgb_frame = resized_frame.convert("RGB")
         
         try:
             # 使用PyTorch获取像素数据
-            frame_tensor = torch.tensor(np.array(rgba_frame)).to(self.device)
-            
-            # 转换为CPU并获取像素数据
-            frame_np = frame_tensor.cpu().numpy()
-            
-            for y in range(height):
-                row = []
-                for x in range(width):
-                    pixel = tuple(frame_np[y, x])
-                    row.append(pixel)
-                pixel_data.append(row)
+            with stage("pixel_extraction"):
+                frame_tensor = torch.tensor(np.array(rgb_frame)).to(self.device)
+                
+                # 转换为CPU并打包为紧凑帧
+                packed_frame = PackedFrame(frame_tensor.cpu().numpy())
         except Exception as e:
             logger.error(f"PyTorch像素数据提取失败，使用PIL备用方法: {e}")
-            # 备用方法：使用PIL获取像素数据
-            for y in range(height):
-                row = []
-                for x in range(width):
-                    pixel = rgba_frame.getpixel((x, y))
-                    row.append(pixel)
-                pixel_data.append(row)
+            # 备用方法：直接从PIL图片获取像素数据
+            with stage("pixel_extraction"):
+                packed_frame = PackedFrame.from_image(rgb_frame)
         
-        logger.debug(f"帧处理完成，最终尺寸: {width}x{height}")
-        return pixel_data, width, height
+        logger.debug(f"帧处理完成，最终尺寸: {packed_frame.width}x{packed_frame.height}")
+        return packed_frame
     
     def calculate_frame_difference(self, frame1: Image.Image, frame2: Image.Image) -> float:
         """计算两帧之间的差异值"""
@@ -228,124 +121,17 @@ class TorchVideoProcessor:
             mean_diff = np.mean(diff)
             return float(mean_diff)
     
-    def process_video(self, file_path: str, target_fps: float, max_pixels: int, max_frames: Optional[int] = None) -> list[tuple[list[list[tuple]], int, int]]:
-        """完整处理视频，返回处理后的帧序列"""
-        logger.info(f"开始处理视频: {file_path}")
-        
-        try:
-            # 使用生成器版本处理视频
-            processed_frames = list(self.process_video_generator(file_path, target_fps, max_pixels, max_frames))
-            logger.info("视频处理完成")
-            return processed_frames
-        except Exception as e:
-            logger.error(f"视频处理失败: {e}")
-            raise
+    def process_decoded(self, frame: np.ndarray, max_pixels: int) -> PackedFrame:
+        """把解码出的BGR数组转换为PIL图片后处理"""
+        return self.process_frame(self.decode_to_image(frame), max_pixels)
     
-    def process_video_generator(self, file_path: str, target_fps: float, max_pixels: int, max_frames: Optional[int] = None):
-        """使用生成器模式处理视频，逐帧处理，减少内存使用"""
-        import psutil
-        import gc
-        
-        logger.info(f"开始流式处理视频: {file_path}")
-        
-        try:
-            # 加载视频
-            video = self.load_video(file_path)
-            
-            # 获取视频信息
-            video_info = self.get_video_info(video)
-            original_fps = video_info["fps"]
-            total_frames = video_info["total_frames"]
-            
-            # 计算帧间隔
-            frame_interval = int(original_fps / target_fps)
-            logger.info(f"原始帧率: {original_fps:.2f}, 帧间隔: {frame_interval}")
-            
-            current_frame = 0
-            frame_count = 0
-            
-            while True:
-                # 监控内存使用
-                if frame_count % 10 == 0:
-                    memory = psutil.virtual_memory()
-                    logger.debug(f"内存使用: {memory.percent:.1f}%, 已处理帧: {frame_count}")
-                    
-                    # 如果内存使用过高，进行垃圾回收
-                    if memory.percent > 80:
-                        logger.warning(f"内存使用过高: {memory.percent:.1f}%, 执行垃圾回收")
-                        gc.collect()
-                        # 释放GPU内存
-                        if torch.cuda.is_available():
-                            torch.cuda.empty_cache()
-                        memory = psutil.virtual_memory()
-                        logger.info(f"垃圾回收后内存使用: {memory.percent:.1f}%")
-                
-                # 设置当前帧位置
-                video.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-                
-                # 读取帧
-                ret, frame = video.read()
-                if not ret:
-                    break
-                
-                # 转换为PIL Image
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(frame_rgb)
-                
-                # 处理帧
-                logger.info(f"处理第 {frame_count+1} 帧")
-                pixel_data, width, height = self.process_frame(pil_image, max_pixels)
-                
-                # 生成处理结果
-                yield (pixel_data, width, height)
-                
-                # 释放不再使用的帧数据
-                del frame
-                del frame_rgb
-                del pil_image
-                del pixel_data
-                
-                # 每处理几帧后进行一次垃圾回收
-                if frame_count % 5 == 0:
-                    gc.collect()
-                    # 释放GPU内存
-                    if torch.cuda.is_available():
-                        torch.cuda.empty_cache()
-                
-                frame_count += 1
-                current_frame += frame_interval
-                
-                # 检查是否达到最大帧数限制
-                if max_frames and frame_count >= max_frames:
-                    logger.info(f"达到最大帧数限制: {max_frames}")
-                    break
-                
-                # 检查是否超出视频总帧数
-                if current_frame >= total_frames:
-                    break
-            
-            # 释放视频
-            video.release()
-            # 最后进行一次垃圾回收
-            gc.collect()
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            logger.info(f"流式处理完成，共处理 {frame_count} 帧")
-        except Exception as e:
-            logger.error(f"视频处理失败: {e}")
-            # 确保视频被释放
-            video_capture = locals().get('video')
-            if video_capture:
-                try:
-                    video_capture.release()
-                except:
-                    pass
-            # 释放GPU内存
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            raise
+    def release_memory(self):
+        """垃圾回收并释放GPU缓存"""
+        super().release_memory()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
     
-    def process_frames_batch(self, frames: list[Image.Image], max_pixels: int) -> list[tuple[list[list[tuple]], int, int]]:
+    def process_frames_batch(self, frames: list[Image.Image], max_pixels: int) -> list[PackedFrame]:
         """批量处理视频帧，利用GPU并行能力"""
         logger.info(f"开始批量处理 {len(frames)} 帧")
         
@@ -355,16 +141,8 @@ class TorchVideoProcessor:
             # 计算目标尺寸
             target_sizes = []
             for frame in frames:
-                original_width, original_height = frame.size
-                original_pixels = original_width * original_height
-                
-                if original_pixels <= max_pixels:
-                    target_sizes.append((original_height, original_width))
-                else:
-                    scale = math.sqrt(max_pixels / original_pixels)
-                    new_width = max(1, int(original_width * scale))
-                    new_height = max(1, int(original_height * scale))
-                    target_sizes.append((new_height, new_width))
+                new_width, new_height = scaled_size(*frame.size, max_pixels)
+                target_sizes.append((new_height, new_width))
             
             # 找到最大尺寸
             max_height = max(size[0] for size in target_sizes)
@@ -387,11 +165,10 @@ class TorchVideoProcessor:
             # 备用方法：逐帧处理
             processed_frames = []
             for frame in frames:
-                pixel_data, width, height = self.process_frame(frame, max_pixels)
-                processed_frames.append((pixel_data, width, height))
+                processed_frames.append(self.process_frame(frame, max_pixels))
             return processed_frames
     
-    def _process_batch(self, frames: list[Image.Image], target_sizes: list[tuple[int, int]], max_pixels: int) -> list[tuple[list[list[tuple]], int, int]]:
+    def _process_batch(self, frames: list[Image.Image], target_sizes: list[tuple[int, int]], max_pixels: int) -> list[PackedFrame]:
         """处理单个批次的帧"""
         try:
             # 将帧转换为张量
@@ -421,18 +198,7 @@ class TorchVideoProcessor:
             for i, (resized_tensor, (h, w)) in enumerate(zip(resized_tensors, target_sizes)):
                 # 转换为PIL Image
                 resized_tensor = (resized_tensor.permute(1, 2, 0) * 255.0).byte().cpu().numpy()
-                resized_frame = Image.fromarray(resized_tensor).convert("RGBA")
-                
-                # 获取像素数据
-                pixel_data = []
-                for y in range(h):
-                    row = []
-                    for x in range(w):
-                        pixel = resized_frame.getpixel((x, y))
-                        row.append(pixel)
-                    pixel_data.append(row)
-                
-                processed_frames.append((pixel_data, w, h))
+                processed_frames.append(PackedFrame(resized_tensor))
             
             return processed_frames
         except Exception as e:
@@ -440,6 +206,5 @@ class TorchVideoProcessor:
             # 备用方法：逐帧处理
             processed_frames = []
             for frame in frames:
-                pixel_data, width, height = self.process_frame(frame, max_pixels)
-                processed_frames.append((pixel_data, width, height))
+                processed_frames.append(self.process_frame(frame, max_pixels))
             return processed_frames
\ No newline at end of file
@@ -4,290 +4,204 @@ logger = get_logger("视频转ADOFAI")
 
 from typing import Optional
 import json
+import numpy as np
+from common.EventStore import EventStore, resolve_workers
+from common.LevelBuilder import LevelBuilder, check_tile_format, position_track_event, write_level
+from common.Progress import ProgressTracker
+from common.Profiler import stage
 from image_tool.image_processor import ImageProcessor
+from video_tool.dirty_regions import changed_tiles, squared_distance_cutoff
+from video_tool.packed_frame import PackedFrame
+from video_tool.palette import IndexedFrame
+
+# 视频关卡的BPM，每拍180度对应帧间隔的angleOffset
+VIDEO_BPM = 60
 
 class VideoToADOFAI:
-    def __init__(self):
-        """初始化视频转ADOFAI转换器"""
+    def __init__(self, tile_format: str = "angleData", encode_workers: int = 1):
+        """初始化视频转ADOFAI转换器，tile_format决定砖块数据写为angleData还是pathData，encode_workers为保存时的序列化进程数（0表示全部核心）"""
+        check_tile_format(tile_format)
+        self.tile_format = tile_format
+        self.encode_workers = resolve_workers(encode_workers)
         self.image_processor = ImageProcessor()
-        self.angleData = []
         self.actions = []
         self.level_data = {}
+        self.recolortrack_count = 0
+        self.builder: Optional[LevelBuilder] = None
     
-    def generate_angle_data(self, width: int, height: int) -> list[int]:
-        """生成angleData数组"""
-        logger.info(f"生成angleData，总像素数: {width * height}")
-        # 每个像素对应一个0
-        angleData = [0] * (width * height)
-        logger.debug(f"angleData生成完成，长度: {len(angleData)}")
-        return angleData
+    def build_recolortrack_event(self, floor: int, hex_color: str, angle_offset: float) -> dict:
+        """构造单个Recolortrack事件"""
+        return {
+            "floor": 1,
+            "eventType": "RecolorTrack",
+            "startTile": [floor, "Start"],
+            "endTile": [floor, "Start"],
+            "gapLength": 0,
+            "duration": 0,
+            "trackColorType": "Single",
+            "trackColor": hex_color,
+            "secondaryTrackColor": "ffffffff",
+            "trackColorAnimDuration": 2,
+            "trackColorPulse": "None",
+            "trackPulseLength": 10,
+            "trackStyle": "Minimal",
+            "trackGlowIntensity": 100,
+            "eventTag": "",
+            "angleOffset": angle_offset
+        }
     
-    def generate_recolortrack_events(self, frame_index: int, pixel_data: list[list[tuple]], width: int, height: int, fps: float, diff_threshold: float = 10.0, prev_frame_data: Optional[list[list[tuple]]] = None) -> list[dict]:
-        """生成Recolortrack事件"""
-        
-        events = []
-        floor = 1  # 轨道索引从1开始
-        
+    def create_event_store(self) -> EventStore:
+        """创建按列保存Recolortrack和PositionTrack的事件存储"""
+        store = EventStore()
+        store.define("RecolorTrack", self.build_recolortrack_event(0, "000000", 0.0), {
+            "tile": ("int", [("startTile", 0), ("endTile", 0)]),
+            "color": ("color", [("trackColor",)]),
+            "angle_offset": ("float", [("angleOffset",)])})
+        store.define("PositionTrack", position_track_event(0, 0), {
+            "floor": ("int", [("floor",)]),
+            "offset": ("int", [("positionOffset", 0)])})
+        return store
+    
+    def find_changed_tiles(self, frame: PackedFrame, width: int, height: int, diff_threshold: float, prev_frame: Optional[PackedFrame] = None) -> tuple[np.ndarray, np.ndarray]:
+        """与前一帧比较，返回需要重新着色的砖块（从1开始）及其打包颜色，颜色差异小于阈值的跳过"""
+        with stage("diff"):
+            if prev_frame is None:
+                changed = np.arange(width * height)
+                colors = frame.packed().ravel()
+            elif isinstance(frame, IndexedFrame) and isinstance(prev_frame, IndexedFrame) and frame.palette is prev_frame.palette:
+                # 共用调色板的帧直接比较下标，颜色距离查表
+                changed = frame.palette.changed_tiles(frame.indices, prev_frame.indices, squared_distance_cutoff(diff_threshold))
+                colors = frame.packed_at(changed)
+            else:
+                changed = changed_tiles(frame, prev_frame, squared_distance_cutoff(diff_threshold))
+                colors = frame.packed_at(changed)
+        return changed + 1, colors
+    
+    def add_recolortrack_events(self, store: EventStore, frame_index: int, frame: PackedFrame, width: int, height: int, fps: float, diff_threshold: float = 10.0, prev_frame: Optional[PackedFrame] = None) -> int:
+        """把一帧的Recolortrack事件按列追加到事件存储，返回事件数"""
         # 计算当前帧的angleOffset
         angle_offset = frame_index * (180 / fps)
-        logger.debug(f"第 {frame_index+1} 帧的angleOffset: {angle_offset:.2f}")
-        
-        for y in range(height):
-            for x in range(width):
-                pixel = pixel_data[y][x]
-                hex_color = self.image_processor.rgba_to_hex(pixel)
-                
-                # 检查与前一帧的差异
-                if prev_frame_data is not None:
-                    prev_pixel = prev_frame_data[y][x]
-                    prev_hex_color = self.image_processor.rgba_to_hex(prev_pixel)
-                    
-                    # 计算颜色差异
-                    r1, g1, b1, _ = pixel
-                    r2, g2, b2, _ = prev_pixel
-                    color_diff = ((r1-r2)**2 + (g1-g2)**2 + (b1-b2)**2)**0.5
-                    
-                    # 如果差异小于阈值，跳过
-                    if color_diff < diff_threshold:
-                        logger.debug(f"跳过轨道 {floor}，颜色差异较小: {color_diff:.2f}")
-                        floor += 1
-                        continue
-                
-                # 生成Recolortrack事件
-                recolortrack_event = {
-                    "floor": 1,
-                    "eventType": "RecolorTrack",
-                    "startTile": [floor, "Start"],
-                    "endTile": [floor, "Start"],
-                    "gapLength": 0,
-                    "duration": 0,
-                    "trackColorType": "Single",
-                    "trackColor": hex_color,
-                    "secondaryTrackColor": "ffffffff",
-                    "trackColorAnimDuration": 2,
-                    "trackColorPulse": "None",
-                    "trackPulseLength": 10,
-                    "trackStyle": "Minimal",
-                    "trackGlowIntensity": 100,
-                    "eventTag": "",
-                    "angleOffset": angle_offset
-                }
-                
-                events.append(recolortrack_event)
-                logger.debug(f"生成Recolortrack事件，轨道: {floor}，颜色: {hex_color}，angleOffset: {angle_offset:.2f}")
-                
-                floor += 1
-        
-        logger.info(f"第 {frame_index+1} 帧生成完成，共 {len(events)} 个Recolortrack事件")
-        return events
+        tiles, colors = self.find_changed_tiles(frame, width, height, diff_threshold, prev_frame)
+        with stage("event_construction"):
+            store.extend("RecolorTrack", tile=tiles, color=colors, angle_offset=angle_offset)
+        logger.info(f"第 {frame_index+1} 帧生成完成，共 {len(tiles)} 个Recolortrack事件")
+        return len(tiles)
     
-    def generate_level(self, frames: list[tuple[list[list[tuple]], int, int]], fps: float, diff_threshold: float = 10.0) -> dict:
+    def generate_level(self, frames: list[PackedFrame], fps: float, diff_threshold: float = 10.0, progress: Optional[ProgressTracker] = None) -> dict:
         """生成完整的关卡数据"""
         logger.info(f"开始生成完整关卡数据，共 {len(frames)} 帧")
+        if progress is not None:
+            progress.set_total_frames(len(frames))
+            progress.set_phase('generate')
         
         try:
             # 获取第一帧的尺寸
-            first_frame_data, width, height = frames[0]
+            frames = [PackedFrame.coerce(frame) for frame in frames]
+            width, height = frames[0].size
             logger.info(f"使用第一帧的尺寸: {width}x{height}")
             
-            # 生成angleData
-            self.angleData = self.generate_angle_data(width, height)
+            # 砖块数据、设置和MoveTrack由LevelBuilder按画面尺寸生成
+            self.builder = LevelBuilder(width, height, VIDEO_BPM, self.tile_format)
             
-            # 初始化actions数组
-            self.actions = []
+            # 初始化按列保存的事件
+            self.actions = self.create_event_store()
             
             # 在第一个砖块添加MoveTrack事件
-            self.actions.append({
-                "floor": 0,
-                "eventType": "MoveTrack",
-                "startTile": [0, "Start"],
-                "endTile": [0, "End"],
-                "gapLength": 0,
-                "duration": 0,
-                "scale": [100, 179.6407],
-                "angleOffset": 0,
-                "ease": "Linear",
-                "maxVfxOnly": False,
-                "eventTag": ""
-            })
-            
-            # 计算相机设置
-            base_zoom = 5000
-            base_size = 300
-            reference_size = max(width, height)
-            zoom = int(base_zoom * (reference_size / base_size))
-            cmr_position_x = int(width * 0.5)
-            cmr_position_y = int(height * -0.5)
-            
-            logger.info(f"相机设置: zoom={zoom}, position=({cmr_position_x}, {cmr_position_y})")
+            self.actions.add_event(self.builder.move_track_event())
             
             # 处理每一帧
             length = 0
-            prev_frame_data = None
-            for i, (frame_data, frame_width, frame_height) in enumerate(frames):
+            prev_frame = None
+            for i, frame in enumerate(frames):
                 # 确保所有帧尺寸相同
-                if frame_width != width or frame_height != height:
+                if frame.size != (width, height):
                     logger.warning(f"第 {i+1} 帧尺寸与第一帧不同，跳过")
+                    if progress is not None:
+                        progress.add_generated(1, 0)
                     continue
                 
                 # 生成当前帧的Recolortrack事件
-                frame_events = self.generate_recolortrack_events(
-                    i, frame_data, width, height, fps, diff_threshold, prev_frame_data
+                frame_event_count = self.add_recolortrack_events(
+                    self.actions, i, frame, width, height, fps, diff_threshold, prev_frame
                 )
                 
-                # 添加到actions数组
-                self.actions.extend(frame_events)
-                
                 # 更新前一帧数据
-                prev_frame_data = frame_data
+                prev_frame = frame
                 
                 # 更新长度
-                length += len(frame_events)
+                length += frame_event_count
+                if progress is not None:
+                    progress.add_generated(1, frame_event_count)
             
             # 生成PositionTrack事件，用于换行
             logger.info("开始生成PositionTrack事件，用于轨道换行")
-            floor = 1
-            for y in range(height):
-                floor += width  # 移动到当前行的末尾
-                
-                # 最后一行不需要换行
-                if y < height - 1:
-                    # 生成PositionTrack事件
-                    position_action = {
-                        "floor": floor,
-                        "eventType": "PositionTrack",
-                        "positionOffset": [-width, -1],
-                        "relativeTo": [0, "ThisTile"],
-                        "justThisTile": False,
-                        "editorOnly": False
-                    }
-                    self.actions.append(position_action)
-                    logger.debug(f"生成PositionTrack事件，砖块: {floor}，偏移量: [-{width}, -1]")
-            
+            with stage("event_construction"):
+                floors = 1 + width * np.arange(1, height, dtype=np.int64)
+                self.actions.extend("PositionTrack", floor=floors, offset=-width)
             logger.info(f"PositionTrack事件生成完成，共生成 {height-1 if height > 0 else 0} 个事件")
             
-            # 生成基础关卡数据结构
-            self.level_data = {
-                "angleData": self.angleData,
-                "settings": {
-                    "version": 15,
-                    "artist": "",
-                    "specialArtistType": "None",
-                    "artistPermission": "",
-                    "song": "",
-                    "author": "",
-                    "separateCountdownTime": True,
-                    "previewImage": "",
-                    "previewIcon": "",
-                    "previewIconColor": "003f52",
-                    "previewSongStart": 0,
-                    "previewSongDuration": 10,
-                    "seizureWarning": False,
-                    "levelDesc": "",
-                    "levelTags": "",
-                    "artistLinks": "",
-                    "speedTrialAim": 0,
-                    "difficulty": 1,
-                    "requiredMods": [],
-                    "songFilename": "",
-                    "bpm": 60,  # 设置BPM为60
-                    "volume": 100,
-                    "offset": 0,
-                    "pitch": 100,
-                    "hitsound": "Kick",
-                    "hitsoundVolume": 100,
-                    "countdownTicks": 4,
-                    "songURL": "",
-                    "tileShape": "Long",
-                    "trackColorType": "Single",
-                    "trackColor": "debb7b",
-                    "secondaryTrackColor": "ffffff",
-                    "trackColorAnimDuration": 2,
-                    "trackColorPulse": "None",
-                    "trackPulseLength": 10,
-                    "trackStyle": "Standard",
-                    "trackTexture": "",
-                    "trackTextureScale": 1,
-                    "trackGlowIntensity": 100,
-                    "trackAnimation": "None",
-                    "beatsAhead": 3,
-                    "trackDisappearAnimation": "None",
-                    "beatsBehind": 4,
-                    "backgroundColor": "000000",
-                    "showDefaultBGIfNoImage": True,
-                    "showDefaultBGTile": True,
-                    "defaultBGTileColor": "101121",
-                    "defaultBGShapeType": "Default",
-                    "defaultBGShapeColor": "ffffff",
-                    "bgImage": "",
-                    "bgImageColor": "ffffff",
-                    "parallax": [100, 100],
-                    "bgDisplayMode": "FitToScreen",
-                    "imageSmoothing": True,
-                    "lockRot": False,
-                    "loopBG": False,
-                    "scalingRatio": 100,
-                    "relativeTo": "Tile",
-                    "position": [cmr_position_x, cmr_position_y],
-                    "rotation": 0,
-                    "zoom": zoom,
-                    "pulseOnFloor": True,
-                    "startCamLowVFX": False,
-                    "bgVideo": "",
-                    "loopVideo": False,
-                    "vidOffset": 0,
-                    "floorIconOutlines": False,
-                    "stickToFloors": True,
-                    "planetEase": "Linear",
-                    "planetEaseParts": 1,
-                    "planetEasePartBehavior": "Mirror",
-                    "customClass": "",
-                    "defaultTextColor": "ffffff",
-                    "defaultTextShadowColor": "00000050",
-                    "congratsText": "",
-                    "perfectText": "",
-                    "legacyFlash": False,
-                    "legacyCamRelativeTo": False,
-                    "legacySpriteTiles": False,
-                    "legacyTween": False,
-                    "disableV15Features": False
-                },
-                "actions": self.actions,
-                "decorations": []
-            }
+            self.level_data = self.builder.build(self.actions)
             
             logger.info("关卡数据生成完成")
-            logger.info(f"总砖块数: {len(self.angleData)}")
+            logger.info(f"总砖块数: {width * height}")
             logger.info(f"总事件数: {len(self.actions)}")
             logger.info(f"总recolortrack事件数量: {length}")
+            logger.info(f"事件存储占用: {self.actions.nbytes} 字节")
+            self.recolortrack_count = length
 
             return self.level_data
         except Exception as e:
             logger.error(f"生成关卡数据失败: {e}")
             raise
     
-    def save_level(self, level_data: dict, file_path: str):
+    def estimate_level_bytes(self, level_data: dict) -> int:
+        """抽样序列化部分数组元素，估算关卡文件的总字节数"""
+        total = 0
+        small_parts = {}
+        for key, value in level_data.items():
+            if isinstance(value, EventStore):
+                # 事件存储按每种事件的抽样文本估算，键和括号按空数组计入
+                total += value.estimate_text_bytes(2)
+                small_parts[key] = []
+            elif isinstance(value, list) and len(value) > 100:
+                # 均匀抽取约100个元素，按平均大小外推
+                sample = value[::len(value) // 100]
+                sample_bytes = len(json.dumps({key: sample}, indent=2, ensure_ascii=False).encode('utf-8'))
+                total += int(sample_bytes / len(sample) * len(value))
+            else:
+                small_parts[key] = value
+        total += len(json.dumps(small_parts, indent=2, ensure_ascii=False).encode('utf-8'))
+        return total
+    
+    def save_level(self, level_data: dict, file_path: str, progress: Optional[ProgressTracker] = None):
         """保存关卡到文件"""
         logger.info(f"保存关卡到文件: {file_path}")
+        if progress is not None:
+            progress.set_total_bytes(self.estimate_level_bytes(level_data))
+            progress.set_phase('save')
         
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(level_data, f, indent=2, ensure_ascii=False)
+            # 本对象生成的关卡直接使用预先序列化的设置
+            settings_text = None
+            if self.builder is not None and level_data is self.level_data and level_data.get("settings") == self.builder.settings():
+                settings_text = self.builder.settings_text()
+            write_level(file_path, level_data, progress, settings_text, self.encode_workers)
             logger.info("关卡保存成功")
         except Exception as e:
             logger.error(f"关卡保存失败: {e}")
             raise
     
-    def convert(self, frames: list[tuple[list[list[tuple]], int, int]], fps: float, output_path: str, diff_threshold: float = 10.0):
+    def convert(self, frames: list[PackedFrame], fps: float, output_path: str, diff_threshold: float = 10.0, progress: Optional[ProgressTracker] = None):
         """执行转换过程"""
         logger.info("开始执行视频到ADOFAI的转换")
         
         try:
             # 生成关卡数据
-            level_data = self.generate_level(frames, fps, diff_threshold)
+            with stage("generate_level"):
+                level_data = self.generate_level(frames, fps, diff_threshold, progress)
             
             # 保存关卡文件
-            self.save_level(level_data, output_path)
+            self.save_level(level_data, output_path, progress)
             
             logger.info("转换完成！")
             return True